@@ -0,0 +1,32 @@
+#! /usr/bin/env python
+"""
+Cut a few perspective views and a panorama from a fisheye camera feed, panning
+the left view back and forth
+"""
+
+import cv2 as cv
+from rakali import VideoStream
+from rakali.camera.views import EquirectangularView, PerspectiveView, ViewEngine
+from rakali.video import go
+
+stream = VideoStream(src=0)
+
+with stream:
+    ok, frame = stream.read()
+    h, w = frame.shape[:2]
+    engine = ViewEngine.from_file("fisheye_calibration.json", frame_size=(w, h))
+    engine.add(PerspectiveView("front", size=(640, 480), fov=90))
+    engine.add(PerspectiveView("left", size=(640, 480), yaw=-60, fov=60))
+    engine.add(EquirectangularView("panorama", size=(1280, 360), fov=180, vfov=60))
+
+    count = 0
+    with engine:
+        while go():
+            ok, frame = stream.read()
+            if ok:
+                count += 1
+                # only the left view map is rebuilt
+                if count % 10 == 0:
+                    engine.update("left", yaw=-60 + (count // 10) % 30)
+                for name, view in engine.render(frame).items():
+                    cv.imshow(name, view)
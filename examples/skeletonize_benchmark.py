@@ -0,0 +1,25 @@
+#! /usr/bin/env python
+"""
+Time the skeleton methods on the bundled test images and on large synthetic
+images of thick lines and discs
+"""
+
+from rakali.skeleton import benchmark, synthetic_shapes
+from rakali.testimages import orb_spider, rakali
+from tabulate import tabulate
+
+images = {
+    "rakali.jpg": rakali.grey().mat,
+    "orb-spider.jpg": orb_spider.grey().mat,
+    "synthetic 2000x2000": synthetic_shapes((2000, 2000), shapes=100),
+    "synthetic 4000x4000": synthetic_shapes((4000, 4000), shapes=400),
+}
+
+results = benchmark(images)
+print(
+    tabulate(
+        [[r["image"], r["size"], r["method"], r["cost"], r["pixels"]] for r in results],
+        headers=["image", "size", "method", "seconds", "skeleton pixels"],
+        floatfmt=".3f",
+    )
+)
@@ -1,12 +1,19 @@
 """
 This module provides some common helper functions to write on top of a image
+
+Anti-aliased text is slow to draw and most labels read the same on every
+frame. Labels are therefore rendered once into alpha masks, sprites, that
+later frames only blend in.
 """
 
-import cpuinfo
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
 import cv2 as cv
-import GPUtil
+import numpy as np
 
-from . import colors
+from . import colors, stats
 
 DEFAULT_POSITION = (10, 30)
 FONT = cv.FONT_HERSHEY_SIMPLEX
@@ -16,10 +23,9 @@ COLOR = colors.get("BLACK")
 
 
 def GPU_label():
-    """GPU label"""
-    GPUs = GPUtil.getGPUs()
+    """GPU label, from the latest snapshot of the background stats sampler"""
     labels = []
-    for i, GPU in enumerate(GPUs):
+    for i, GPU in enumerate(stats.default_sampler().snapshot.gpus):
         labels.append(f"GPU{i}: {GPU.name}")
         labels.append(f"Load: {GPU.load:.2f}")
         labels.append(f"Temp: {GPU.temperature}")
@@ -28,12 +34,128 @@ def GPU_label():
 
 
 def CPU_label():
-    """CPU label"""
-    cpui = cpuinfo.get_cpu_info()
-    cpu_label = f'CPU: {cpui["brand"]}, {cpui["hz_actual"]}, {cpui["arch"]}'
+    """CPU label, looked up once in the background"""
+    cpui = stats.cpu_info(wait=False)
+    if not cpui:
+        return "CPU: unknown"
+    hz = cpui.get("hz_advertised_friendly", cpui.get("hz_actual"))
+    cpu_label = f'CPU: {stats.cpu_brand()}, {hz}, {cpui["arch"]}'
     return cpu_label
 
 
+class Sprite:
+    """a label rendered once, to blend in with its top left at offset from org"""
+
+    def __init__(self, text, font, font_scale, thickness, color, channels):
+        (w, h), baseline = cv.getTextSize(text, font, font_scale, thickness)
+        pad = thickness + 2
+        mask = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+        org = (pad, pad + h)
+        cv.putText(mask, text, org, font, font_scale, 255, thickness, cv.LINE_AA)
+        # only the part with ink in it
+        x, y, w, h = cv.boundingRect(mask)
+        self.offset = (x - org[0], y - org[1])
+        self.alpha = mask[y : y + h, x : x + w].astype(np.float32) / 255
+        self.inverse = 1 - self.alpha
+        shape = (h, w, channels) if channels > 1 else (h, w)
+        self.color = np.empty(shape, dtype=np.uint8)
+        self.color[...] = color[:channels]
+
+    def blend(self, frame, org):
+        """blend the label in at org, where it falls on the frame"""
+
+        h, w = self.alpha.shape
+        x, y = org[0] + self.offset[0], org[1] + self.offset[1]
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+        if right <= left or bottom <= top:
+            return
+        roi = frame[top:bottom, left:right]
+        cut = slice(top - y, bottom - y), slice(left - x, right - x)
+        roi[...] = cv.blendLinear(
+            roi, self.color[cut], self.inverse[cut], self.alpha[cut]
+        )
+
+    @property
+    def nbytes(self):
+        return self.alpha.nbytes + self.inverse.nbytes + self.color.nbytes
+
+
+class LabelSprites:
+    """
+    Sprites of labels by text and style, the least recently used dropped past
+    max_sprites. A label becomes a sprite the second time it is drawn, text
+    that changes on every frame, like a frame rate, is drawn directly.
+    """
+
+    def __init__(self, max_sprites=1024):
+        self.max_sprites = max_sprites
+        self.hits = 0
+        self.misses = 0
+        self._sprites: "OrderedDict[tuple, Sprite]" = OrderedDict()
+        self._seen: "OrderedDict[tuple, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def draw(self, frame, text, org, font, font_scale, color, thickness):
+        """put text on frame at org, as cv.putText with anti-aliasing"""
+
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+        color = tuple(color) if np.iterable(color) else (color,)
+        color = (color + (0,) * 4)[:channels]
+        key = (text, font, font_scale, thickness, color)
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                seen = key in self._seen
+                self._remember(self._seen, key, None)
+        if sprite is None and not seen:
+            cv.putText(frame, text, org, font, font_scale, color, thickness, cv.LINE_AA)
+            return
+        if sprite is None:
+            sprite = Sprite(text, font, font_scale, thickness, color, channels)
+            with self._lock:
+                self._remember(self._sprites, key, sprite)
+        sprite.blend(frame, org)
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_sprites:
+            cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._sprites.clear()
+            self._seen.clear()
+
+    @property
+    def nbytes(self):
+        return sum(sprite.nbytes for sprite in self._sprites.values())
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def __repr__(self):
+        return (
+            f"LabelSprites(sprites={len(self)}, KiB={self.nbytes / 2 ** 10:.1f}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+
+# shared by every caller of add_frame_labels
+SPRITES = LabelSprites()
+
+
+@lru_cache(maxsize=64)
+def _line_height(font, font_scale, thickness, line_space):
+    text_size, _ = cv.getTextSize("sample text", font, font_scale, thickness)
+    return text_size[1] + line_space
+
+
 def add_frame_labels(
     frame,
     position=DEFAULT_POSITION,
@@ -43,18 +165,28 @@ def add_frame_labels(
     thickness=THICKNESS,
     color=colors.get("BHP"),
     labels=[],
+    out=None,
+    sprites=SPRITES,
 ):
     """
-    Write each label on the image beginning at position being top left
+    Write each label on the image beginning at position being top left. When
+    `out` is given the frame is copied into it and labeled there, leaving the
+    frame as it was without allocating a copy. Labels are blended in from
+    `sprites`, or drawn afresh every time when that is None.
     """
 
-    text_size, _ = cv.getTextSize("sample text", font, font_scale, thickness)
-    line_height = text_size[1] + line_space
-    line_type = cv.LINE_AA
+    if out is not None:
+        np.copyto(out, frame)
+        frame = out
+
+    line_height = _line_height(font, font_scale, thickness, line_space)
 
     x, y0 = position
     for i, line in enumerate(labels):
         y = y0 + i * line_height
+        if sprites is not None:
+            sprites.draw(frame, line, (x, y), font, font_scale, color, thickness)
+            continue
         cv.putText(
             img=frame,
             text=line,
@@ -63,7 +195,7 @@ def add_frame_labels(
             fontScale=font_scale,
             color=color,
             thickness=thickness,
-            lineType=line_type,
+            lineType=cv.LINE_AA,
         )
 
     return frame
@@ -0,0 +1,229 @@
+"""
+Run a chain of image operations over a folder tree.
+
+Images are spread over a pool of processes in chunks. Each process reads the
+next image of its chunk while working on the current one and writes results
+in the background, so disk and CPU are kept busy together. Results are
+written aside and renamed into place, an image whose result is newer than it
+is skipped, so an interrupted run picks up where it left off. Changing the
+operations makes all earlier results out of date.
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+import cv2 as cv
+
+from .img import Image
+from .skeleton import METHODS
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+# records the operations the results in an output folder were made with
+MANIFEST = ".rakali-batch.json"
+
+
+def _skeleton_method(method: str) -> str:
+    """method checked to be one of skeleton.METHODS"""
+    if method not in METHODS:
+        raise ValueError(
+            f"Unknown skeleton method {method}, use one of {', '.join(METHODS)}"
+        )
+    return method
+
+
+# operation name: (Image method, argument name, argument type)
+OPERATIONS = {
+    "resize": ("resize", "width", int),
+    "scale": ("scale", "factor", float),
+    "grey": ("grey", None, None),
+    "skeletonize": ("skeletonize", "method", _skeleton_method),
+    "rotate": ("rotate", "angle", float),
+    "rotate-bounded": ("rotate_bounded", "angle", float),
+    "canny": ("auto_canny", "sigma", float),
+}
+
+
+def parse_operation(operation: str) -> Tuple[str, dict]:
+    """method and arguments of an operation written as name or name=value"""
+
+    name, _, value = operation.partition("=")
+    if name not in OPERATIONS:
+        raise ValueError(
+            f"Unknown operation {name}, use one of {', '.join(OPERATIONS)}"
+        )
+    method, argument, kind = OPERATIONS[name]
+    if not value:
+        return method, {}
+    if argument is None:
+        raise ValueError(f"Operation {name} takes no value")
+    return method, {argument: kind(value)}
+
+
+def apply(mat, chain):
+    """run a parsed chain of operations on an image"""
+
+    img = Image(mat, lazy=True)
+    for method, arguments in chain:
+        getattr(img, method)(**arguments)
+    return img.mat
+
+
+def images(source: Path):
+    """image files under source, in a stable order"""
+
+    for folder, folders, files in os.walk(source):
+        folders.sort()
+        for name in sorted(files):
+            if Path(name).suffix.lower() in IMAGE_SUFFIXES:
+                yield Path(folder) / name
+
+
+def up_to_date(source: Path, output: Path, since=0.0) -> bool:
+    """output is newer than its source and than `since`"""
+    try:
+        made = output.stat().st_mtime
+        return made >= since and made >= source.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _write(path: Path, mat):
+    # written aside and renamed, so a result is either complete or missing
+    partial = path.with_name(f".{path.stem}.partial{path.suffix}")
+    if not cv.imwrite(str(partial), mat):
+        raise OSError(f"Could not write {path}")
+    os.replace(partial, path)
+
+
+def process_chunk(pairs: List[Tuple[Path, Path]], chain) -> Tuple[int, int]:
+    """
+    process (source, output) pairs, reading the next source while the current
+    one is processed, returns the number of images done and failed
+    """
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=2) as io:
+        writes = []
+        reading = io.submit(cv.imread, str(pairs[0][0]))
+        for i, (source, output) in enumerate(pairs):
+            try:
+                mat = reading.result()
+            except Exception as e:
+                logger.debug(f"Reading {source} failed: {e}")
+                mat = None
+            if i + 1 < len(pairs):
+                reading = io.submit(cv.imread, str(pairs[i + 1][0]))
+            if mat is None:
+                logger.warning(f"Cannot read {source}")
+                failed += 1
+                continue
+            # one bad image or value must not end a run of thousands
+            try:
+                result = apply(mat, chain)
+                output.parent.mkdir(parents=True, exist_ok=True)
+            except Exception as e:
+                logger.warning(f"Cannot process {source}: {e}")
+                failed += 1
+                continue
+            writes.append(io.submit(_write, output, result))
+        for write in writes:
+            try:
+                write.result()
+                done += 1
+            except Exception as e:
+                logger.warning(str(e))
+                failed += 1
+    return done, failed
+
+
+class Batch:
+    """a chain of operations to run over every image under a source folder"""
+
+    def __init__(self, source, output, operations, jobs=None, chunk_size=16):
+        self.source = Path(source)
+        self.output = Path(output)
+        self.operations = list(operations)
+        self.chain = [parse_operation(o) for o in self.operations]
+        self.jobs = jobs or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.done = self.failed = self.skipped = 0
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        """images per second"""
+        return self.done / self.seconds if self.seconds else 0.0
+
+    def _manifest(self, force):
+        """
+        the operations and the time since which results were made with them,
+        starting afresh when the operations changed
+        """
+
+        path = self.output / MANIFEST
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+            if not force and manifest.get("operations") == self.operations:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        # whole seconds, some file systems keep no finer modification times
+        manifest = {"operations": self.operations, "since": int(time.time())}
+        self.output.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        return manifest
+
+    def pending(self, force=False) -> List[Tuple[Path, Path]]:
+        """(source, output) pairs that need doing"""
+
+        since = self._manifest(force)["since"]
+        results = self.output.resolve()
+        pairs = []
+        for source in images(self.source):
+            if results in source.resolve().parents:
+                continue
+            output = self.output / source.relative_to(self.source)
+            if up_to_date(source, output, since):
+                self.skipped += 1
+            else:
+                pairs.append((source, output))
+        return pairs
+
+    def run(self, pairs=None, force=False, progress=None):
+        """
+        process the given or else all pending (source, output) pairs, calling
+        progress with the number of images finished by every completed chunk
+        """
+
+        if pairs is None:
+            pairs = self.pending(force)
+        chunks = [
+            pairs[i : i + self.chunk_size]
+            for i in range(0, len(pairs), self.chunk_size)
+        ]
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            for done, failed in pool.map(
+                process_chunk, chunks, [self.chain] * len(chunks)
+            ):
+                self.done += done
+                self.failed += failed
+                if progress is not None:
+                    progress(done + failed)
+        self.seconds = time.perf_counter() - start
+        return self
+
+    def __repr__(self):
+        return (
+            f"Batch({self.source} -> {self.output}, {self.operations}, "
+            f"done={self.done}, skipped={self.skipped}, failed={self.failed})"
+        )
@@ -0,0 +1,76 @@
+"""
+Recycled image buffers.
+
+A chain of operations run on every frame of a video allocates a few frame
+sized arrays per frame. A BufferPool hands out arrays by shape and type and
+takes them back once they are no longer needed, so a loop doing the same work
+on every frame stops allocating after the first one.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class BufferPool:
+    """
+    Arrays by shape and dtype. Only arrays the pool handed out are taken back,
+    anything else given to `put`, like a frame from a video reader, is left
+    alone, so it is safe to offer every array that is done with.
+    """
+
+    def __init__(self):
+        self._free: Dict[Tuple, List[np.ndarray]] = defaultdict(list)
+        # everything handed out, by id, kept alive so ids are not reused
+        self._arrays: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.allocations = 0
+
+    def get(self, shape, dtype=np.uint8) -> np.ndarray:
+        """an array of shape and dtype, recycled when one is free"""
+
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                return free.pop()
+            array = np.empty(shape, dtype=dtype)
+            self._arrays[id(array)] = array
+            self.allocations += 1
+            return array
+
+    def get_like(self, array) -> np.ndarray:
+        return self.get(array.shape, array.dtype)
+
+    def put(self, array):
+        """take back an array handed out by get, ignoring any other"""
+
+        if array is None:
+            return
+        with self._lock:
+            if self._arrays.get(id(array)) is not array:
+                return
+            free = self._free[(array.shape, array.dtype.str)]
+            if not any(a is array for a in free):
+                free.append(array)
+
+    def clear(self):
+        """forget all arrays"""
+        with self._lock:
+            self._free.clear()
+            self._arrays.clear()
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self._arrays.values())
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def __repr__(self):
+        return (
+            f"BufferPool(arrays={len(self)}, MiB={self.nbytes / 2 ** 20:.1f}, "
+            f"allocations={self.allocations})"
+        )
@@ -11,6 +11,7 @@ from typing import List, Optional, Tuple
 import cv2 as cv
 import numpy as np
 
+from ..frame import Frame, grey
 from ..video import cost
 from .save import NumpyEncoder
 
@@ -54,8 +55,8 @@ class ChessboardFinder:
         return corners
 
     def corners(self, frame, fast=True):
-        """Get the corners for calibration"""
-        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        """Get the corners for calibration, in an array or a Frame"""
+        gray = grey(frame)
         ret, corners = self.get_chessboard_corners(gray, fast=fast)
         if ret:
             return ret, self.refine_corners(gray=gray, corners=corners)
@@ -65,12 +66,15 @@ class ChessboardFinder:
     @cost
     def has_chessboard(self, frame):
         """boolean test for chessboard pressense in frame"""
-        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        gray = grey(frame)
         ret, _ = self.get_chessboard_corners(gray=gray)
         return ret
 
     def draw(self, frame, corners):
         """Draw the chessboard corners"""
+        if isinstance(frame, Frame):
+            with frame.edit() as mat:
+                return cv.drawChessboardCorners(mat, self.size, corners, True)
         return cv.drawChessboardCorners(frame, self.size, corners, True)
 
 
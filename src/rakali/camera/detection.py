@@ -0,0 +1,250 @@
+"""
+Time budgeted chessboard detection running in worker processes.
+
+findChessboardCorners can take seconds on cluttered frames or partial boards,
+which stalls a live loop. The detection service hands frames to worker
+processes, abandons frames that went stale while the workers were busy and
+kills workers that overrun the per-frame budget, so the caller always has the
+most recent completed result at hand without waiting on it.
+"""
+
+import logging
+import time
+from multiprocessing import Pipe, Process
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .chessboard import ChessboardFinder
+
+logger = logging.getLogger(__name__)
+
+
+def _detect(connection, chessboard_size, fast):
+    """worker process loop, detect chessboards in frames until told to stop"""
+
+    finder = ChessboardFinder(chessboard_size)
+    while True:
+        job = connection.recv()
+        if job is None:
+            break
+        frame_id, frame = job
+        start = time.perf_counter()
+        ok, corners = finder.corners(frame, fast=fast)
+        connection.send((frame_id, ok, corners, time.perf_counter() - start))
+    connection.close()
+
+
+class DetectionResult:
+    """outcome of a chessboard detection on a single frame"""
+
+    def __init__(
+        self,
+        frame_id: int,
+        found: bool,
+        frame=None,
+        corners=None,
+        latency: float = 0.0,
+        cost: float = 0.0,
+        timed_out: bool = False,
+    ):
+        self.frame_id = frame_id
+        self.found = found
+        self.frame = frame
+        self.corners = corners
+        # time from submission to result, and time spend in findChessboardCorners
+        self.latency = latency
+        self.cost = cost
+        self.timed_out = timed_out
+
+    def __repr__(self):
+        return (
+            f"DetectionResult(frame_id={self.frame_id}, found={self.found}, "
+            f"latency={self.latency:.3f}, timed_out={self.timed_out})"
+        )
+
+
+class _Worker:
+    """a detection process and the pipe used to talk to it"""
+
+    def __init__(self, name, chessboard_size, fast):
+        self.name = name
+        self.connection, child = Pipe()
+        self.process = Process(
+            target=_detect,
+            args=(child, chessboard_size, fast),
+            name=name,
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.frame_id: Optional[int] = None
+        self.started = 0.0
+
+    @property
+    def busy(self):
+        return self.frame_id is not None
+
+    def send(self, frame_id, frame):
+        self.frame_id = frame_id
+        self.started = time.perf_counter()
+        self.connection.send((frame_id, frame))
+
+    def kill(self):
+        """stop the worker, ungracefully if it is stuck on a frame"""
+        if self.busy:
+            self.process.terminate()
+        else:
+            try:
+                self.connection.send(None)
+            except (BrokenPipeError, OSError):
+                self.process.terminate()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+
+class ChessboardDetectionService:
+    """
+    Detect chessboards in a live stream without blocking the display loop.
+
+    Submit every frame, the service only ever works on the latest one. Poll for
+    the most recent completed result. A worker that exceeds `budget` seconds on
+    a frame is terminated and replaced, and the frame is reported as timed out.
+    """
+
+    def __init__(
+        self,
+        chessboard_size=(6, 9),
+        workers: int = 2,
+        budget: float = 0.5,
+        fast: bool = True,
+    ):
+        self.size = chessboard_size
+        self.budget = budget
+        self.fast = fast
+        self.worker_count = max(1, workers)
+        self.workers: List[_Worker] = []
+
+        self._frame_id = 0
+        self._pending = None
+        self._submitted: Dict[int, Tuple[float, np.ndarray]] = {}
+        self._result: Optional[DetectionResult] = None
+
+        self.completed = 0
+        self.timeouts = 0
+        self.abandoned = 0
+        self.latencies: List[float] = []
+
+    def start(self):
+        """start the worker processes"""
+        self.workers = [self._spawn(i) for i in range(self.worker_count)]
+        return self
+
+    def stop(self):
+        """stop the worker processes"""
+        for worker in self.workers:
+            worker.kill()
+        self.workers = []
+
+    def _spawn(self, i):
+        return _Worker(
+            name=f"ChessboardDetector #{i}",
+            chessboard_size=self.size,
+            fast=self.fast,
+        )
+
+    def submit(self, frame) -> int:
+        """offer a frame for detection, returns the id given to the frame"""
+
+        self._frame_id += 1
+        if self._pending is not None:
+            # never got a worker before a newer frame showed up
+            self.abandoned += 1
+            self._submitted.pop(self._pending[0], None)
+        self._pending = (self._frame_id, frame)
+        self._submitted[self._frame_id] = (time.perf_counter(), frame)
+        self.poll()
+        return self._frame_id
+
+    def poll(self) -> Optional[DetectionResult]:
+        """collect finished work, enforce the budget and hand out pending frames"""
+
+        now = time.perf_counter()
+        for i, worker in enumerate(self.workers):
+            if worker.busy and worker.connection.poll():
+                try:
+                    frame_id, ok, corners, cost = worker.connection.recv()
+                except (EOFError, OSError):
+                    logger.warning(f"{worker.name} died, restarting")
+                    self._submitted.pop(worker.frame_id, None)
+                    self._replace(i)
+                    continue
+                worker.frame_id = None
+                submitted, frame = self._submitted.pop(frame_id)
+                self._complete(
+                    DetectionResult(
+                        frame_id=frame_id,
+                        found=ok,
+                        frame=frame,
+                        corners=corners,
+                        latency=now - submitted,
+                        cost=cost,
+                    )
+                )
+            elif worker.busy and now - worker.started > self.budget:
+                frame_id = worker.frame_id
+                logger.debug(f"{worker.name} exceeded budget on frame {frame_id}")
+                self.timeouts += 1
+                self._replace(i)
+                submitted, frame = self._submitted.pop(frame_id)
+                self._complete(
+                    DetectionResult(
+                        frame_id=frame_id,
+                        found=False,
+                        frame=frame,
+                        latency=now - submitted,
+                        cost=self.budget,
+                        timed_out=True,
+                    )
+                )
+
+        if self._pending is not None:
+            for worker in self.workers:
+                if not worker.busy:
+                    worker.send(*self._pending)
+                    self._pending = None
+                    break
+
+        return self._result
+
+    def _replace(self, i):
+        self.workers[i].kill()
+        self.workers[i] = self._spawn(i)
+
+    def _complete(self, result: DetectionResult):
+        self.completed += 1
+        self.latencies.append(result.latency)
+        del self.latencies[:-100]
+        # results can arrive out of order from different workers, keep the newest
+        if self._result is None or result.frame_id > self._result.frame_id:
+            self._result = result
+
+    @property
+    def result(self) -> Optional[DetectionResult]:
+        """the most recent completed result"""
+        return self._result
+
+    def mean_latency(self):
+        """mean detection latency over the last 100 frames"""
+        if self.latencies:
+            return sum(self.latencies) / len(self.latencies)
+        else:
+            return 0.0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
@@ -5,13 +5,19 @@ import logging
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 import cv2 as cv
 import numpy as np
 from rakali.video.fps import cost
 
+from . import maps
+from .map_cache import LRUMapCache, MapCache, default_cache
+from .map_registry import default_registry
+from .points import PointLookup, as_points, to_normalized
+from .reprojection import ReprojectionErrors, evaluate_fisheye
 from .save import NumpyEncoder
+from .sparse_maps import SparseMap
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +28,11 @@ CALIBRATE_FLAGS = (
     + cv.fisheye.CALIB_FIX_SKEW
 )
 
+# balance and fov scale steps around the current values that are built ahead
+# of time while they are being changed
+BALANCE_STEPS = (0.01, 0.02, 0.05)
+FOV_STEPS = (0.05, 0.1)
+
 
 def calibrate(object_points, image_points, image_size):
     """Calibrate the camera using image points"""
@@ -50,6 +61,21 @@ def calibrate(object_points, image_points, image_size):
     return ret, Kn, Dn, rvecsn, tvecsn
 
 
+def reprojection_errors(
+    object_points, image_points, rvecs, tvecs, K, D
+) -> ReprojectionErrors:
+    """Per corner, per view and overall reprojection errors of all views"""
+
+    return evaluate_fisheye(
+        object_points=object_points,
+        image_points=image_points,
+        rvecs=rvecs,
+        tvecs=tvecs,
+        K=K,
+        D=D,
+    )
+
+
 def save_calibration(
     calibration_file: str,
     K,
@@ -117,10 +143,92 @@ def get_maps(
     dim2=None,
     dim3=None,
     fov_scale=1,
+    cache: Optional[MapCache] = None,
+    crop=None,
+    output_size=None,
+    scale: float = 1.0,
+    map_type: str = "fixed",
 ):
-    """calculate fish-eye reprojection maps"""
+    """
+    calculate fish-eye reprojection maps in one of the maps.MAP_TYPES formats,
+    or load them from cache.
+
+    By default the maps produce the full dim3 sized corrected image. Given a
+    `crop` rectangle (x, y, w, h) in that image and an `output_size` (w, h), or
+    a `scale` of the crop, the maps produce only the crop at the output size
+    so no remap work is spent on pixels that would be cropped or scaled away.
+    """
 
     dim1 = img.shape[:2][::-1]
+    scaled_K, P, output_size = projection(
+        dim1=dim1,
+        image_size=image_size,
+        K=K,
+        D=D,
+        R=R,
+        balance=balance,
+        dim2=dim2,
+        dim3=dim3,
+        fov_scale=fov_scale,
+        crop=crop,
+        output_size=output_size,
+        scale=scale,
+    )
+    if R is None:
+        R = np.eye(3)
+
+    def compute():
+        # the fisheye model only builds fixed or float maps, float2 is
+        # converted from float
+        m1type = maps.map_type("float" if map_type == "float2" else map_type)
+        map1, map2 = cv.fisheye.initUndistortRectifyMap(
+            K=scaled_K,
+            D=D,
+            R=R,
+            P=P,
+            size=output_size,
+            m1type=m1type,
+        )
+        return maps.convert_maps(map1, map2, map_type)
+
+    if cache is None:
+        return compute()
+    return cache.get(
+        compute,
+        K=scaled_K,
+        D=np.asarray(D),
+        R=np.asarray(R),
+        balance=float(balance),
+        fov_scale=float(fov_scale),
+        image_size=tuple(image_size),
+        dim1=tuple(dim1),
+        dim2=tuple(dim2 or dim1),
+        dim3=tuple(dim3 or dim1),
+        crop=tuple(crop or ()),
+        output_size=output_size,
+        map_type=map_type,
+    )
+
+
+def projection(
+    dim1,
+    image_size,
+    K,
+    D,
+    R=None,
+    balance: float = 0.5,
+    dim2=None,
+    dim3=None,
+    fov_scale=1,
+    crop=None,
+    output_size=None,
+    scale: float = 1.0,
+):
+    """
+    K scaled to frames of size dim1, the projection matrix of the corrected
+    frames and their size, as used by get_maps
+    """
+
     assert (
         dim1[0] / dim1[1] == image_size[0] / image_size[1]
     ), "Image to undistort needs to have same aspect ratio as the ones used in calibration"
@@ -136,6 +244,11 @@ def get_maps(
     if R is None:
         R = np.eye(3)
 
+    if not crop:
+        crop = (0, 0, *dim3)
+    if not output_size:
+        output_size = (round(crop[2] * scale), round(crop[3] * scale))
+
     # use scaled_K, dim2 and balance to determine the final K used to un-distort image
     new_K = cv.fisheye.estimateNewCameraMatrixForUndistortRectify(
         K=scaled_K,
@@ -145,30 +258,34 @@ def get_maps(
         balance=balance,
         fov_scale=fov_scale,
     )
-    map1, map2 = cv.fisheye.initUndistortRectifyMap(
-        K=scaled_K,
-        D=D,
-        R=R,
-        P=new_K,
-        size=dim3,
-        m1type=cv.CV_16SC2,
+    return scaled_K, output_matrix(new_K, crop, output_size), tuple(output_size)
+
+
+def output_matrix(new_K, crop, output_size):
+    """
+    camera matrix that projects the crop rectangle of the image projected by
+    new_K onto an image of output_size, keeping pixel centres aligned the way
+    cv.resize does
+    """
+
+    x, y, w, h = crop
+    sx = output_size[0] / w
+    sy = output_size[1] / h
+    A = np.array(
+        [
+            [sx, 0, (0.5 - x) * sx - 0.5],
+            [0, sy, (0.5 - y) * sy - 0.5],
+            [0, 0, 1],
+        ]
     )
-    return map1, map2
+    return A @ new_K
 
 
 @cost
-def undistort(img, map1, map2):
+def undistort(img, map1, map2, interpolation=cv.INTER_LINEAR):
     """undistort fisheye image"""
 
-    undistorted_img = cv.remap(
-        src=img,
-        map1=map1,
-        map2=map2,
-        interpolation=cv.INTER_LINEAR,
-        borderMode=cv.BORDER_CONSTANT,
-    )
-
-    return undistorted_img
+    return maps.remap(img, map1, map2, interpolation)
 
 
 class CalibratedFisheyeCamera:
@@ -181,11 +298,44 @@ class CalibratedFisheyeCamera:
         dim2=None,
         dim3=None,
         name="fisheye",
+        cache_maps=True,
+        crop=None,
+        output_size=None,
+        scale=1.0,
+        map_type="fixed",
+        interpolation="linear",
+        fov_scale=1.0,
+        map_memory=256 * 2 ** 20,
+        shared_maps=False,
+        sparse_step=None,
     ):
         self.balance = balance
+        self.fov_scale = fov_scale
         self.name = name
         self.dim2 = dim2
         self.dim3 = dim3
+        # part of the corrected frame to produce, and at what size
+        self.crop = crop
+        self.output_size = output_size
+        self.scale = scale
+        self.map_type = map_type
+        self.interpolation = maps.interpolation(interpolation)
+        self.map1 = self.map2 = None
+        # keep the map on a grid this many pixels apart instead of dense
+        self.sparse_step = sparse_step
+        self.sparse_map = None
+        self.K_scaled = self.P = None
+        self.frame_size = self.corrected_size = None
+        self._lookups = {}
+        self.map_cache = default_cache() if cache_maps else None
+        evict = None
+        if shared_maps:
+            # identical cameras in this and other processes share one copy
+            self.map_cache = default_registry()
+            evict = self.map_cache.release
+        # recently used map sets, so sweeping balance or fov does not stutter
+        self.map_sets = LRUMapCache(self._build_maps, max_bytes=map_memory, evict=evict)
+        self._image_size = None
         if Path(calibration_file).exists():
             self.calibration = load_calibration(calibration_file=calibration_file)
         else:
@@ -196,6 +346,7 @@ class CalibratedFisheyeCamera:
         """set calibration"""
         # TODO validate
         self.calibration = calibration
+        self.P = None
 
     @property
     def cid(self):
@@ -221,18 +372,45 @@ class CalibratedFisheyeCamera:
     def set_balance(self, balance, frame):
         self.balance = balance
         self.set_map(frame)
+        self.prefetch_neighbours(frame)
+
+    def set_fov_scale(self, fov_scale, frame):
+        self.fov_scale = fov_scale
+        self.set_map(frame)
+        self.prefetch_neighbours(frame)
+
+    def prefetch_neighbours(self, frame):
+        """build the maps for nearby balance and fov values in the background"""
+
+        if self._image_size is None or self.sparse_step:
+            return
+        balances = [self.balance + s * d for s in BALANCE_STEPS for d in (1, -1)]
+        fov_scales = [self.fov_scale + s * d for s in FOV_STEPS for d in (1, -1)]
+        keys = [
+            self._key(balance, self.fov_scale, frame)
+            for balance in balances
+            if 0 <= balance <= 1
+        ]
+        keys += [
+            self._key(self.balance, fov_scale, frame)
+            for fov_scale in fov_scales
+            if fov_scale > 0
+        ]
+        self.map_sets.prefetch(keys)
+
+    def set_map_type(self, map_type):
+        """convert the current maps to another format"""
+        self.map_type = map_type
+        if self.map1 is not None:
+            self.map1, self.map2 = maps.convert_maps(self.map1, self.map2, map_type)
+
+    def set_interpolation(self, interpolation):
+        """interpolation used by correct, one of maps.INTERPOLATIONS"""
+        self.interpolation = maps.interpolation(interpolation)
 
     def set_size(self, w, h, frame):
         if self.calibration:
-            self.map1, self.map2 = get_maps(
-                img=frame,
-                image_size=(w, h),
-                K=self.calibration["K"],
-                D=self.calibration["D"],
-                balance=self.balance,
-                dim2=self.dim2,
-                dim3=self.dim3,
-            )
+            self._set_maps(frame, image_size=(w, h))
         else:
             logger.error("Load calibration before setting size")
 
@@ -240,19 +418,128 @@ class CalibratedFisheyeCamera:
         """set the maps"""
 
         if self.calibration:
-            self.map1, self.map2 = get_maps(
-                img=first_frame,
-                image_size=self.calibration["image_size"],
-                K=self.calibration["K"],
-                D=self.calibration["D"],
-                balance=self.balance,
-                dim2=self.dim2,
-                dim3=self.dim3,
-            )
+            self._set_maps(first_frame, image_size=self.calibration["image_size"])
         else:
             logger.error("Load calibration before setting the map")
 
+    def _parameters(self, image_size, balance, fov_scale):
+        return dict(
+            image_size=image_size,
+            K=self.calibration["K"],
+            D=self.calibration["D"],
+            balance=balance,
+            fov_scale=fov_scale,
+            dim2=self.dim2,
+            dim3=self.dim3,
+            crop=self.crop,
+            output_size=self.output_size,
+            scale=self.scale,
+        )
+
+    def _key(self, balance, fov_scale, frame):
+        return (
+            round(balance, 3),
+            round(fov_scale, 3),
+            frame.shape[1::-1],
+            self._image_size,
+            self.map_type,
+        )
+
+    def _build_maps(self, key, background):
+        balance, fov_scale, (w, h), image_size, map_type = key
+        return get_maps(
+            # only the shape of the image is used
+            img=np.broadcast_to(np.uint8(0), (h, w)),
+            # values passed over while sweeping are not worth keeping on disk
+            cache=None if background else self.map_cache,
+            map_type=map_type,
+            **self._parameters(image_size, balance, fov_scale),
+        )
+
+    def _set_projection(self, frame_size, image_size):
+        self._image_size = tuple(image_size)
+        self.frame_size = tuple(frame_size)
+        self.K_scaled, self.P, self.corrected_size = projection(
+            dim1=self.frame_size,
+            **self._parameters(image_size, self.balance, self.fov_scale),
+        )
+        self._lookups = {}
+
+    def _require_projection(self):
+        """
+        the projection of the maps, or without maps yet that of frames the size
+        the camera was calibrated at, for callers that only have points
+        """
+
+        if self.P is not None:
+            return
+        if not self.calibration:
+            raise RuntimeError("Load calibration before correcting points")
+        image_size = self.calibration["image_size"]
+        self._set_projection(image_size, image_size)
+
+    def _set_maps(self, frame, image_size):
+        # the same projection is used to correct points
+        self._set_projection(frame.shape[:2][::-1], image_size)
+        if self.sparse_step:
+            # cheap enough to build that it is not cached
+            self.sparse_map = SparseMap.from_function(
+                self.distort_points, self.corrected_size, self.sparse_step
+            )
+            return
+        self.map1, self.map2 = self.map_sets.get(
+            self._key(self.balance, self.fov_scale, frame)
+        )
+
+    def undistort_points(self, points, dense=False):
+        """
+        positions in the corrected frame of points in the raw frame, when dense
+        they are looked up in a table over the raw frame built on first use
+        """
+
+        self._require_projection()
+        if dense:
+            lookup = self._lookup("undistort", self.frame_size, self.undistort_points)
+            return lookup(points)
+        corrected = cv.fisheye.undistortPoints(
+            distorted=as_points(points),
+            K=self.K_scaled,
+            D=self.calibration["D"],
+            R=np.eye(3),
+            P=self.P,
+        )
+        return corrected.reshape(np.shape(points))
+
+    def distort_points(self, points, dense=False):
+        """
+        positions in the raw frame of points in the corrected frame, when dense
+        they are looked up in a table over the corrected frame built on first use
+        """
+
+        self._require_projection()
+        if dense:
+            lookup = self._lookup("distort", self.corrected_size, self.distort_points)
+            return lookup(points)
+        distorted = cv.fisheye.distortPoints(
+            undistorted=as_points(to_normalized(points, self.P)),
+            K=self.K_scaled,
+            D=self.calibration["D"],
+        )
+        return distorted.reshape(np.shape(points))
+
+    def _lookup(self, name, size, transform):
+        if name not in self._lookups:
+            self._lookups[name] = PointLookup(transform, size)
+        return self._lookups[name]
+
     @cost
     def correct(self, frame):
         """undistort frame"""
-        return undistort(frame, self.map1, self.map2)
+        if self.sparse_map is not None:
+            return self.sparse_map.remap(frame, self.interpolation)
+        return undistort(frame, self.map1, self.map2, self.interpolation)
+
+    def close(self):
+        """let go of the maps, shared maps are released"""
+        self.map1 = self.map2 = self.sparse_map = None
+        self.map_sets.close()
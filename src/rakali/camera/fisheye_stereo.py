@@ -5,6 +5,7 @@ Stereo Fisheye camera support
 import json
 import logging
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import Dict, Optional
 
@@ -12,8 +13,11 @@ import cv2 as cv
 import numpy as np
 from rakali.video.fps import cost
 
+from . import maps, multistart, reprojection
 from .fisheye import STOP_CRITERIA, get_maps, undistort
+from .map_cache import default_cache
 from .save import NumpyEncoder
+from .selection import pick
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +28,8 @@ CALIBRATE_FLAGS = (
 )
 
 
-def stereo_calibrate(calibration_data, use_pre_calibrated=True):
-    """do stereo calibration using pre-calibration values from left and right eyes"""
-
-    print("Calibrate Fisheye Stereo camera using pre-calibrated values")
+def solve_stereo(calibration_data, use_pre_calibrated, indices):
+    """stereo calibration over the view pairs at indices"""
 
     chessboard_size = calibration_data["chessboard_size"]
     board_area = chessboard_size[0] * chessboard_size[1]
@@ -47,13 +49,8 @@ def stereo_calibrate(calibration_data, use_pre_calibrated=True):
     R = np.zeros((1, 1, 3), dtype=np.float64)
     T = np.zeros((1, 1, 3), dtype=np.float64)
 
-    imgpoints_left = calibration_data["left"]["image_points"]
-    imgpoints_right = calibration_data["right"]["image_points"]
-
-    # print(len(imgpoints_left), len(imgpoints_right))
-    # with np.printoptions(precision=3, suppress=True):
-    #     print(imgpoints_left)
-    #     print(imgpoints_right)
+    imgpoints_left = pick(calibration_data["left"]["image_points"], indices)
+    imgpoints_right = pick(calibration_data["right"]["image_points"], indices)
 
     N_OK = len(imgpoints_left)
 
@@ -73,9 +70,6 @@ def stereo_calibrate(calibration_data, use_pre_calibrated=True):
     # objpoints shape: (<num of calibration images>, 1, <num points in set>, 3)
     # imgpoints_left shape: (<num of calibration images>, 1, <num points in set>, 2)
     # imgpoints_right shape: (<num of calibration images>, 1, <num points in set>, 2)
-    # print(objpoints.shape)
-    # print(imgpoints_left.shape)
-    # print(imgpoints_right.shape)
 
     (
         rms,
@@ -100,17 +94,84 @@ def stereo_calibrate(calibration_data, use_pre_calibrated=True):
         criteria=STOP_CRITERIA,
     )
 
-    # return the combined calibration as well as the separately calibrated
-    # metrics
-    calibration = dict(
-        rms=rms,
-        individual_calibration=calibration_data,
+    # per pair error, using the left eye poses from its own calibration and
+    # the right eye poses that follow from the stereo extrinsics
+    objects = objpoints.reshape(N_OK, board_area, 3)
+    left_R = reprojection.rodrigues(pick(calibration_data["left"]["rvecs"], indices))
+    left_t = np.asarray(
+        pick(calibration_data["left"]["tvecs"], indices), dtype=np.float64
+    ).reshape(N_OK, 3)
+    left_errors = reprojection.evaluate_fisheye(
+        objects, imgpoints_left, left_R, left_t, new_K_left, new_D_left
+    ).view_errors
+    right_errors = reprojection.evaluate_fisheye(
+        objects,
+        imgpoints_right,
+        new_R @ left_R,
+        left_t @ new_R.T + new_T.reshape(1, 3),
+        new_K_right,
+        new_D_right,
+    ).view_errors
+    errors = np.sqrt((left_errors ** 2 + right_errors ** 2) / 2)
+
+    model = dict(
         K_left=new_K_left,
         D_left=new_D_left,
         K_right=new_K_right,
         D_right=new_D_right,
         R=new_R,
         T=new_T,
+        parameters=np.concatenate(
+            (cv.Rodrigues(new_R)[0].ravel(), np.asarray(new_T).ravel())
+        ),
+    )
+    return rms, model, errors
+
+
+def stereo_calibrate(
+    calibration_data,
+    use_pre_calibrated=True,
+    starts=1,
+    max_rounds=0,
+    salt=888,
+    workers=None,
+):
+    """
+    do stereo calibration using pre-calibration values from left and right eyes,
+    optionally from several starts over resampled view pairs, dropping the
+    pairs that do not agree with the rest
+    """
+
+    print("Calibrate Fisheye Stereo camera using pre-calibrated values")
+
+    count = len(calibration_data["left"]["image_points"])
+    subsets = [list(range(count))]
+    subsets += multistart.resampled(count, count, starts - 1, salt=salt)
+    result = multistart.calibrate(
+        solve=partial(solve_stereo, calibration_data, use_pre_calibrated),
+        subsets=subsets,
+        max_rounds=max_rounds,
+        workers=workers,
+    )
+    best = result.best
+    if best is None:
+        logger.error("Stereo calibration failed from all starts")
+        return None
+    if starts > 1:
+        result.print()
+
+    # return the combined calibration as well as the separately calibrated
+    # metrics
+    calibration = dict(
+        rms=best.rms,
+        individual_calibration=calibration_data,
+        K_left=best.model["K_left"],
+        D_left=best.model["D_left"],
+        K_right=best.model["K_right"],
+        D_right=best.model["D_right"],
+        R=best.model["R"],
+        T=best.model["T"],
+        views=best.views,
     )
     print_calibration(calibration)
     return calibration
@@ -208,11 +269,26 @@ class CalibratedStereoFisheyeCamera:
         dim2=None,
         dim3=None,
         name="stereo fisheye",
+        cache_maps=True,
+        crop=None,
+        output_size=None,
+        scale=1.0,
+        map_type="fixed",
+        interpolation="linear",
     ):
         self.balance = balance
         self.name = name
         self.dim2 = dim2
         self.dim3 = dim3
+        # part of the rectified frames to produce, and at what size
+        self.crop = crop
+        self.output_size = output_size
+        self.scale = scale
+        self.map_type = map_type
+        self.interpolation = maps.interpolation(interpolation)
+        self.left_map1 = self.left_map2 = None
+        self.right_map1 = self.right_map2 = None
+        self.map_cache = default_cache() if cache_maps else None
         if Path(calibration_file).exists():
             self.calibration = load_stereo_calibration(
                 calibration_file=calibration_file
@@ -278,6 +354,11 @@ class CalibratedStereoFisheyeCamera:
                 balance=self.balance,
                 # dim2=self.dim2,
                 # dim3=self.dim3,
+                cache=self.map_cache,
+                crop=self.crop,
+                output_size=self.output_size,
+                scale=self.scale,
+                map_type=self.map_type,
             )
             self.right_map1, self.right_map2 = get_maps(
                 img=first_frame,
@@ -288,15 +369,40 @@ class CalibratedStereoFisheyeCamera:
                 balance=self.balance,
                 # dim2=self.dim2,
                 # dim3=self.dim3,
+                cache=self.map_cache,
+                crop=self.crop,
+                output_size=self.output_size,
+                scale=self.scale,
+                map_type=self.map_type,
             )
         else:
             logger.error("Load calibration before setting the maps")
 
+    def set_map_type(self, map_type):
+        """convert the current maps to another format"""
+
+        self.map_type = map_type
+        if self.left_map1 is not None:
+            self.left_map1, self.left_map2 = maps.convert_maps(
+                self.left_map1, self.left_map2, map_type
+            )
+            self.right_map1, self.right_map2 = maps.convert_maps(
+                self.right_map1, self.right_map2, map_type
+            )
+
+    def set_interpolation(self, interpolation):
+        """interpolation used by correct, one of maps.INTERPOLATIONS"""
+        self.interpolation = maps.interpolation(interpolation)
+
     @cost
     def correct(self, left, right):
         """undistort frames"""
 
-        left_corrected = undistort(left, self.left_map1, self.left_map2)
-        right_corrected = undistort(right, self.right_map1, self.right_map2)
+        left_corrected = undistort(
+            left, self.left_map1, self.left_map2, self.interpolation
+        )
+        right_corrected = undistort(
+            right, self.right_map1, self.right_map2, self.interpolation
+        )
 
         return (left_corrected, right_corrected)
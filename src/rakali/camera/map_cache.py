@@ -0,0 +1,291 @@
+"""
+On disk cache of undistortion and rectification maps.
+
+Building fisheye maps for a multi-megapixel frame takes a noticeable time on
+every launch. The maps only depend on the calibration and a few parameters, so
+they are saved as .npy files named by a hash of everything that goes into
+them. Cached maps are memory mapped when loaded, which makes startup near
+instant and lets several processes using the same camera share the pages.
+
+The cache lives in ~/rakali/maps/ unless RAKALI_MAP_CACHE points elsewhere.
+It takes no more than `max_bytes`, the least recently used maps are removed
+first.
+
+Interactive tools that sweep balance or field of view keep recently used map
+sets in memory with LRUMapCache instead, building the likely next ones ahead
+of time.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Hashable, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from .maps import map_bytes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FOLDER = "~/rakali/maps/"
+DEFAULT_MAX_BYTES = 2 ** 30
+# bump when the way maps are computed changes, so old entries are not used
+VERSION = 1
+
+
+class MapCache:
+    """
+    a folder of memory mapped map pairs, keyed by the map parameters, of no
+    more than max_bytes
+    """
+
+    def __init__(self, folder=DEFAULT_FOLDER, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = Path(folder).expanduser()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(**parameters) -> str:
+        """hash of the parameters that determine a map pair"""
+
+        digest = hashlib.sha1(f"rakali maps v{VERSION} {cv.__version__}".encode())
+        for name in sorted(parameters):
+            value = parameters[name]
+            digest.update(name.encode())
+            if isinstance(value, np.ndarray):
+                value = np.ascontiguousarray(value, dtype=np.float64)
+                digest.update(str(value.shape).encode())
+                digest.update(value.tobytes())
+            else:
+                digest.update(repr(value).encode())
+        return digest.hexdigest()
+
+    def paths(self, key) -> Tuple[Path, Path]:
+        return self.folder / f"{key}_1.npy", self.folder / f"{key}_2.npy"
+
+    def load(self, key):
+        """memory mapped (map1, map2) for key, None if not cached"""
+
+        path1, path2 = self.paths(key)
+        if not path1.exists():
+            self.misses += 1
+            return None
+        try:
+            map1 = np.load(path1, mmap_mode="r")
+            # float2 maps come without a second map
+            map2 = np.load(path2, mmap_mode="r") if path2.exists() else None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cached map {key}: {e}")
+            self.misses += 1
+            return None
+        if map2 is None and not (map1.dtype == np.float32 and map1.ndim == 3):
+            self.misses += 1
+            return None
+        maps = (map1, map2)
+        self._touch(key)
+        logger.debug(f"Loaded cached map {key}")
+        self.hits += 1
+        return maps
+
+    def save(self, key, map1, map2):
+        """store a map pair, failing to do so only costs time next launch"""
+
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            # the second map is written first, load needs both to be present
+            for path, m in reversed(list(zip(self.paths(key), (map1, map2)))):
+                if m is not None:
+                    self._write(path, m)
+            self._trim()
+        except OSError as e:
+            logger.warning(f"Could not cache map in {self.folder}: {e}")
+
+    def _touch(self, key):
+        # the modification time tells when a map was last used
+        for path in self.paths(key):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _trim(self):
+        """remove the least recently used maps until the rest fit max_bytes"""
+
+        used: Dict[str, Tuple[float, int]] = {}
+        for path in self.folder.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            key = path.stem.rpartition("_")[0]
+            mtime, size = used.get(key, (0.0, 0))
+            used[key] = max(mtime, stat.st_mtime), size + stat.st_size
+        total = sum(size for _, size in used.values())
+        # the newest maps are kept even when they alone are too large
+        for key in sorted(used, key=lambda k: used[k][0])[:-1]:
+            if total <= self.max_bytes:
+                break
+            for path in self.paths(key):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= used[key][1]
+            logger.debug(f"Removed cached map {key}")
+
+    def _write(self, path, m):
+        # write aside and rename so readers never see a partial file
+        fd, temporary = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, m)
+            os.replace(temporary, path)
+        except OSError:
+            os.unlink(temporary)
+            raise
+
+    def get(self, compute, **parameters):
+        """cached maps for parameters, computing and storing them if needed"""
+
+        key = self.key(**parameters)
+        maps = self.load(key)
+        if maps is None:
+            maps = compute()
+            self.save(key, *maps)
+        return maps
+
+    def clear(self):
+        """remove all cached maps"""
+
+        for path in self.folder.glob("*.npy"):
+            path.unlink()
+
+    def __repr__(self):
+        return (
+            f"MapCache({self.folder}, max_bytes={self.max_bytes}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+
+class LRUMapCache:
+    """
+    Map sets held in memory, keyed by whatever determines them. The least
+    recently used sets are dropped once they take more than `max_bytes`.
+    Sets that are likely to be asked for next can be built ahead of time in
+    background threads with `prefetch`, a later `get` of a set still being
+    built waits for it rather than building it again.
+
+    `build(key, background)` returns the (map1, map2) set for a key, and
+    `evict(maps)`, when given, is called with every set that is dropped.
+    """
+
+    def __init__(self, build, max_bytes=256 * 2 ** 20, workers=2, evict=None):
+        self.build = build
+        self.evict = evict
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._maps: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="MapPrecompute"
+        )
+
+    @property
+    def nbytes(self):
+        return sum(map_bytes(*maps) for maps in self._maps.values())
+
+    def get(self, key):
+        """the map set for key, from memory, a running prefetch or built now"""
+
+        with self._lock:
+            if key in self._maps:
+                self._maps.move_to_end(key)
+                self.hits += 1
+                return self._maps[key]
+            self.misses += 1
+            pending = self._pending.get(key)
+        if pending is not None and not pending.cancelled():
+            return pending.result()
+        maps = self.build(key, background=False)
+        self._put(key, maps)
+        return maps
+
+    def prefetch(self, keys):
+        """build the sets for keys in the background, dropping older requests"""
+
+        with self._lock:
+            # requests that have not started yet are stale by now
+            for key, future in list(self._pending.items()):
+                if future.cancel():
+                    del self._pending[key]
+            for key in keys:
+                if key not in self._maps and key not in self._pending:
+                    self._pending[key] = self._pool.submit(self._prefetch, key)
+
+    def _prefetch(self, key):
+        try:
+            maps = self.build(key, background=True)
+            self._put(key, maps)
+            return maps
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _put(self, key, maps):
+        dropped = []
+        with self._lock:
+            self._maps[key] = maps
+            self._maps.move_to_end(key)
+            while len(self._maps) > 1 and self.nbytes > self.max_bytes:
+                dropped.append(self._maps.popitem(last=False)[1])
+        self._evict(dropped)
+
+    def _evict(self, dropped):
+        if self.evict is not None:
+            for maps in dropped:
+                self.evict(maps)
+
+    def clear(self):
+        """drop all sets"""
+        with self._lock:
+            dropped = list(self._maps.values())
+            self._maps.clear()
+        self._evict(dropped)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.clear()
+
+    def __len__(self):
+        return len(self._maps)
+
+    def __repr__(self):
+        return (
+            f"LRUMapCache(sets={len(self)}, MiB={self.nbytes / 2 ** 20:.1f}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+
+_default: Optional[MapCache] = None
+
+
+def default_cache() -> MapCache:
+    """the process wide map cache"""
+
+    global _default
+    if _default is None:
+        mib = os.environ.get("RAKALI_MAP_CACHE_MIB")
+        _default = MapCache(
+            os.environ.get("RAKALI_MAP_CACHE", DEFAULT_FOLDER),
+            int(mib) * 2 ** 20 if mib else DEFAULT_MAX_BYTES,
+        )
+    return _default
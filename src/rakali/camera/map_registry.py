@@ -0,0 +1,196 @@
+"""
+Process wide registry of remap tables shared between cameras and processes.
+
+Many identical cameras sharing one calibration all need the same maps, tens of
+megabytes each at 4K. The registry hands out one read-only copy per distinct
+calibration and parameter hash, reference counted, so memory scales with the
+number of distinct calibrations rather than the number of cameras.
+
+The maps live in named shared memory, a worker process asking for maps that
+another process already built attaches to them instead of building its own.
+The process that built a set unlinks it once it holds no more references,
+processes that attached keep their mapping until they release it.
+"""
+
+import json
+import logging
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+import numpy as np
+
+from .map_cache import MapCache, default_cache
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "rakali_"
+# layout: ready flag, header length, json header, then the aligned arrays
+HEADER = 16
+ALIGN = 64
+# how long to wait on another process still writing a set
+READY_TIMEOUT = 30.0
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+class _Entry:
+    """a map set in shared memory and the references held to it"""
+
+    def __init__(self, shm, maps, owner):
+        self.shm = shm
+        self.maps = maps
+        self.owner = owner
+        self.refs = 0
+
+
+def _create(name, maps) -> _Entry:
+    arrays = [m for m in maps if m is not None]
+    layout = []
+    header = json.dumps([[m.dtype.str, m.shape] for m in arrays]).encode()
+    offset = _aligned(HEADER + len(header))
+    for m in arrays:
+        layout.append(offset)
+        offset = _aligned(offset + m.nbytes)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=offset)
+    shm.buf[8:HEADER] = np.int64(len(header)).tobytes()
+    shm.buf[HEADER : HEADER + len(header)] = header
+    for m, start in zip(arrays, layout):
+        view = np.ndarray(m.shape, dtype=m.dtype, buffer=shm.buf, offset=start)
+        view[...] = m
+    # readers wait on this
+    shm.buf[0] = 1
+    return _Entry(shm, _views(shm), owner=True)
+
+
+def _attach(name) -> Optional[_Entry]:
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+    deadline = time.monotonic() + READY_TIMEOUT
+    while shm.buf[0] != 1:
+        if time.monotonic() > deadline:
+            shm.close()
+            raise TimeoutError(f"Shared maps {name} never became ready")
+        time.sleep(0.01)
+    return _Entry(shm, _views(shm), owner=False)
+
+
+def _views(shm):
+    """read only arrays over the maps in a segment"""
+
+    length = int(np.frombuffer(shm.buf[8:HEADER], dtype=np.int64)[0])
+    header = json.loads(bytes(shm.buf[HEADER : HEADER + length]))
+    offset = _aligned(HEADER + length)
+    arrays = []
+    for dtype, shape in header:
+        view = np.ndarray(
+            tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset
+        )
+        view.flags.writeable = False
+        arrays.append(view)
+        offset = _aligned(offset + view.nbytes)
+    if len(arrays) == 1:
+        arrays.append(None)
+    return tuple(arrays)
+
+
+class MapRegistry:
+    """
+    Reference counted, read only map sets shared by every camera in the
+    process and with other processes through shared memory. Use it as the
+    `cache` of get_maps, and `release` the maps when done with them.
+    """
+
+    def __init__(self, disk_cache: Optional[MapCache] = None):
+        self.disk_cache = disk_cache
+        self._entries: Dict[str, _Entry] = {}
+        # map1 identity to key, so maps can be released by value
+        self._keys: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, compute, **parameters):
+        """shared maps for parameters, acquiring a reference to them"""
+
+        key = MapCache.key(**parameters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key, compute, parameters)
+                self._entries[key] = entry
+                self._keys[id(entry.maps[0])] = key
+            entry.refs += 1
+            return entry.maps
+
+    def _load(self, key, compute, parameters) -> _Entry:
+        name = PREFIX + key[:24]
+        entry = _attach(name)
+        if entry is not None:
+            logger.debug(f"Attached to shared maps {name}")
+            return entry
+        if self.disk_cache is not None:
+            maps = self.disk_cache.get(compute, **parameters)
+        else:
+            maps = compute()
+        try:
+            return _create(name, maps)
+        except FileExistsError:
+            # another process got there first
+            return _attach(name)
+
+    def release(self, maps):
+        """drop a reference to maps handed out by get"""
+
+        with self._lock:
+            key = self._keys.get(id(maps[0]))
+            if key is None:
+                return
+            entry = self._entries[key]
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            del self._entries[key]
+            del self._keys[id(entry.maps[0])]
+        entry.maps = None
+        try:
+            entry.shm.close()
+        except BufferError:
+            logger.debug(f"Shared maps {key} still in use, leaving them mapped")
+        if entry.owner:
+            try:
+                entry.shm.unlink()
+            except FileNotFoundError:
+                # the resource tracker of an unrelated process that attached
+                # removes the name when that process exits
+                pass
+
+    def refs(self, maps) -> int:
+        """references held to maps"""
+        key = self._keys.get(id(maps[0]))
+        return self._entries[key].refs if key else 0
+
+    @property
+    def nbytes(self):
+        return sum(e.shm.size for e in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"MapRegistry(sets={len(self)}, MiB={self.nbytes / 2 ** 20:.1f})"
+
+
+_default: Optional[MapRegistry] = None
+
+
+def default_registry() -> MapRegistry:
+    """the process wide map registry"""
+
+    global _default
+    if _default is None:
+        _default = MapRegistry(disk_cache=default_cache())
+    return _default
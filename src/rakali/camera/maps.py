@@ -0,0 +1,125 @@
+"""
+Map formats and interpolation for remap based correction, and a benchmark to
+choose between them.
+
+Fixed point maps (CV_16SC2 with a table index map) are the smallest and
+fastest but quantize source positions to 1/32 pixel. Float maps are exact but
+take twice the memory. Nearest interpolation is cheapest, cubic is the
+smoothest. Which trade-off is acceptable depends on the deployment, so
+`benchmark` measures time per frame, map memory and pixel error against
+float maps with cubic interpolation for every combination.
+"""
+
+import time
+
+import cv2 as cv
+import numpy as np
+
+MAP_TYPES = dict(
+    fixed=cv.CV_16SC2,
+    float=cv.CV_32FC1,
+    float2=cv.CV_32FC2,
+)
+
+INTERPOLATIONS = dict(
+    nearest=cv.INTER_NEAREST,
+    linear=cv.INTER_LINEAR,
+    cubic=cv.INTER_CUBIC,
+)
+
+
+def map_type(name) -> int:
+    """OpenCV map type for a map format name"""
+
+    try:
+        return MAP_TYPES[name]
+    except KeyError:
+        raise ValueError(
+            f"{name} is not a known map type, use one of {list(MAP_TYPES)}"
+        )
+
+
+def interpolation(name) -> int:
+    """OpenCV interpolation flag for an interpolation name"""
+
+    try:
+        return INTERPOLATIONS[name]
+    except KeyError:
+        raise ValueError(
+            f"{name} is not a known interpolation, use one of {list(INTERPOLATIONS)}"
+        )
+
+
+def map_format(map1, map2) -> str:
+    """name of the format of a map pair"""
+
+    if map1.dtype == np.int16:
+        return "fixed"
+    return "float" if map2 is not None else "float2"
+
+
+def convert_maps(map1, map2, name):
+    """convert a map pair to the named format without recomputing it"""
+
+    target = map_type(name)
+    if map_format(map1, map2) == name:
+        return map1, map2
+    return cv.convertMaps(
+        map1=map1,
+        map2=map2,
+        dstmap1type=target,
+        nninterpolation=False,
+    )
+
+
+def map_bytes(map1, map2) -> int:
+    """memory taken by a map pair"""
+
+    return map1.nbytes + (map2.nbytes if map2 is not None else 0)
+
+
+def remap(img, map1, map2, interpolation=cv.INTER_LINEAR):
+    """remap img through a map pair of any format"""
+
+    return cv.remap(
+        src=img,
+        map1=map1,
+        map2=map2,
+        interpolation=interpolation,
+        borderMode=cv.BORDER_CONSTANT,
+    )
+
+
+def benchmark(img, map1, map2, repeat=20):
+    """
+    Time per frame, map memory and error of every map format and
+    interpolation combination, given float maps for img.
+
+    The reference is the float map remapped with cubic interpolation. Errors
+    are absolute pixel value differences over the whole frame. Returns a list
+    of dicts, fastest first.
+    """
+
+    reference = remap(img, *convert_maps(map1, map2, "float"), cv.INTER_CUBIC)
+    reference = reference.astype(np.float32)
+    results = []
+    for map_name in MAP_TYPES:
+        converted = convert_maps(map1, map2, map_name)
+        for interpolation_name, flag in INTERPOLATIONS.items():
+            out = remap(img, *converted, flag)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                remap(img, *converted, flag)
+            cost = (time.perf_counter() - start) / repeat
+            error = np.abs(out.astype(np.float32) - reference)
+            results.append(
+                dict(
+                    map_type=map_name,
+                    interpolation=interpolation_name,
+                    cost=cost,
+                    map_bytes=map_bytes(*converted),
+                    mean_error=float(error.mean()),
+                    max_error=float(error.max()),
+                )
+            )
+    return sorted(results, key=lambda r: r["cost"])
@@ -0,0 +1,303 @@
+"""
+Multi-start calibration with per view outlier rejection.
+
+A single solve over a single subset of views is at the mercy of that subset,
+one bad view can make CALIB_CHECK_COND fail or drag the error up. The driver
+here runs several solves concurrently, each over a different subset of views.
+Every solve repeatedly drops its worst views and solves again until the views
+agree, and the best of the solves is kept. The spread of the solves tells how
+well the views constrain the camera.
+"""
+
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional
+
+import cv2 as cv
+import numpy as np
+
+from . import fisheye, pinhole, reprojection, selection
+
+logger = logging.getLogger(__name__)
+
+# a view is an outlier when its error exceeds this multiple of the median
+# view error
+OUTLIER_RATIO = 2.0
+# never drop more than this fraction of the views in a single round
+DROP_FRACTION = 0.1
+# give up on a start that had to drop more than this fraction of its views
+MAX_DROPPED = 0.25
+# do not bother solving with fewer views than this
+MIN_VIEWS = 5
+
+# fisheye calibration names the view that made the conditioning check fail
+ILL_CONDITIONED = re.compile(r"input array (\d+)")
+
+
+class CalibrationAttempt:
+    """outcome of a single start of a multi-start calibration"""
+
+    def __init__(
+        self,
+        seed: int,
+        rms: float,
+        model: dict,
+        views: List[int],
+        errors,
+        dropped: List[int],
+        rounds: int,
+    ):
+        self.seed = seed
+        self.rms = rms
+        # the solved camera, in the same form as the model's calibrate() returns
+        self.model = model
+        # indices into the full view set, of the views kept and dropped
+        self.views = views
+        self.errors = errors
+        self.dropped = dropped
+        self.rounds = rounds
+
+    def __repr__(self):
+        return (
+            f"CalibrationAttempt(seed={self.seed}, rms={self.rms:.4f}, "
+            f"views={len(self.views)}, dropped={len(self.dropped)})"
+        )
+
+
+class MultiStartResult:
+    """the best of several calibration attempts, and how much they disagree"""
+
+    def __init__(self, attempts: List[CalibrationAttempt], failures: int):
+        self.attempts = sorted(attempts, key=lambda a: a.rms)
+        self.failures = failures
+
+    @property
+    def best(self) -> Optional[CalibrationAttempt]:
+        return self.attempts[0] if self.attempts else None
+
+    def spread(self):
+        """spread statistics of the errors and parameters over all attempts"""
+
+        rms = np.array([a.rms for a in self.attempts])
+        parameters = np.stack([a.model["parameters"] for a in self.attempts])
+        return dict(
+            starts=len(self.attempts) + self.failures,
+            failures=self.failures,
+            rms_min=rms.min(),
+            rms_max=rms.max(),
+            rms_mean=rms.mean(),
+            rms_std=rms.std(),
+            parameter_std=parameters.std(axis=0),
+        )
+
+    def print(self):
+        """pretty print the outcome of the calibration attempts"""
+
+        for attempt in self.attempts:
+            print(attempt)
+        if not self.attempts:
+            print(f"All {self.failures} starts failed")
+            return
+        stats = self.spread()
+        with np.printoptions(precision=4, suppress=True):
+            print(
+                f"{stats['starts']} starts, {stats['failures']} failed, "
+                f"rms {stats['rms_min']:.4f} - {stats['rms_max']:.4f}, "
+                f"mean {stats['rms_mean']:.4f}, std {stats['rms_std']:.4f}"
+            )
+            print(f"parameter std {stats['parameter_std']}")
+
+
+def solve_fisheye(object_points, image_points, image_size, indices):
+    """fisheye calibration over the views at indices"""
+
+    objects = selection.pick(object_points, indices)
+    images = selection.pick(image_points, indices)
+    rms, K, D, rvecs, tvecs = fisheye.calibrate(
+        object_points=objects,
+        image_points=images,
+        image_size=image_size,
+    )
+    errors = reprojection.evaluate_fisheye(objects, images, rvecs, tvecs, K, D)
+    model = dict(
+        K=K,
+        D=D,
+        rvecs=rvecs,
+        tvecs=tvecs,
+        parameters=np.concatenate((K[[0, 1, 0, 1], [0, 1, 2, 2]], D.ravel())),
+    )
+    return rms, model, errors.view_errors
+
+
+def solve_pinhole(object_points, image_points, image_size, indices):
+    """pinhole calibration over the views at indices"""
+
+    objects = selection.pick(object_points, indices)
+    images = selection.pick(image_points, indices)
+    camera_matrix, distortion, rotation, translation = pinhole.calibrate(
+        object_points=objects,
+        image_points=images,
+        image_size=image_size,
+    )
+    errors = reprojection.evaluate_pinhole(
+        objects, images, rotation, translation, camera_matrix, distortion
+    )
+    model = dict(
+        camera_matrix=camera_matrix,
+        distortion_coefficients=distortion,
+        rotation=rotation,
+        translation=translation,
+        parameters=np.concatenate(
+            (camera_matrix[[0, 1, 0, 1], [0, 1, 2, 2]], distortion.ravel())
+        ),
+    )
+    return errors.rms, model, errors.view_errors
+
+
+def refine(
+    solve: Callable,
+    indices: List[int],
+    seed: int = 0,
+    max_rounds: int = 3,
+) -> Optional[CalibrationAttempt]:
+    """
+    Solve over the views at indices, then keep dropping the worst views and
+    solving again until no view stands out or `max_rounds` is reached.
+    """
+
+    views = list(indices)
+    dropped: List[int] = []
+    rounds = 0
+    while len(views) >= MIN_VIEWS:
+        try:
+            rms, model, errors = solve(indices=views)
+        except cv.error as e:
+            # fisheye calibration tells which view is ill conditioned, drop it
+            # and try again, anything else ends this start
+            match = ILL_CONDITIONED.search(str(e))
+            if match and len(dropped) < len(indices) * MAX_DROPPED:
+                view = int(match.group(1))
+                if view < len(views):
+                    dropped.append(views.pop(view))
+                    continue
+            logger.warning(f"Calibration start {seed} failed: {e}")
+            return None
+
+        median = np.median(errors)
+        worst = np.argsort(errors)[::-1][: max(1, int(len(views) * DROP_FRACTION))]
+        outliers = [i for i in worst if errors[i] > OUTLIER_RATIO * median]
+        enough = len(views) - len(outliers) >= MIN_VIEWS
+        if rounds >= max_rounds or not outliers or not enough:
+            return CalibrationAttempt(
+                seed=seed,
+                rms=rms,
+                model=model,
+                views=views,
+                errors=errors,
+                dropped=dropped,
+                rounds=rounds,
+            )
+
+        rounds += 1
+        dropped.extend(views[i] for i in outliers)
+        views = [v for i, v in enumerate(views) if i not in set(outliers)]
+
+    logger.warning(f"Calibration start {seed} ran out of views")
+    return None
+
+
+def start_subsets(
+    image_points,
+    image_size,
+    chessboard_size,
+    pick_size,
+    starts,
+    method="diverse",
+    salt=888,
+    paired_points=None,
+):
+    """
+    The view subsets for each start, the first is picked using `method`, the
+    others are random picks using seeds following `salt`
+    """
+
+    subsets = [
+        selection.select(
+            image_points=image_points,
+            image_size=image_size,
+            chessboard_size=chessboard_size,
+            pick_size=pick_size,
+            method=method,
+            salt=salt,
+            paired_points=paired_points,
+        )
+    ]
+    return subsets + resampled(len(image_points), pick_size, starts - 1, salt=salt)
+
+
+def resampled(count, pick_size, starts, salt=888):
+    """`starts` random subsets of `pick_size` out of `count` views"""
+
+    # random subsets of the full set would all be the same, use most of it
+    size = pick_size if pick_size < count else max(MIN_VIEWS, int(count * 0.8))
+    return [
+        selection.select_random(count, pick_size=size, salt=salt + i)
+        for i in range(1, starts + 1)
+    ]
+
+
+def calibrate(
+    solve: Callable,
+    subsets: List[List[int]],
+    max_rounds: int = 3,
+    workers: Optional[int] = None,
+) -> MultiStartResult:
+    """
+    Run a refined solve for each subset of views concurrently in a process
+    pool. `solve` has to be picklable, a functools.partial of one of the
+    solve_ functions with the calibration data bound does the job.
+    """
+
+    logger.info(f"Calibrating from {len(subsets)} starts")
+    if len(subsets) == 1:
+        attempts = [refine(solve, subsets[0], seed=0, max_rounds=max_rounds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(refine, solve, subset, seed=i, max_rounds=max_rounds)
+                for i, subset in enumerate(subsets)
+            ]
+            attempts = [future.result() for future in futures]
+
+    succeeded = [a for a in attempts if a is not None]
+    return MultiStartResult(succeeded, failures=len(attempts) - len(succeeded))
+
+
+def calibrate_fisheye(
+    object_points,
+    image_points,
+    image_size,
+    subsets,
+    max_rounds=3,
+    workers=None,
+) -> MultiStartResult:
+    """multi-start fisheye calibration"""
+
+    solve = partial(solve_fisheye, object_points, image_points, image_size)
+    return calibrate(solve, subsets, max_rounds=max_rounds, workers=workers)
+
+
+def calibrate_pinhole(
+    object_points,
+    image_points,
+    image_size,
+    subsets,
+    max_rounds=3,
+    workers=None,
+) -> MultiStartResult:
+    """multi-start pinhole calibration"""
+
+    solve = partial(solve_pinhole, object_points, image_points, image_size)
+    return calibrate(solve, subsets, max_rounds=max_rounds, workers=workers)
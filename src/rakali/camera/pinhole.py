@@ -10,9 +10,17 @@ import cv2 as cv
 import numpy as np
 from rakali.video.fps import cost
 
+from . import maps
+from .points import PointLookup, as_points, to_normalized
+from .reprojection import ReprojectionErrors, evaluate_pinhole, project_pinhole
+from .sparse_maps import SparseMap
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# refine undistorted points well past the 5 fixed iterations of undistortPoints
+POINT_CRITERIA = (cv.TERM_CRITERIA_COUNT + cv.TERM_CRITERIA_EPS, 20, 1e-9)
+
 
 def xxx_get_zero_object(pattern_size=(9, 6), square_size=0.023):
     pattern_points = np.zeros((np.prod(pattern_size), 3), np.float32)
@@ -26,6 +34,9 @@ def calibrate(object_points, image_points, image_size):
     Calibrate the pinhole camera using image points
     """
     logging.debug("Calibrating...")
+    # points loaded from file are double precision, calibrateCamera wants floats
+    object_points = [np.asarray(p, dtype=np.float32) for p in object_points]
+    image_points = [np.asarray(p, dtype=np.float32) for p in image_points]
     (
         _,
         camera_matrix,
@@ -46,6 +57,26 @@ def calibrate(object_points, image_points, image_size):
     return camera_matrix, distortion_coefficients, rotation, translation
 
 
+def reprojection_errors(
+    object_points,
+    image_points,
+    rotation,
+    translation,
+    camera_matrix,
+    distortion,
+) -> ReprojectionErrors:
+    """Per corner, per view and overall reprojection errors of all views"""
+
+    return evaluate_pinhole(
+        object_points=object_points,
+        image_points=image_points,
+        rvecs=rotation,
+        tvecs=translation,
+        camera_matrix=camera_matrix,
+        distortion=distortion,
+    )
+
+
 def reprojection_error(
     object_points,
     image_points,
@@ -56,20 +87,18 @@ def reprojection_error(
 ):
     """Calculate reprojection error"""
 
-    total_error = 0
-    length = len(object_points)
-    for i in range(length):
-        __imgpoints, _ = cv.projectPoints(
-            objectPoints=object_points[i],
-            rvec=rotation[i],
-            tvec=translation[i],
-            cameraMatrix=camera_matrix,
-            distCoeffs=distortion,
-        )
-        error = cv.norm(image_points[i], __imgpoints, cv.NORM_L2) / len(__imgpoints)
-        total_error += error
-
-    return total_error / length
+    errors = reprojection_errors(
+        object_points,
+        image_points,
+        rotation,
+        translation,
+        camera_matrix,
+        distortion,
+    )
+    # the L2 norm of each view's residuals divided by its corner count,
+    # averaged over the views
+    corners = errors.corner_errors.shape[1]
+    return float(np.mean(errors.view_errors) / np.sqrt(corners))
 
 
 def save_calibration(
@@ -84,8 +113,10 @@ def save_calibration(
     pick_size: int,
     error: float,
     cid: str,
+    image_size=None,
 ):
     """Save pinhole calibration to file"""
+    extra = {} if image_size is None else dict(image_size=image_size)
     np.savez_compressed(
         calibration_file,
         camera_matrix=camera_matrix,
@@ -99,6 +130,7 @@ def save_calibration(
         error=error,
         cid=cid,
         time=time.time(),
+        **extra,
     )
 
 
@@ -118,11 +150,18 @@ def load_calibration(calibration_file):
         error=float(cal["error"]),
         cid=str(cal["cid"]),
         time=float(cal["time"]),
+        # the frame size, not saved by older calibrations
+        image_size=(
+            tuple(int(v) for v in cal["image_size"])
+            if "image_size" in cal.files
+            else None
+        ),
     )
 
 
 @cost
 def undistort(img, calibration):
+    """undistort using cv.undistort, which rebuilds the maps on every call"""
     img = cv.undistort(
         src=img,
         cameraMatrix=calibration["camera_matrix"],
@@ -133,6 +172,68 @@ def undistort(img, calibration):
     return img
 
 
+def projection(calibration, size, crop=False):
+    """
+    camera matrix and size of frames corrected from frames of size (w, h),
+    when cropping only the valid pixel region of interest found at calibration
+    is kept
+    """
+
+    new_camera_matrix = np.array(calibration["new_camera_matrix"], dtype=np.float64)
+    if crop:
+        x, y, roi_w, roi_h = (int(v) for v in np.ravel(calibration["roi"]))
+        if roi_w > 0 and roi_h > 0:
+            # shift the principal point so the maps start at the roi corner
+            new_camera_matrix[0, 2] -= x
+            new_camera_matrix[1, 2] -= y
+            size = (roi_w, roi_h)
+        else:
+            logger.warning("Calibration has an empty roi, not cropping")
+    return new_camera_matrix, tuple(size)
+
+
+def get_maps(img, calibration, crop=False, map_type="fixed"):
+    """
+    undistortion maps in one of the maps.MAP_TYPES formats for frames the size
+    of img, when cropping the maps only cover the valid pixel region of
+    interest found at calibration
+    """
+
+    h, w = img.shape[:2]
+    new_camera_matrix, size = projection(calibration, (w, h), crop=crop)
+    return cv.initUndistortRectifyMap(
+        cameraMatrix=calibration["camera_matrix"],
+        distCoeffs=calibration["distortion_coefficients"],
+        R=None,
+        newCameraMatrix=new_camera_matrix,
+        size=size,
+        m1type=maps.map_type(map_type),
+    )
+
+
+@cost
+def remap(img, map1, map2, interpolation=cv.INTER_LINEAR):
+    """undistort using precomputed maps"""
+
+    return maps.remap(img, map1, map2, interpolation)
+
+
+def compare_costs(img, calibration, repeat=10):
+    """
+    mean time per frame of cv.undistort and of remapping with precomputed maps
+    """
+
+    map1, map2 = get_maps(img, calibration)
+    reference = 0.0
+    mapped = 0.0
+    for _ in range(repeat):
+        undistort(img, calibration)
+        reference += undistort.cost
+        remap(img, map1, map2)
+        mapped += remap.cost
+    return reference / repeat, mapped / repeat
+
+
 class CalibratedPinholeCamera:
     """A calibrated pinhole camera"""
 
@@ -140,8 +241,25 @@ class CalibratedPinholeCamera:
         self,
         calibration_file,
         name="pinhole",
+        crop=False,
+        map_type="fixed",
+        interpolation="linear",
+        sparse_step=None,
     ):
         self.name = name
+        self.crop = crop
+        self.map_type = map_type
+        self.interpolation = maps.interpolation(interpolation)
+        self.map1 = None
+        self.map2 = None
+        # keep the map on a grid this many pixels apart instead of dense
+        self.sparse_step = sparse_step
+        self.sparse_map = None
+        self._map_source = None
+        self.P = None
+        self.frame_size = self.corrected_size = None
+        self._lookups = {}
+        self.calibration = None
         if Path(calibration_file).exists():
             self.calibration = load_calibration(calibration_file=calibration_file)
         else:
@@ -151,6 +269,9 @@ class CalibratedPinholeCamera:
         """set calibration"""
         # TODO validate
         self.calibration = calibration
+        self.map1 = self.map2 = None
+        self._map_source = None
+        self.P = None
 
     @property
     def cid(self):
@@ -168,7 +289,119 @@ class CalibratedPinholeCamera:
         else:
             return -1
 
+    def set_map(self, first_frame):
+        """set the maps"""
+
+        if self.calibration:
+            self._map_source = first_frame.shape[:2]
+            # the same projection is used to correct points
+            self.set_size(*first_frame.shape[1::-1])
+            if self.sparse_step:
+                self.sparse_map = SparseMap.from_function(
+                    self.distort_points, self.corrected_size, self.sparse_step
+                )
+                return
+            self.map1, self.map2 = get_maps(
+                img=first_frame,
+                calibration=self.calibration,
+                crop=self.crop,
+                map_type=self.map_type,
+            )
+        else:
+            logger.error("Load calibration before setting the map")
+
+    def set_size(self, w, h):
+        """
+        set the projection for raw frames of size (w, h) without building maps,
+        for correcting points of frames that are never seen
+        """
+
+        if not self.calibration:
+            raise RuntimeError("Load calibration before setting the size")
+        self.frame_size = (w, h)
+        self.P, self.corrected_size = projection(
+            self.calibration, self.frame_size, crop=self.crop
+        )
+        self._lookups = {}
+
+    def _require_projection(self):
+        """
+        the projection of the maps, or without maps yet that of frames the size
+        the camera was calibrated at, for callers that only have points
+        """
+
+        if self.P is not None:
+            return
+        # older calibrations do not record the frame size they were made at
+        image_size = self.calibration.get("image_size") if self.calibration else None
+        if image_size is None:
+            raise RuntimeError(
+                "Call set_map or set_size before correcting points, the frame "
+                "size is not known"
+            )
+        self.set_size(*image_size)
+
+    def set_map_type(self, map_type):
+        """convert the current maps to another format"""
+        self.map_type = map_type
+        if self.map1 is not None:
+            self.map1, self.map2 = maps.convert_maps(self.map1, self.map2, map_type)
+
+    def set_interpolation(self, interpolation):
+        """interpolation used by correct, one of maps.INTERPOLATIONS"""
+        self.interpolation = maps.interpolation(interpolation)
+
+    def undistort_points(self, points, dense=False):
+        """
+        positions in the corrected frame of points in the raw frame, when dense
+        they are looked up in a table over the raw frame built on first use
+        """
+
+        self._require_projection()
+        if dense:
+            lookup = self._lookup("undistort", self.frame_size, self.undistort_points)
+            return lookup(points)
+        corrected = cv.undistortPointsIter(
+            src=as_points(points),
+            cameraMatrix=self.calibration["camera_matrix"],
+            distCoeffs=self.calibration["distortion_coefficients"],
+            R=None,
+            P=self.P,
+            criteria=POINT_CRITERIA,
+        )
+        return corrected.reshape(np.shape(points))
+
+    def distort_points(self, points, dense=False):
+        """
+        positions in the raw frame of points in the corrected frame, when dense
+        they are looked up in a table over the corrected frame built on first use
+        """
+
+        self._require_projection()
+        if dense:
+            lookup = self._lookup("distort", self.corrected_size, self.distort_points)
+            return lookup(points)
+        normalized = to_normalized(points, self.P)
+        rays = np.column_stack((normalized, np.ones(len(normalized))))
+        distorted = project_pinhole(
+            object_points=rays[None],
+            rvecs=np.zeros((1, 3)),
+            tvecs=np.zeros((1, 3)),
+            camera_matrix=self.calibration["camera_matrix"],
+            distortion=self.calibration["distortion_coefficients"],
+        )
+        return distorted.reshape(np.shape(points))
+
+    def _lookup(self, name, size, transform):
+        if name not in self._lookups:
+            self._lookups[name] = PointLookup(transform, size)
+        return self._lookups[name]
+
     @cost
     def correct(self, frame):
         """undistort frame"""
-        return undistort(frame, self.calibration)
+        if self._map_source != frame.shape[:2]:
+            self.set_map(frame)
+        if self.sparse_map is not None:
+            return self.sparse_map.remap(frame, self.interpolation)
+        return remap(frame, self.map1, self.map2, self.interpolation)
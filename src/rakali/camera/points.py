@@ -0,0 +1,74 @@
+"""
+Correcting detected points instead of whole frames.
+
+When only the corrected coordinates of a few hundred detections are needed,
+transforming the points is microseconds of work where remapping a frame takes
+tens of milliseconds. For very many points, or many queries against the same
+camera, a dense lookup table of the transform over every pixel makes each
+query a constant time bilinear lookup.
+"""
+
+import numpy as np
+
+
+def as_points(points):
+    """(N, 1, 2) float64 points as the OpenCV point functions want them"""
+
+    return np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+
+
+def pixel_grid(size):
+    """(h * w, 2) coordinates of every pixel of an image of size (w, h)"""
+
+    w, h = size
+    x, y = np.meshgrid(np.arange(w), np.arange(h))
+    return np.column_stack((x.ravel(), y.ravel())).astype(np.float64)
+
+
+def to_normalized(points, P, R=None):
+    """
+    back project pixel coordinates of a frame projected with P, and rotated by
+    R, to normalized coordinates of the original camera
+    """
+
+    points = as_points(points).reshape(-1, 2)
+    rays = np.column_stack((points, np.ones(len(points)))) @ np.linalg.inv(P).T
+    if R is not None:
+        rays = rays @ np.asarray(R, dtype=np.float64)
+    return rays[:, :2] / rays[:, 2:]
+
+
+class PointLookup:
+    """
+    A point transform tabulated over every pixel of a frame of `size`, queried
+    with bilinear interpolation. Points outside the frame are clamped to its
+    edge.
+    """
+
+    def __init__(self, transform, size):
+        w, h = size
+        self.size = size
+        table = transform(pixel_grid(size)).reshape(h, w, 2)
+        self.table = table.astype(np.float32)
+
+    def __call__(self, points):
+        shape = np.shape(points)
+        p = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        h, w = self.table.shape[:2]
+        x = np.clip(p[:, 0], 0, w - 1)
+        y = np.clip(p[:, 1], 0, h - 1)
+        x0 = np.minimum(x.astype(int), w - 2)
+        y0 = np.minimum(y.astype(int), h - 2)
+        fx = (x - x0)[:, None]
+        fy = (y - y0)[:, None]
+        t = self.table
+        top = t[y0, x0] * (1 - fx) + t[y0, x0 + 1] * fx
+        bottom = t[y0 + 1, x0] * (1 - fx) + t[y0 + 1, x0 + 1] * fx
+        return (top * (1 - fy) + bottom * fy).reshape(shape)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def __repr__(self):
+        return f"PointLookup(size={self.size}, MiB={self.nbytes / 2 ** 20:.1f})"
@@ -0,0 +1,164 @@
+"""
+Vectorized reprojection of calibration views for pinhole and fisheye cameras.
+
+cv.projectPoints and cv.fisheye.projectPoints work on one view at a time. The
+functions here project every corner of every view in one go with numpy, so
+per view and per corner errors over thousands of views take milliseconds and
+are cheap enough to use inside calibration loops.
+"""
+
+import numpy as np
+
+
+def rodrigues(rvecs):
+    """rotation matrices (V, 3, 3) from rotation vectors (V, 3)"""
+
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    safe = np.where(theta > 1e-12, theta, 1.0)
+    k = rvecs / safe[:, None]
+    kx, ky, kz = k[:, 0], k[:, 1], k[:, 2]
+    zero = np.zeros_like(kx)
+    cross = np.stack(
+        (
+            np.stack((zero, -kz, ky), axis=1),
+            np.stack((kz, zero, -kx), axis=1),
+            np.stack((-ky, kx, zero), axis=1),
+        ),
+        axis=1,
+    )
+    sin = np.sin(theta)[:, None, None]
+    cos = np.cos(theta)[:, None, None]
+    outer = k[:, :, None] * k[:, None, :]
+    R = cos * np.eye(3) + sin * cross + (1 - cos) * outer
+    # no rotation at all
+    R[theta <= 1e-12] = np.eye(3)
+    return R
+
+
+def as_views(points, dims):
+    """stack per view points into a (V, N, dims) float64 array"""
+
+    if isinstance(points, np.ndarray):
+        return points.astype(np.float64, copy=False).reshape(len(points), -1, dims)
+    return np.stack([np.asarray(p, dtype=np.float64).reshape(-1, dims) for p in points])
+
+
+def to_camera(object_points, rvecs, tvecs):
+    """
+    transform object points (V, N, 3) into each view's camera frame, the
+    rotations can be given as rotation vectors or (V, 3, 3) matrices
+    """
+
+    R = np.asarray(rvecs, dtype=np.float64)
+    if R.shape[-2:] != (3, 3):
+        R = rodrigues(R)
+    t = np.asarray(tvecs, dtype=np.float64).reshape(-1, 1, 3)
+    return np.einsum("vij,vnj->vni", R, object_points) + t
+
+
+def project_pinhole(object_points, rvecs, tvecs, camera_matrix, distortion):
+    """
+    Project (V, N, 3) object points with the OpenCV pinhole model, supporting
+    the 4, 5 and 8 coefficient radial and tangential distortion models.
+    Returns (V, N, 2) image points.
+    """
+
+    X = to_camera(object_points, rvecs, tvecs)
+    x = X[..., 0] / X[..., 2]
+    y = X[..., 1] / X[..., 2]
+
+    d = np.zeros(8)
+    coefficients = np.asarray(distortion, dtype=np.float64).ravel()
+    if len(coefficients) > 8:
+        raise ValueError("Thin prism and tilted distortion models are not supported")
+    d[: len(coefficients)] = coefficients
+    k1, k2, p1, p2, k3, k4, k5, k6 = d
+
+    r2 = x * x + y * y
+    r4 = r2 * r2
+    r6 = r4 * r2
+    radial = (1 + k1 * r2 + k2 * r4 + k3 * r6) / (1 + k4 * r2 + k5 * r4 + k6 * r6)
+    xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+
+    K = np.asarray(camera_matrix, dtype=np.float64)
+    u = K[0, 0] * xd + K[0, 1] * yd + K[0, 2]
+    v = K[1, 1] * yd + K[1, 2]
+    return np.stack((u, v), axis=-1)
+
+
+def project_fisheye(object_points, rvecs, tvecs, K, D):
+    """
+    Project (V, N, 3) object points with the OpenCV fisheye (equidistant) model.
+    Returns (V, N, 2) image points.
+    """
+
+    X = to_camera(object_points, rvecs, tvecs)
+    a = X[..., 0] / X[..., 2]
+    b = X[..., 1] / X[..., 2]
+    r = np.sqrt(a * a + b * b)
+
+    k1, k2, k3, k4 = np.asarray(D, dtype=np.float64).ravel()[:4]
+    theta = np.arctan(r)
+    theta2 = theta * theta
+    theta_d = theta * (1 + theta2 * (k1 + theta2 * (k2 + theta2 * (k3 + theta2 * k4))))
+    scale = np.where(r > 1e-12, theta_d / np.where(r > 1e-12, r, 1.0), 1.0)
+    xd = a * scale
+    yd = b * scale
+
+    K = np.asarray(K, dtype=np.float64)
+    u = K[0, 0] * xd + K[0, 1] * yd + K[0, 2]
+    v = K[1, 1] * yd + K[1, 2]
+    return np.stack((u, v), axis=-1)
+
+
+class ReprojectionErrors:
+    """
+    Reprojection residuals of a set of calibration views.
+
+    residuals: (V, N, 2) observed minus projected corner positions
+    corner_errors: (V, N) distance between observed and projected corners
+    view_errors: (V,) root mean square corner error of each view
+    rms: root mean square corner error over all views
+    """
+
+    def __init__(self, image_points, projected):
+        self.residuals = as_views(image_points, 2) - projected
+        squared = np.sum(self.residuals * self.residuals, axis=-1)
+        self.corner_errors = np.sqrt(squared)
+        self.view_errors = np.sqrt(np.mean(squared, axis=1))
+        self.rms = float(np.sqrt(np.mean(squared)))
+
+    def __len__(self):
+        return len(self.view_errors)
+
+    def worst(self, count=1):
+        """indices of the `count` views with the largest error, worst first"""
+        return np.argsort(self.view_errors)[::-1][:count]
+
+    def __repr__(self):
+        return f"ReprojectionErrors(views={len(self)}, rms={self.rms:.4f})"
+
+
+def evaluate_pinhole(
+    object_points,
+    image_points,
+    rvecs,
+    tvecs,
+    camera_matrix,
+    distortion,
+) -> ReprojectionErrors:
+    """reprojection errors of all views of a pinhole calibration"""
+
+    projected = project_pinhole(
+        as_views(object_points, 3), rvecs, tvecs, camera_matrix, distortion
+    )
+    return ReprojectionErrors(image_points, projected)
+
+
+def evaluate_fisheye(object_points, image_points, rvecs, tvecs, K, D):
+    """reprojection errors of all views of a fisheye calibration"""
+
+    projected = project_fisheye(as_views(object_points, 3), rvecs, tvecs, K, D)
+    return ReprojectionErrors(image_points, projected)
@@ -0,0 +1,157 @@
+"""
+Pick a small, pose diverse set of calibration views.
+
+Calibration time grows quickly with the number of views, but a handful of
+views that cover the whole image area, a range of board tilts and distances
+constrain the camera model as well as a large random set. Views are described
+by a few cheap features computed from the outer corners of each detected board
+and picked greedily so each new view is the one least like those already
+picked.
+"""
+
+import random
+from typing import List
+
+import numpy as np
+
+# clip standardized features so a single bad detection does not get picked
+# just because it is far away from everything else
+OUTLIER_CLIP = 3.0
+
+SELECTION_METHODS = ("diverse", "random")
+
+
+def outer_corners(image_points, chessboard_size):
+    """
+    The four outer corners of every board, in order top left, top right,
+    bottom right, bottom left as seen in the corner ordering of findChessboardCorners
+    """
+
+    points = np.asarray(image_points, dtype=np.float64)
+    points = points.reshape(len(points), -1, 2)
+    columns = chessboard_size[0]
+    last = points.shape[1] - 1
+    return points[:, [0, columns - 1, last, last - columns + 1], :]
+
+
+def view_features(image_points, image_size, chessboard_size):
+    """
+    Describe each view by position, scale and tilt of the board in the image.
+
+    Returns a (views, 6) array: board centre x and y as fraction of the image,
+    board size relative to the image, the log ratio of opposing edge lengths
+    that grows with tilt around either board axis, and in-plane rotation.
+    """
+
+    w, h = image_size
+    quad = outer_corners(image_points, chessboard_size)
+    tl, tr, br, bl = (quad[:, i, :] for i in range(4))
+
+    centre = quad.mean(axis=1) / (w, h)
+
+    # shoelace area of the board outline
+    x, y = quad[:, :, 0], quad[:, :, 1]
+    area = 0.5 * np.abs(
+        np.sum(x * np.roll(y, -1, axis=1) - y * np.roll(x, -1, axis=1), axis=1)
+    )
+    scale = np.sqrt(area / (w * h))
+
+    def length(a, b):
+        return np.linalg.norm(a - b, axis=1) + 1e-9
+
+    # perspective foreshortening shrinks the far edge of a tilted board
+    tilt_x = np.log(length(tl, tr) / length(bl, br))
+    tilt_y = np.log(length(tl, bl) / length(tr, br))
+
+    top = tr - tl
+    roll = np.arctan2(top[:, 1], top[:, 0])
+
+    return np.column_stack((centre, scale, tilt_x, tilt_y, roll))
+
+
+def select_diverse(features, pick_size) -> List[int]:
+    """
+    Greedy farthest point selection of `pick_size` rows of `features`.
+
+    Starts with the view closest to the average pose and repeatedly adds the
+    view furthest from all views picked so far. Returns the picked indices.
+    """
+
+    features = np.asarray(features, dtype=np.float64)
+    count = len(features)
+    if pick_size >= count:
+        return list(range(count))
+
+    spread = features.std(axis=0)
+    spread[spread == 0] = 1
+    normal = np.clip(
+        (features - features.mean(axis=0)) / spread, -OUTLIER_CLIP, OUTLIER_CLIP
+    )
+
+    distance = np.linalg.norm(normal, axis=1)
+    picked = [int(np.argmin(distance))]
+    distance = np.linalg.norm(normal - normal[picked[0]], axis=1)
+    for _ in range(pick_size - 1):
+        pick = int(np.argmax(distance))
+        picked.append(pick)
+        distance = np.minimum(distance, np.linalg.norm(normal - normal[pick], axis=1))
+
+    return sorted(picked)
+
+
+def select_views(
+    image_points,
+    image_size,
+    chessboard_size,
+    pick_size,
+    paired_points=None,
+) -> List[int]:
+    """
+    indices of a pose diverse subset of `pick_size` calibration views, for a
+    stereo rig pass the other eye as `paired_points` to pick the same pairs
+    """
+
+    features = view_features(image_points, image_size, chessboard_size)
+    if paired_points is not None:
+        features = np.hstack(
+            (features, view_features(paired_points, image_size, chessboard_size))
+        )
+    return select_diverse(features, pick_size)
+
+
+def select_random(count, pick_size, salt) -> List[int]:
+    """indices of a random subset of `pick_size` views, without repeats"""
+
+    random.seed(salt)
+    return sorted(random.sample(range(count), k=min(pick_size, count)))
+
+
+def select(
+    image_points,
+    image_size,
+    chessboard_size,
+    pick_size,
+    method="diverse",
+    salt=888,
+    paired_points=None,
+) -> List[int]:
+    """indices of the views to calibrate on, picked using `method`"""
+
+    if method == "diverse":
+        return select_views(
+            image_points=image_points,
+            image_size=image_size,
+            chessboard_size=chessboard_size,
+            pick_size=pick_size,
+            paired_points=paired_points,
+        )
+    elif method == "random":
+        return select_random(len(image_points), pick_size=pick_size, salt=salt)
+    else:
+        raise ValueError(f"{method} is not a known selection method")
+
+
+def pick(points, indices):
+    """take the views at indices from a list or array of per view points"""
+
+    return [points[i] for i in indices]
@@ -0,0 +1,175 @@
+"""
+Remap tables stored on a coarse grid.
+
+A dense fixed point map costs 6 bytes per output pixel, on a box with many
+streams that adds up quickly. The distortion mapping is smooth, so it is
+stored here only at the centre of every `step` x `step` block, a few tens of
+kilobytes per camera, and expanded bilinearly one strip of rows at a time
+while remapping. The first few strips can optionally be kept expanded, in fixed
+point, trading some of the saved memory back for speed.
+"""
+
+import time
+from typing import Dict
+
+import cv2 as cv
+import numpy as np
+
+from .maps import map_bytes
+
+# rows of output expanded and remapped at a time
+STRIP_ROWS = 64
+
+
+class SparseMap:
+    """
+    Source position of the centre of every `step` sized block of an output of
+    `size` (w, h), with a ring of extra nodes around the edge so the borders
+    interpolate rather than clamp.
+    """
+
+    def __init__(self, grid, size, step, cached_strips=0):
+        self.grid = np.ascontiguousarray(grid, dtype=np.float32)
+        self.size = tuple(size)
+        self.step = step
+        self.cached_strips = cached_strips
+        self._strips: Dict[int, tuple] = {}
+
+    @classmethod
+    def from_function(cls, source, size, step=16, cached_strips=0):
+        """
+        sparse map of a transform from output pixel positions (N, 2) to the
+        source positions (N, 2) they are sampled from
+        """
+
+        w, h = size
+        columns = -(-w // step) + 2
+        rows = -(-h // step) + 2
+        # node k sits at the centre of block k - 1, the way cv.resize samples
+        x = (np.arange(columns) - 0.5) * step - 0.5
+        y = (np.arange(rows) - 0.5) * step - 0.5
+        nodes = np.stack(np.meshgrid(x, y), axis=-1).reshape(-1, 2)
+        grid = np.asarray(source(nodes)).reshape(rows, columns, 2)
+        return cls(grid, size, step, cached_strips=cached_strips)
+
+    @property
+    def nbytes(self):
+        return self.grid.nbytes + sum(map_bytes(*s) for s in self._strips.values())
+
+    def expand(self, top, bottom):
+        """dense float map (bottom - top, w, 2) of output rows top to bottom"""
+
+        step = self.step
+        w = self.size[0]
+        # grid rows around the strip, expanded then cut down to the strip
+        first = top // step
+        last = -(-bottom // step) + 2
+        block = self.grid[first:last]
+        expanded = cv.resize(
+            block,
+            (block.shape[1] * step, block.shape[0] * step),
+            interpolation=cv.INTER_LINEAR,
+        )
+        # output pixel (x, y) is expanded pixel (x + step, y - (first - 1) * step)
+        start = top - (first - 1) * step
+        return expanded[start : start + bottom - top, step : step + w]
+
+    def strip(self, top, bottom):
+        """
+        (map1, map2) of a strip, kept once expanded until `cached_strips` are
+        held. Strips are visited in order every frame, so keeping a fixed set
+        beats evicting the least recently used one, which would never hit.
+        """
+
+        strip = self._strips.get(top)
+        if strip is not None:
+            return strip
+        expanded = self.expand(top, bottom)
+        if len(self._strips) >= self.cached_strips:
+            return expanded, None
+        strip = cv.convertMaps(expanded, None, cv.CV_16SC2)
+        self._strips[top] = strip
+        return strip
+
+    def dense(self):
+        """the full dense float map"""
+        return np.ascontiguousarray(self.expand(0, self.size[1]))
+
+    def remap(self, img, interpolation=cv.INTER_LINEAR, dst=None, rows=STRIP_ROWS):
+        """remap img strip by strip into dst, or a new image"""
+
+        w, h = self.size
+        if dst is None:
+            dst = np.empty((h, w) + img.shape[2:], dtype=img.dtype)
+        for top in range(0, h, rows):
+            map1, map2 = self.strip(top, min(top + rows, h))
+            cv.remap(
+                src=img,
+                map1=map1,
+                map2=map2,
+                interpolation=interpolation,
+                dst=dst[top : top + len(map1)],
+                borderMode=cv.BORDER_CONSTANT,
+            )
+        return dst
+
+    def __repr__(self):
+        return (
+            f"SparseMap(size={self.size}, step={self.step}, "
+            f"KiB={self.nbytes / 2 ** 10:.0f})"
+        )
+
+
+def benchmark(img, dense_map, source, steps=(8, 16), repeat=10):
+    """
+    Time per frame, map memory and errors of sparse maps against the dense
+    float map (h, w, 2) they approximate, for every step, with none and with
+    half of the strips kept expanded. The dense fixed point map is included
+    for comparison. Position errors are in pixels of the source image, pixel
+    errors are absolute value differences to remapping with the float map.
+    """
+
+    h, w = dense_map.shape[:2]
+    reference = cv.remap(img, dense_map, None, cv.INTER_LINEAR).astype(np.float32)
+
+    def measure(name, remap, nbytes, positions):
+        out = remap()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            remap()
+        cost = (time.perf_counter() - start) / repeat
+        position_error = np.linalg.norm(positions - dense_map, axis=-1)
+        error = np.abs(out.astype(np.float32) - reference)
+        return dict(
+            name=name,
+            cost=cost,
+            map_bytes=nbytes(),
+            mean_position_error=float(position_error.mean()),
+            max_position_error=float(position_error.max()),
+            mean_error=float(error.mean()),
+            max_error=float(error.max()),
+        )
+
+    fixed = cv.convertMaps(dense_map, None, cv.CV_16SC2)
+    results = [
+        measure(
+            "dense fixed",
+            lambda: cv.remap(img, *fixed, cv.INTER_LINEAR),
+            lambda: map_bytes(*fixed),
+            cv.convertMaps(*fixed, cv.CV_32FC2)[0],
+        )
+    ]
+    strips = -(-h // STRIP_ROWS)
+    for step in steps:
+        for cached in (0, strips // 2):
+            sparse = SparseMap.from_function(source, (w, h), step, cached_strips=cached)
+            name = f"sparse {step}px" + (", half cached" if cached else "")
+            results.append(
+                measure(
+                    name,
+                    lambda: sparse.remap(img),
+                    lambda: sparse.nbytes,
+                    sparse.dense(),
+                )
+            )
+    return results
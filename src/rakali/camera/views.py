@@ -0,0 +1,266 @@
+"""
+Virtual views cut from a calibrated fisheye camera.
+
+A fisheye lens sees far more than a single rectilinear undistortion can show.
+Each virtual view here describes the direction of the ray behind every one of
+its pixels, perspective views for pan, tilt and zoom, and equirectangular and
+cylindrical views for panoramas. The rays are projected through the fisheye
+model of the calibration once to build a remap table per view, after which
+every view is a single remap of the decoded frame. The ViewEngine renders all
+views of a frame concurrently and only rebuilds the table of a view whose
+parameters changed.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import numpy as np
+
+from . import maps
+from .fisheye import load_calibration
+from .map_cache import MapCache
+
+logger = logging.getLogger(__name__)
+
+# rays further than this from the optical axis are not shown, the polynomial
+# distortion model is not valid far beyond the field of view it was fitted on
+MAX_FOV = 200
+
+
+def rotation(yaw, pitch, roll=0):
+    """
+    rotation from view to camera coordinates, yaw turns the view right, pitch
+    tilts it up and roll turns it clockwise, all in degrees
+    """
+
+    y, p, r = np.radians((yaw, pitch, roll))
+    Ry = np.array([[np.cos(y), 0, np.sin(y)], [0, 1, 0], [-np.sin(y), 0, np.cos(y)]])
+    Rx = np.array([[1, 0, 0], [0, np.cos(p), -np.sin(p)], [0, np.sin(p), np.cos(p)]])
+    Rz = np.array([[np.cos(r), -np.sin(r), 0], [np.sin(r), np.cos(r), 0], [0, 0, 1]])
+    return Ry @ Rx @ Rz
+
+
+def fisheye_pixels(rays, K, D, max_fov=MAX_FOV):
+    """
+    project (..., 3) rays with the fisheye model, rays outside `max_fov`
+    degrees map to (-1, -1) so remap leaves them black. Unlike
+    cv.fisheye.projectPoints this handles rays at and beyond 90 degrees.
+    """
+
+    x, y, z = rays[..., 0], rays[..., 1], rays[..., 2]
+    r = np.sqrt(x * x + y * y)
+    theta = np.arctan2(r, z)
+    k1, k2, k3, k4 = np.asarray(D, dtype=np.float64).ravel()[:4]
+    theta2 = theta * theta
+    theta_d = theta * (1 + theta2 * (k1 + theta2 * (k2 + theta2 * (k3 + theta2 * k4))))
+    scale = np.where(r > 1e-12, theta_d / np.where(r > 1e-12, r, 1.0), 0.0)
+    xd = x * scale
+    yd = y * scale
+    u = K[0, 0] * xd + K[0, 1] * yd + K[0, 2]
+    v = K[1, 1] * yd + K[1, 2]
+    outside = theta > np.radians(max_fov) / 2
+    u[outside] = -1
+    v[outside] = -1
+    return u.astype(np.float32), v.astype(np.float32)
+
+
+class VirtualView(ABC):
+    """a view of `size` (w, h) looking in the direction given by yaw, pitch and roll"""
+
+    kind = "view"
+
+    def __init__(self, name, size, yaw=0.0, pitch=0.0, roll=0.0):
+        self.name = name
+        self.size = tuple(size)
+        self.yaw = yaw
+        self.pitch = pitch
+        self.roll = roll
+
+    def parameters(self) -> dict:
+        """everything that determines the rays of the view"""
+        return {k: v for k, v in vars(self).items() if k != "name"}
+
+    def update(self, **parameters):
+        """change view parameters"""
+        for name, value in parameters.items():
+            if name == "name" or not hasattr(self, name):
+                raise ValueError(f"{self.kind} view has no parameter {name}")
+            setattr(self, name, tuple(value) if name == "size" else value)
+
+    @abstractmethod
+    def directions(self, u, v):
+        """(h, w, 3) ray directions in view coordinates of pixels u, v"""
+
+    def rays(self):
+        """(h, w, 3) ray directions in camera coordinates"""
+
+        w, h = self.size
+        u, v = np.meshgrid(np.arange(w, dtype=np.float64), np.arange(h))
+        R = rotation(self.yaw, self.pitch, self.roll)
+        return self.directions(u, v) @ R.T
+
+    def __repr__(self):
+        parameters = ", ".join(f"{k}={v}" for k, v in self.parameters().items())
+        return f"{type(self).__name__}({self.name}, {parameters})"
+
+
+class PerspectiveView(VirtualView):
+    """a pinhole camera with horizontal field of view `fov` degrees"""
+
+    kind = "perspective"
+
+    def __init__(self, name, size, yaw=0.0, pitch=0.0, roll=0.0, fov=90.0):
+        super().__init__(name, size, yaw, pitch, roll)
+        self.fov = fov
+
+    def directions(self, u, v):
+        w, h = self.size
+        f = (w / 2) / np.tan(np.radians(self.fov) / 2)
+        x = (u - (w - 1) / 2) / f
+        y = (v - (h - 1) / 2) / f
+        return np.stack((x, y, np.ones_like(x)), axis=-1)
+
+
+class EquirectangularView(VirtualView):
+    """longitude and latitude spaced evenly over `fov` and `vfov` degrees"""
+
+    kind = "equirectangular"
+
+    def __init__(self, name, size, yaw=0.0, pitch=0.0, roll=0.0, fov=180.0, vfov=90.0):
+        super().__init__(name, size, yaw, pitch, roll)
+        self.fov = fov
+        self.vfov = vfov
+
+    def directions(self, u, v):
+        w, h = self.size
+        longitude = np.radians(self.fov) * ((u + 0.5) / w - 0.5)
+        latitude = np.radians(self.vfov) * ((v + 0.5) / h - 0.5)
+        return np.stack(
+            (
+                np.cos(latitude) * np.sin(longitude),
+                np.sin(latitude),
+                np.cos(latitude) * np.cos(longitude),
+            ),
+            axis=-1,
+        )
+
+
+class CylindricalView(VirtualView):
+    """longitude spaced evenly over `fov` degrees, straight verticals"""
+
+    kind = "cylindrical"
+
+    def __init__(self, name, size, yaw=0.0, pitch=0.0, roll=0.0, fov=180.0):
+        super().__init__(name, size, yaw, pitch, roll)
+        self.fov = fov
+
+    def directions(self, u, v):
+        w, h = self.size
+        f = w / np.radians(self.fov)
+        longitude = (u + 0.5 - w / 2) / f
+        y = (v - (h - 1) / 2) / f
+        return np.stack((np.sin(longitude), y, np.cos(longitude)), axis=-1)
+
+
+class ViewEngine:
+    """
+    Renders a set of virtual views from the frames of a calibrated fisheye
+    camera. Remap tables are built when a view is added or changed, all views
+    are rendered concurrently from each frame.
+    """
+
+    def __init__(
+        self,
+        calibration,
+        frame_size,
+        workers: Optional[int] = None,
+        map_type="fixed",
+        max_fov=MAX_FOV,
+        cache: Optional[MapCache] = None,
+    ):
+        w, h = frame_size
+        image_size = calibration["image_size"]
+        assert (
+            w / h == image_size[0] / image_size[1]
+        ), "Frames need to have same aspect ratio as the ones used in calibration"
+        # The values of K is to scale with image dimension.
+        self.K = np.asarray(calibration["K"], dtype=np.float64) * w / image_size[0]
+        self.K[2][2] = 1.0
+        self.D = np.asarray(calibration["D"], dtype=np.float64)
+        self.frame_size = tuple(frame_size)
+        self.map_type = map_type
+        self.max_fov = max_fov
+        self.cache = cache
+        self.views: Dict[str, VirtualView] = {}
+        self.maps: Dict[str, tuple] = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    @classmethod
+    def from_file(cls, calibration_file, frame_size, **kwargs):
+        """engine for a fisheye calibration file"""
+        return cls(load_calibration(calibration_file), frame_size, **kwargs)
+
+    def add(self, view: VirtualView):
+        """add or replace a view, its map is built on the next render"""
+        self.views[view.name] = view
+        self.maps.pop(view.name, None)
+
+    def remove(self, name):
+        self.views.pop(name)
+        self.maps.pop(name, None)
+
+    def update(self, name, **parameters):
+        """change the parameters of a view, only its map is rebuilt"""
+        self.views[name].update(**parameters)
+        self.maps.pop(name, None)
+
+    def build(self, view: VirtualView):
+        """remap tables of a view"""
+
+        def compute():
+            u, v = fisheye_pixels(view.rays(), self.K, self.D, self.max_fov)
+            return maps.convert_maps(u, v, self.map_type)
+
+        if self.cache is None:
+            return compute()
+        return self.cache.get(
+            compute,
+            kind=view.kind,
+            K=self.K,
+            D=self.D,
+            max_fov=self.max_fov,
+            map_type=self.map_type,
+            **view.parameters(),
+        )
+
+    def _build_stale(self):
+        stale = [name for name in self.views if name not in self.maps]
+        if stale:
+            logger.debug(f"Building maps for views {stale}")
+            built = self.pool.map(lambda name: self.build(self.views[name]), stale)
+            self.maps.update(zip(stale, built))
+
+    def render(self, frame) -> Dict[str, np.ndarray]:
+        """all views of a frame, by view name"""
+
+        if frame.shape[1::-1] != self.frame_size:
+            raise ValueError(
+                f"Frame size {frame.shape[1::-1]} is not the engine frame size {self.frame_size}"
+            )
+        self._build_stale()
+        names = list(self.views)
+        rendered = self.pool.map(
+            lambda name: maps.remap(frame, *self.maps[name]), names
+        )
+        return dict(zip(names, rendered))
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
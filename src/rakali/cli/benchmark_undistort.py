@@ -0,0 +1,141 @@
+"""
+Compare undistortion map formats and interpolations on a calibrated camera
+"""
+
+import sys
+from pathlib import Path
+
+import click
+import cv2 as cv
+from rakali.camera import fisheye, maps, pinhole, sparse_maps
+from tabulate import tabulate
+
+
+@click.command(context_settings=dict(max_content_width=120))
+@click.version_option()
+@click.argument(
+    "image-path",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--calibration-file",
+    help="Camera calibration data, fisheye .json or pinhole .npz",
+    default="fisheye_calibration.json",
+    type=click.Path(exists=True),
+    show_default=True,
+    required=True,
+)
+@click.option(
+    "-b",
+    "--balance",
+    help="Fisheye balance value 0.0 ~30% pixel loss, 1.0 no loss",
+    default=1.0,
+    show_default=True,
+)
+@click.option(
+    "--repeat",
+    help="Number of timed remaps per setting",
+    default=20,
+    show_default=True,
+)
+@click.option(
+    "-s",
+    "--sparse-step",
+    help="Also measure sparse maps with this grid step, can be repeated",
+    type=int,
+    multiple=True,
+)
+def cli(image_path, calibration_file, balance, repeat, sparse_step):
+    """
+    Measure time per frame, map memory and pixel error against float maps with
+    cubic interpolation, for every map format and interpolation. Sparse maps
+    are measured against the dense float map they approximate.
+    """
+
+    img = cv.imread(image_path)
+    if img is None:
+        click.secho(message=f"Cannot read {image_path}", err=True)
+        sys.exit(1)
+
+    if Path(calibration_file).suffix == ".npz":
+        calibration = pinhole.load_calibration(calibration_file)
+        map1, map2 = pinhole.get_maps(img, calibration, map_type="float")
+        camera = pinhole.CalibratedPinholeCamera(calibration_file)
+    else:
+        calibration = fisheye.load_calibration(calibration_file)
+        if calibration is None:
+            sys.exit(1)
+        map1, map2 = fisheye.get_maps(
+            img=img,
+            image_size=calibration["image_size"],
+            K=calibration["K"],
+            D=calibration["D"],
+            balance=balance,
+            map_type="float",
+        )
+        camera = fisheye.CalibratedFisheyeCamera(
+            calibration_file, balance=balance, cache_maps=False
+        )
+
+    h, w = img.shape[:2]
+    print(f"Remapping {w}x{h} {image_path}, {repeat} times per setting")
+    results = maps.benchmark(img, map1, map2, repeat=repeat)
+    table = [
+        (
+            r["map_type"],
+            r["interpolation"],
+            f"{r['cost'] * 1000:.2f}",
+            f"{r['map_bytes'] / 2 ** 20:.1f}",
+            f"{r['mean_error']:.3f}",
+            f"{r['max_error']:.0f}",
+        )
+        for r in results
+    ]
+    print(
+        tabulate(
+            table,
+            headers=(
+                "maps",
+                "interpolation",
+                "ms/frame",
+                "map MiB",
+                "mean err",
+                "max err",
+            ),
+        )
+    )
+
+    if not sparse_step:
+        return
+    camera.set_map(img)
+    dense_map, _ = maps.convert_maps(map1, map2, "float2")
+    print("\nSparse maps against the dense float map, linear interpolation")
+    results = sparse_maps.benchmark(
+        img, dense_map, camera.distort_points, steps=sparse_step, repeat=repeat
+    )
+    table = [
+        (
+            r["name"],
+            f"{r['cost'] * 1000:.2f}",
+            f"{r['map_bytes'] / 2 ** 10:.0f}",
+            f"{r['mean_position_error']:.3f}",
+            f"{r['max_position_error']:.3f}",
+            f"{r['mean_error']:.3f}",
+            f"{r['max_error']:.0f}",
+        )
+        for r in results
+    ]
+    print(
+        tabulate(
+            table,
+            headers=(
+                "maps",
+                "ms/frame",
+                "map KiB",
+                "mean px off",
+                "max px off",
+                "mean err",
+                "max err",
+            ),
+        )
+    )
@@ -3,14 +3,13 @@ Calibrate fisheye camera given set of chessboard images
 """
 
 import logging
-import random
 import sys
 from pathlib import Path
 
 import click
 
 # from rakali.camera.fisheye import save_calibration
-from rakali.camera import chessboard, fisheye
+from rakali.camera import chessboard, fisheye, multistart, selection
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -73,6 +72,26 @@ logger = logging.getLogger(__name__)
     default="fisheye",
     show_default=True,
 )
+@click.option(
+    "--selection",
+    "method",
+    help="How to pick the calibration image set from the available set",
+    type=click.Choice(selection.SELECTION_METHODS),
+    default="diverse",
+    show_default=True,
+)
+@click.option(
+    "--starts",
+    help="Number of calibrations to run concurrently over different image sets, keeping the best",
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--rejection-rounds",
+    help="Rounds of dropping the worst images and calibrating again",
+    default=3,
+    show_default=True,
+)
 def cli(
     input_folder,
     image_points_file,
@@ -83,6 +102,9 @@ def cli(
     salt,
     pick_size,
     cid,
+    method,
+    starts,
+    rejection_rounds,
 ):
     """
     Calibrate fish-eye camera using chessboard frames captured earlier.
@@ -121,21 +143,42 @@ def cli(
             chessboard_size=chessboard_size,
         )
 
-    # reduce points list else calibration takes too long
-    random.seed(salt)
-    image_points = random.choices(image_points, k=pick_size)
-    object_points = object_points[:pick_size]
-
-    rms, K, D = fisheye.calibrate(
+    # calibrate on smaller sets that cover the poses in the full set well, as
+    # calibration time grows quickly with the number of views. The first set
+    # is picked using the selection method, the others are random.
+    subsets = multistart.start_subsets(
+        image_points=image_points,
+        image_size=image_size,
+        chessboard_size=chessboard_size,
+        pick_size=pick_size,
+        starts=starts,
+        method=method,
+        salt=salt,
+    )
+    result = multistart.calibrate_fisheye(
         object_points=object_points,
         image_points=image_points,
         image_size=image_size,
+        subsets=subsets,
+        max_rounds=rejection_rounds,
     )
+    if result.best is None:
+        click.secho(message="Calibration failed from all starts", err=True)
+        sys.exit()
+    result.print()
+
+    rms = result.best.rms
+    K = result.best.model["K"]
+    D = result.best.model["D"]
+    rvecs = result.best.model["rvecs"]
+    tvecs = result.best.model["tvecs"]
 
     fisheye.save_calibration(
         calibration_file,
         K=K,
         D=D,
+        rvecs=rvecs,
+        tvecs=tvecs,
         image_size=image_size,
         salt=salt,
         pick_size=pick_size,
@@ -3,12 +3,11 @@ Calibrate stereo fisheye camera rig given pairs of left/right chessboard images
 """
 
 import logging
-import random
 import sys
 from pathlib import Path
 
 import click
-from rakali.camera import chessboard, fisheye, fisheye_stereo
+from rakali.camera import chessboard, fisheye, fisheye_stereo, selection
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -83,6 +82,26 @@ logger = logging.getLogger(__name__)
     default=False,
     show_default=True,
 )
+@click.option(
+    "--selection",
+    "method",
+    help="How to pick the calibration image pairs from the available set",
+    type=click.Choice(selection.SELECTION_METHODS),
+    default="diverse",
+    show_default=True,
+)
+@click.option(
+    "--starts",
+    help="Number of stereo calibrations to run concurrently over resampled image pairs, keeping the best",
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--rejection-rounds",
+    help="Rounds of dropping the worst image pairs and calibrating again",
+    default=3,
+    show_default=True,
+)
 def cli(
     input_folder,
     left_image_points_file,
@@ -95,6 +114,9 @@ def cli(
     pick_size,
     cid,
     prefilter,
+    method,
+    starts,
+    rejection_rounds,
 ):
     """
     Calibrate fish-eye stereo camera rig using chessboard frames captured earlier.
@@ -122,9 +144,8 @@ def cli(
             chessboard_size=chessboard_size,
         )
 
-    # calibrate each eye on it own, and then use the individual eye calibration
-    # to perform a stereo calibration
-    stereo_calibration = dict(chessboard_size=chessboard_size)
+    # gather the chessboard corners for each eye
+    points = {}
     for side, image_points_file in zip(
         ("left", "right"), (left_image_points_file, right_image_points_file)
     ):
@@ -150,11 +171,27 @@ def cli(
                 image_size=image_size,
                 chessboard_size=chessboard_size,
             )
+        points[side] = (object_points, image_points)
 
-        # reduce points list else calibration takes too long
-        random.seed(salt)
-        image_points = random.choices(image_points, k=pick_size)
-        object_points = object_points[:pick_size]
+    # calibrate on a smaller set that covers the poses in the full set well,
+    # picking the same pairs for both eyes
+    picked = selection.select(
+        image_points=points["left"][1],
+        paired_points=points["right"][1],
+        image_size=image_size,
+        chessboard_size=chessboard_size,
+        pick_size=pick_size,
+        method=method,
+        salt=salt,
+    )
+
+    # calibrate each eye on it own, and then use the individual eye calibration
+    # to perform a stereo calibration
+    stereo_calibration = dict(chessboard_size=chessboard_size)
+    for side in ("left", "right"):
+        object_points, image_points = points[side]
+        image_points = selection.pick(image_points, picked)
+        object_points = selection.pick(object_points, picked)
 
         rms, K, D, rvecs, tvecs = fisheye.calibrate(
             object_points=object_points,
@@ -174,7 +211,15 @@ def cli(
         print(f"Calibrated {side} camera, error: {rms}")
 
     # perform stereo calibration using individual calibrations
-    stereo_calibration_parameters = fisheye_stereo.stereo_calibrate(stereo_calibration)
+    stereo_calibration_parameters = fisheye_stereo.stereo_calibrate(
+        stereo_calibration,
+        starts=starts,
+        max_rounds=rejection_rounds,
+        salt=salt,
+    )
+    if stereo_calibration_parameters is None:
+        click.secho(message="Stereo calibration failed", err=True)
+        sys.exit()
 
     print(f"DIM={image_size}")
     for side in ("left", "right"):
@@ -3,14 +3,13 @@ Calibrate pinhole camera given set of chessboard images
 """
 
 import logging
-import random
 import sys
 from pathlib import Path
 
 import click
 import cv2 as cv
 import numpy as np
-from rakali.camera import pinhole
+from rakali.camera import chessboard, multistart, pinhole, selection
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -28,7 +27,7 @@ logger = logging.getLogger(__name__)
 @click.option(
     "--image-points-file",
     help="Corner points data",
-    default="image_points.npz",
+    default="pinhole_image_points.json",
     show_default=True,
 )
 @click.option(
@@ -67,6 +66,32 @@ logger = logging.getLogger(__name__)
     default=50,
     show_default=True,
 )
+@click.option(
+    "--cid",
+    help="Calibration ID to associate a calibration file with a device",
+    default="pinhole",
+    show_default=True,
+)
+@click.option(
+    "--selection",
+    "method",
+    help="How to pick the calibration image set from the available set",
+    type=click.Choice(selection.SELECTION_METHODS),
+    default="diverse",
+    show_default=True,
+)
+@click.option(
+    "--starts",
+    help="Number of calibrations to run concurrently over different image sets, keeping the best",
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--rejection-rounds",
+    help="Rounds of dropping the worst images and calibrating again",
+    default=3,
+    show_default=True,
+)
 def cli(
     input_folder,
     image_points_file,
@@ -76,6 +101,10 @@ def cli(
     square_size,
     salt,
     pick_size,
+    cid,
+    method,
+    starts,
+    rejection_rounds,
 ):
     """
     Calibrate pinhole camera using chessboard frames captured earlier.
@@ -94,7 +123,7 @@ def cli(
     chessboard_size = (chessboard_columns, chessboard_rows)
 
     # use previously computed image points if they are available
-    exiting_points = pinhole.load_image_points_file(image_points_file)
+    exiting_points = chessboard.load_image_points_file(image_points_file)
     if exiting_points:
         object_points, image_points, image_size = exiting_points
     else:
@@ -102,31 +131,51 @@ def cli(
             object_points,
             image_points,
             image_size,
-        ) = pinhole.get_points_from_chessboard_images(
+        ) = chessboard.get_points_from_chessboard_images(
             boards_path=input_folder,
             chessboard_size=chessboard_size,
             square_size=square_size,
         )
-        pinhole.save_image_points_file(
+        chessboard.save_image_points_file(
             save_file=image_points_file,
             object_points=object_points,
             image_points=image_points,
             image_size=image_size,
+            chessboard_size=chessboard_size,
         )
 
     w, h = image_size
     assert w > h
 
-    # reduce points list else calibration takes too long
-    random.seed(salt)
-    image_points = random.choices(image_points, k=pick_size)
-    object_points = object_points[:pick_size]
-
-    matrix, dist_coeff, rotation, translation = pinhole.calibrate(
+    # calibrate on smaller sets that cover the poses in the full set well, as
+    # calibration time grows quickly with the number of views. The first set
+    # is picked using the selection method, the others are random.
+    subsets = multistart.start_subsets(
+        image_points=image_points,
+        image_size=image_size,
+        chessboard_size=chessboard_size,
+        pick_size=pick_size,
+        starts=starts,
+        method=method,
+        salt=salt,
+    )
+    result = multistart.calibrate_pinhole(
         object_points=object_points,
         image_points=image_points,
         image_size=image_size,
+        subsets=subsets,
+        max_rounds=rejection_rounds,
     )
+    if result.best is None:
+        click.secho(message="Calibration failed from all starts", err=True)
+        sys.exit()
+    result.print()
+
+    matrix = result.best.model["camera_matrix"]
+    dist_coeff = result.best.model["distortion_coefficients"]
+    rotation = result.best.model["rotation"]
+    translation = result.best.model["translation"]
+    error = result.best.rms
 
     new_camera_matrix, roi = cv.getOptimalNewCameraMatrix(
         cameraMatrix=matrix,
@@ -136,10 +185,6 @@ def cli(
         newImgSize=image_size,
     )
 
-    error = pinhole.reprojection_error(
-        object_points, image_points, rotation, translation, matrix, dist_coeff
-    )
-
     pinhole.save_calibration(
         calibration_file,
         camera_matrix=matrix,
@@ -151,6 +196,8 @@ def cli(
         salt=salt,
         pick_size=pick_size,
         error=error,
+        cid=cid,
+        image_size=image_size,
     )
 
     click.secho(message=f"Calibration error: {error}")
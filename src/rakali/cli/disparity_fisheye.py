@@ -12,6 +12,10 @@ from rakali.camera.fisheye_stereo import (
     CalibratedStereoFisheyeCamera,
     calibration_labels,
 )
+from rakali.frame import Frame
+
+# resolution of the rectified pair the disparity is computed on
+DISPARITY_SCALE = 0.5
 
 
 @click.command(context_settings=dict(max_content_width=120))
@@ -55,12 +59,14 @@ def cli(image_number, chessboards_folder, calibration_file, balance, scale):
     # get matching pair of images from folder
     left_frame, right_frame = get_frames(chessboards_folder, image_number)
 
-    # get calibrated stereo rig
+    # get calibrated stereo rig, rectifying at the half resolution the
+    # disparity is computed at, which saves a pyrDown of full sized pairs
     camera = CalibratedStereoFisheyeCamera(
         calibration_file=calibration_file,
         balance=balance,
         dim2=None,
         dim3=None,  # remember we have these
+        scale=DISPARITY_SCALE,
     )
 
     # set correction maps
@@ -74,9 +80,9 @@ def cli(image_number, chessboards_folder, calibration_file, balance, scale):
     right_frame = add_calib_info(camera, right_frame, "right")
 
     # display them
-    original = np.hstack((left_frame, right_frame))
-    corrected = np.hstack(rectified)
-    quad = transforms.scale(np.vstack((original, corrected)), scale)
+    original = transforms.scale(np.hstack((left_frame, right_frame)), scale)
+    corrected = transforms.scale(np.hstack(rectified), scale / DISPARITY_SCALE)
+    quad = np.vstack((original, corrected))
     cv.imshow("Original and corrected", quad)
 
     # stereo = cv.StereoBM_create(numDisparities=16 * 4, blockSize=15)
@@ -91,7 +97,8 @@ def cli(image_number, chessboards_folder, calibration_file, balance, scale):
 
 class DisparityTuner:
     def __init__(self, pair, camera):
-        self.rectified_pair = pair
+        # grey pair made once, not on every refresh
+        self.rectified_pair = [Frame(frame) for frame in pair]
         self.camera = camera
 
         self.window_size = 8
@@ -176,9 +183,7 @@ class DisparityTuner:
             speckleRange=self.speckle_range,
         )
 
-        l, r = self.rectified_pair
-        l = cv.pyrDown(cv.cvtColor(l, cv.COLOR_BGR2GRAY))
-        r = cv.pyrDown(cv.cvtColor(r, cv.COLOR_BGR2GRAY))
+        l, r = (frame.grey for frame in self.rectified_pair)
         disp = stereo.compute(l, r).astype(np.float32) / 16.0
         cv.imshow("disparity", (disp - self.min_disp) / self.num_disp)
 
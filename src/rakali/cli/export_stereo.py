@@ -0,0 +1,151 @@
+"""
+Export rectified stereo video from recorded stereo fisheye feeds
+"""
+
+import sys
+import time
+from contextlib import ExitStack
+
+import click
+import numpy as np
+from rakali.camera.fisheye_stereo import CalibratedStereoFisheyeCamera
+from rakali.stereo.disparity import DisparityMapper
+from rakali.stereo.reader import StereoFile
+from rakali.video.pipeline import FramePipeline
+from rakali.video.writer import VideoWriter
+
+# frame rate of recordings that do not say
+DEFAULT_FPS = 15
+
+
+@click.command(context_settings=dict(max_content_width=120))
+@click.version_option()
+@click.option(
+    "-l",
+    "--left-source",
+    help="Left eye recording, or a side by side stereo recording",
+    type=click.Path(exists=True),
+    required=True,
+)
+@click.option(
+    "-r",
+    "--right-source",
+    help="Right eye recording, leave out when the left source is side by side",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--calibration-file",
+    help="Stereo camera calibration data",
+    default="fisheye_stereo_calibration.json",
+    type=click.Path(exists=True),
+    show_default=True,
+)
+@click.option(
+    "-b",
+    "--balance",
+    help="Balance value 0.0 ~30% pixel loss, 1.0 no loss",
+    default=0.0,
+    show_default=True,
+)
+@click.option(
+    "-s",
+    "--scale",
+    help="Scale of the rectified frames",
+    default=1.0,
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--output",
+    help="Rectified side by side video file",
+    default="rectified.avi",
+    show_default=True,
+)
+@click.option(
+    "-d",
+    "--disparity-output",
+    help="Also write the disparity of every pair to this video file",
+)
+@click.option(
+    "-w",
+    "--workers",
+    help="Rectifying threads, one per core when 0",
+    default=0,
+    show_default=True,
+)
+@click.option(
+    "--codec",
+    help="Output video codec",
+    default="MJPG",
+    show_default=True,
+)
+def cli(
+    left_source,
+    right_source,
+    calibration_file,
+    balance,
+    scale,
+    output,
+    disparity_output,
+    workers,
+    codec,
+):
+    """
+    Rectify a recorded stereo pair, two eye recordings or one side by side
+    recording, into side by side video and optionally a disparity video
+    """
+
+    camera = CalibratedStereoFisheyeCamera(
+        calibration_file=calibration_file,
+        balance=balance,
+        scale=scale,
+    )
+    if camera.calibration is None:
+        sys.exit(1)
+    mapper = DisparityMapper() if disparity_output else None
+
+    def rectify(frame):
+        left, right = camera.correct(*frame.frames())
+        disparity = mapper.image(left, right) if mapper else None
+        return np.hstack((left, right)), disparity
+
+    start = time.perf_counter()
+    with StereoFile(left_source, right_source) as stereo, ExitStack() as stack:
+        ok, frame = stereo.read()
+        if not ok:
+            click.secho("Cannot read the stereo recording", err=True)
+            sys.exit(1)
+        camera.set_maps(frame.left)
+        pair, disparity = rectify(frame)
+        h, w = pair.shape[:2]
+        fps = stereo.fps or DEFAULT_FPS
+        print(f"Rectifying {w // 2}x{h} pairs into {output}")
+        writer = stack.enter_context(
+            VideoWriter(size=(w, h), file_name=output, fps=fps, codec=codec)
+        )
+        disparity_writer = None
+        if disparity_output:
+            print(f"Writing disparity to {disparity_output}")
+            disparity_writer = stack.enter_context(
+                VideoWriter(
+                    size=(w // 2, h),
+                    file_name=disparity_output,
+                    fps=fps,
+                    color=False,
+                    codec=codec,
+                )
+            )
+
+        def write(rectified):
+            pair, disparity = rectified
+            writer.write(pair)
+            if disparity_writer is not None:
+                disparity_writer.write(disparity)
+
+        write((pair, disparity))
+        pipeline = FramePipeline(rectify, workers=workers or None)
+        pipeline.run(stereo.frames(), write)
+
+    pairs = pipeline.frames + 1
+    seconds = time.perf_counter() - start
+    print(f"Done, {pairs} pairs in {seconds:.1f}s, {pairs / seconds:.1f} fps")
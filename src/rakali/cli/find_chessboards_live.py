@@ -8,11 +8,12 @@ import click
 import cv2 as cv
 from rakali.annotate import add_frame_labels
 from rakali.camera.chessboard import ChessboardFinder
+from rakali.camera.detection import ChessboardDetectionService
 from rakali.video import VideoPlayer, go
 from rakali.video.reader import VideoStream
 
 
-def find_chessboards_in_stream(source, chessboard_size, out_folder):
+def find_chessboards_in_stream(source, chessboard_size, out_folder, workers, budget):
     # accommodate the types of sources
     if source.find("rtsp") >= 0:
         source_path = source
@@ -30,26 +31,42 @@ def find_chessboards_in_stream(source, chessboard_size, out_folder):
     stream = VideoStream(src=source_path)
 
     finder = ChessboardFinder(chessboard_size)
+    detector = ChessboardDetectionService(
+        chessboard_size=chessboard_size,
+        workers=workers,
+        budget=budget,
+    )
     player = VideoPlayer(stream=stream)
 
-    with player, stream:
+    with player, stream, detector:
         count = 0
+        handled = 0
         while go():
             ok, frame = stream.read()
             labels = [f"FPS {stream.read.cost:.6f}s"]
             if ok:
                 display_frame = frame.copy()
-                has_corners, corners = finder.corners(frame)
-                if has_corners:
-                    cv.imwrite(f"{out_path}/{count:05}.jpg", frame)
-                    count += 1
-                    labels.append("CHESSBOARD")
-                    finder.draw(display_frame, corners)
-                else:
-                    labels.append("NO CHESSBOARD FOR YOU")
+                detector.submit(frame)
+                result = detector.poll()
+                if result is not None:
+                    # detection lags the stream a little, save the frame the
+                    # corners were actually found in
+                    if result.frame_id != handled and result.found:
+                        cv.imwrite(f"{out_path}/{count:05}.jpg", result.frame)
+                        count += 1
+                    handled = result.frame_id
+                    if result.found:
+                        labels.append("CHESSBOARD")
+                        finder.draw(display_frame, result.corners)
+                    elif result.timed_out:
+                        labels.append("CHESSBOARD SEARCH TIMED OUT")
+                    else:
+                        labels.append("NO CHESSBOARD FOR YOU")
+                    labels.append(f"find chessboard cost: {result.cost:.3f}s")
 
                 labels.append(
-                    f"find chessboard cost: {finder.has_chessboard.cost:.3f}s"
+                    f"detection latency: {detector.mean_latency():.3f}s, "
+                    f"timeouts: {detector.timeouts}, stale: {detector.abandoned}"
                 )
                 add_frame_labels(display_frame, labels=labels)
                 player.show(display_frame)
@@ -86,7 +103,19 @@ def find_chessboards_in_stream(source, chessboard_size, out_folder):
     default=6,
     show_default=True,
 )
-def cli(source, output_folder, chessboard_rows, chessboard_columns):
+@click.option(
+    "--workers",
+    help="Number of chessboard detection processes",
+    default=2,
+    show_default=True,
+)
+@click.option(
+    "--budget",
+    help="Time budget in seconds to find a chessboard in a frame",
+    default=0.5,
+    show_default=True,
+)
+def cli(source, output_folder, chessboard_rows, chessboard_columns, workers, budget):
     """
     Test each frame in the stream for the presence of a chess-board pattern.
     If found, save to the output folder
@@ -96,4 +125,6 @@ def cli(source, output_folder, chessboard_rows, chessboard_columns):
         source=source,
         chessboard_size=size,
         out_folder=output_folder,
+        workers=workers,
+        budget=budget,
     )
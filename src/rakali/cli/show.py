@@ -5,7 +5,9 @@ from pathlib import Path
 import click
 import cv2 as cv
 
+from ..batch import OPERATIONS, Batch
 from ..img import Image
+from ..skeleton import METHODS
 from ..testimages import rakali
 
 
@@ -86,13 +88,21 @@ def grey(config):
     img.grey().show()
 
 
+@click.option(
+    "-m",
+    "--method",
+    type=click.Choice(METHODS),
+    default="morphological",
+    help="Morphological skeleton or thinning algorithm",
+    show_default=True,
+)
 @cli.command()
 @option_config
-def skeletonize(config):
+def skeletonize(config, method):
     """Skeletonize the input image"""
 
     img: Image = config.img
-    img.skeletonize(kernel_size=(3, 3)).show()
+    img.skeletonize(kernel_size=(3, 3), method=method).show()
     img.write(config.output_file.name)
 
 
@@ -155,3 +165,52 @@ def resize(config, width, height):
         img.write(config.output_file.name)
     else:
         click.echo("No new width or height specified")
+
+
+@click.argument(
+    "output-folder",
+    type=click.Path(),
+)
+@click.argument(
+    "source-folder",
+    type=click.Path(exists=True, file_okay=False),
+)
+@click.option(
+    "--force/--no-force",
+    default=False,
+    help="Redo images whose results are up to date",
+    show_default=True,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.INT,
+    default=0,
+    help="Number of processes, one per core when 0",
+    show_default=True,
+)
+@click.option(
+    "-p",
+    "--operation",
+    "operations",
+    multiple=True,
+    required=True,
+    help=f"Operation to apply, in order, as name or name=value, one of {', '.join(OPERATIONS)}",
+)
+@cli.command()
+@option_config
+def batch(config, source_folder, output_folder, operations, jobs, force):
+    """Apply operations to every image under a folder, without showing them"""
+
+    try:
+        job = Batch(source_folder, output_folder, operations, jobs=jobs or None)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--operation")
+    pairs = job.pending(force)
+    click.echo(f"{len(pairs)} images to do, {job.skipped} up to date")
+    with click.progressbar(length=len(pairs), label="Processing") as bar:
+        job.run(pairs, progress=bar.update)
+    click.echo(
+        f"Done {job.done}, failed {job.failed} in {job.seconds:.1f}s, "
+        f"{job.rate:.1f} images/sec"
+    )
@@ -1,6 +1,7 @@
 import sys
 
 import click
+import cv2 as cv
 import numpy as np
 from rakali import VideoPlayer
 from rakali.annotate import add_frame_labels, colors
@@ -31,7 +32,14 @@ from rakali.video import VideoStream, go
     default=1.0,
     show_default=True,
 )
-def cli(source, calibration_file, balance):
+@click.option(
+    "-f",
+    "--fov-scale",
+    help="Field of view scale, above 1.0 zooms out",
+    default=1.0,
+    show_default=True,
+)
+def cli(source, calibration_file, balance, fov_scale):
     """
     Undistort live video feed from fish-eye lens camera
     """
@@ -41,6 +49,7 @@ def cli(source, calibration_file, balance):
         balance=balance,
         dim2=None,
         dim3=None,  # remember we have these
+        fov_scale=fov_scale,
     )
     stream = VideoStream(src=source)
     player = VideoPlayer()
@@ -53,6 +62,27 @@ def cli(source, calibration_file, balance):
             print("Cannot read video feed")
             sys.exit(0)
 
+        # maps for the values around the current ones are built in the
+        # background while the trackbars are dragged
+        first_frame = frame
+        cv.namedWindow(player.window_name)
+        cv.createTrackbar(
+            "Balance",
+            player.window_name,
+            int(balance * 100),
+            100,
+            lambda value: camera.set_balance(balance=value / 100, frame=first_frame),
+        )
+        cv.createTrackbar(
+            "FOV scale",
+            player.window_name,
+            int(fov_scale * 100),
+            300,
+            lambda value: camera.set_fov_scale(
+                fov_scale=max(value, 10) / 100, frame=first_frame
+            ),
+        )
+
         frame_count = 0
         while go():
             ok, frame = stream.read()
@@ -62,7 +92,7 @@ def cli(source, calibration_file, balance):
                 labels = [
                     f"Reprojected fisheye frame: {frame_count}",
                     f"undistort cost: {camera.correct.cost:6.3f}s",
-                    f"balance: {balance}",
+                    f"balance: {camera.balance:.2f} fov scale: {camera.fov_scale:.2f}",
                     f"cid: {camera.cid} calibrated on {camera.calibration_time_formatted}",
                     # f'dim2 {dim2}',
                     # f'dim3 {dim3}',
@@ -33,7 +33,14 @@ from rakali.camera.fisheye import CalibratedFisheyeCamera
     default=0.5,
     show_default=True,
 )
-def cli(image_path, calibration_file, balance, scale):
+@click.option(
+    "-f",
+    "--fov-scale",
+    help="Field of view scale, above 1.0 zooms out",
+    default=1.0,
+    show_default=True,
+)
+def cli(image_path, calibration_file, balance, scale, fov_scale):
     """
     Rectify a image taken with a fish-eye lens camera using calibration parameters
     """
@@ -45,7 +52,7 @@ def cli(image_path, calibration_file, balance, scale):
         labels = [
             f"Reprojected fisheye frame",
             f"undistort cost: {camera.correct.cost:6.3f}s",
-            f"balance: {camera.balance}",
+            f"balance: {camera.balance:.2f} fov scale: {camera.fov_scale:.2f}",
             f"cid: {camera.cid} calibrated on {camera.calibration_time_formatted}",
             # f'dim2 {dim2}',
             # f'dim3 {dim3}',
@@ -62,11 +69,16 @@ def cli(image_path, calibration_file, balance, scale):
         camera.set_balance(balance=balance / 100, frame=img)
         update()
 
+    def on_fov_scale(fov_scale):
+        camera.set_fov_scale(fov_scale=max(fov_scale, 10) / 100, frame=img)
+        update()
+
     def on_width(width):
         camera.set_size(w=width, h=source_height, frame=img)
         update()
 
     cv.createTrackbar("Balance", window_name, int(balance * 100), 100, on_balance)
+    cv.createTrackbar("FOV scale", window_name, int(fov_scale * 100), 300, on_fov_scale)
     cv.createTrackbar("Width", window_name, 100, 4000, on_width)
 
     camera = CalibratedFisheyeCamera(
@@ -74,6 +86,7 @@ def cli(image_path, calibration_file, balance, scale):
         balance=balance,
         dim2=None,
         dim3=None,  # remember we have these
+        fov_scale=fov_scale,
     )
 
     img = transforms.scale(cv.imread(image_path), scale)
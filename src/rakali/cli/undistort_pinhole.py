@@ -3,12 +3,13 @@ Correct and display pinhole camera video stream
 """
 
 import logging
+import sys
 from pathlib import Path
 
 import click
 from rakali import VideoPlayer
 from rakali.annotate import add_frame_labels, colors
-from rakali.camera.pinhole import CalibratedPinholeCamera
+from rakali.camera.pinhole import CalibratedPinholeCamera, compare_costs
 from rakali.video import VideoFile, go
 
 logging.basicConfig(level=logging.DEBUG)
@@ -31,23 +32,42 @@ logger = logging.getLogger(__name__)
     default="pinhole_calibration.npz",
     show_default=True,
 )
-def cli(source, calibration_file):
+@click.option(
+    "--crop/--no-crop",
+    help="Crop to the region of valid pixels found at calibration",
+    default=False,
+    show_default=True,
+)
+def cli(source, calibration_file, crop):
     """Undistort live feed from pinhole model type camera"""
 
     calibration_path = Path(calibration_file).expanduser()
 
-    camera = CalibratedPinholeCamera(calibration_file=calibration_path)
+    camera = CalibratedPinholeCamera(calibration_file=calibration_path, crop=crop)
+    if camera.calibration is None:
+        sys.exit(1)
     stream = VideoFile(src=str(source))
     player = VideoPlayer()
 
+    speedup = None
     with stream, player:
         while go():
             ok, frame = stream.read()
             if ok:
+                if speedup is None:
+                    reference, mapped = compare_costs(frame, camera.calibration)
+                    speedup = reference / mapped
+                    print(
+                        f"cv.undistort: {reference:6.4f}s, remap: {mapped:6.4f}s, "
+                        f"speedup: {speedup:.1f}x"
+                    )
                 frame = camera.correct(frame)
                 frame = add_frame_labels(
                     frame=frame,
-                    labels=[f"undistort cost: {camera.correct.cost:6.3f}s"],
+                    labels=[
+                        f"undistort cost: {camera.correct.cost:6.3f}s",
+                        f"speedup over cv.undistort: {speedup:.1f}x",
+                    ],
                     color=colors.get("BHP"),
                 )
                 player.show(frame)
@@ -0,0 +1,203 @@
+"""
+Undistort recorded video files in bulk
+"""
+
+import itertools
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import click
+from rakali.camera.fisheye import CalibratedFisheyeCamera
+from rakali.camera.pinhole import CalibratedPinholeCamera
+from rakali.video.pipeline import FramePipeline
+from rakali.video.reader import VideoFile
+from rakali.video.writer import VideoWriter
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SUFFIXES = (".avi", ".mp4", ".mkv", ".mov", ".mjpeg")
+# frame rate of recordings that do not say
+DEFAULT_FPS = 15
+
+
+def recordings(sources):
+    """video files given directly or found in the given folders"""
+
+    for source in map(Path, sources):
+        if source.is_dir():
+            for path in sorted(source.iterdir()):
+                if path.suffix.lower() in VIDEO_SUFFIXES:
+                    yield path
+        else:
+            yield source
+
+
+def destinations(paths, output_folder):
+    """
+    (source, output) pairs, recordings sharing a name are told apart by their
+    format and then by their folder, so no two write the same output
+    """
+
+    paths = list({path.resolve(): path for path in paths}.values())
+    stems = Counter(path.stem for path in paths)
+    # recordings with a name of their own keep it
+    taken = {stem for stem, count in stems.items() if count == 1}
+    tasks = []
+    for path in paths:
+        if stems[path.stem] == 1:
+            tasks.append((path, output_folder / f"{path.stem}.avi"))
+            continue
+        suffix = path.suffix.lstrip(".").lower()
+        names = [
+            f"{path.stem}-{suffix}",
+            f"{path.resolve().parent.name}-{path.stem}-{suffix}",
+        ]
+        name = next((n for n in names if n not in taken), None)
+        if name is None:
+            numbered = (f"{names[-1]}-{i}" for i in itertools.count(1))
+            name = next(n for n in numbered if n not in taken)
+        taken.add(name)
+        tasks.append((path, output_folder / f"{name}.avi"))
+    return tasks
+
+
+def get_camera(calibration_file, balance):
+    """fisheye camera for a .json calibration, pinhole for a .npz one"""
+
+    if Path(calibration_file).suffix == ".npz":
+        return CalibratedPinholeCamera(calibration_file)
+    # the maps are memory mapped from the map cache, so the processes working
+    # on the same camera share their pages
+    return CalibratedFisheyeCamera(calibration_file, balance=balance)
+
+
+def undistort_file(source, destination, calibration_file, balance, workers, codec):
+    """undistort one recording, returns the frames written and seconds taken"""
+
+    camera = get_camera(calibration_file, balance)
+    if camera.calibration is None:
+        raise click.ClickException(f"Cannot load calibration {calibration_file}")
+    try:
+        return _undistort_file(camera, source, destination, workers, codec)
+    finally:
+        if isinstance(camera, CalibratedFisheyeCamera):
+            camera.close()
+
+
+def _undistort_file(camera, source, destination, workers, codec):
+    start = time.perf_counter()
+    with VideoFile(str(source)) as video:
+        ok, frame = video.read()
+        if not ok:
+            logger.warning(f"Cannot read {source}")
+            return 0, 0.0
+        camera.set_map(frame)
+        corrected = camera.correct(frame)
+        h, w = corrected.shape[:2]
+        pipeline = FramePipeline(camera.correct, workers=workers)
+        with VideoWriter(
+            size=(w, h),
+            file_name=str(destination),
+            fps=video.fps or DEFAULT_FPS,
+            codec=codec,
+        ) as writer:
+            writer.write(corrected)
+            pipeline.run(video.frames(), writer.write)
+    return pipeline.frames + 1, time.perf_counter() - start
+
+
+@click.command(context_settings=dict(max_content_width=120))
+@click.version_option()
+@click.argument(
+    "sources",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--calibration-file",
+    help="Camera calibration data, fisheye .json or pinhole .npz",
+    default="fisheye_calibration.json",
+    type=click.Path(exists=True),
+    show_default=True,
+)
+@click.option(
+    "-b",
+    "--balance",
+    help="Fisheye balance value 0.0 ~30% pixel loss, 1.0 no loss",
+    default=1.0,
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--output-folder",
+    help="Folder the undistorted recordings are written to",
+    default="undistorted",
+    type=click.Path(),
+    show_default=True,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    help="Number of recordings undistorted at the same time, each in its own process",
+    default=1,
+    show_default=True,
+)
+@click.option(
+    "-w",
+    "--workers",
+    help="Remap threads per recording, all cores shared between jobs when 0",
+    default=0,
+    show_default=True,
+)
+@click.option(
+    "--codec",
+    help="Output video codec",
+    default="MJPG",
+    show_default=True,
+)
+def cli(sources, calibration_file, balance, output_folder, jobs, workers, codec):
+    """
+    Undistort recorded video files, and the video files in folders, from a
+    calibrated camera
+    """
+
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    tasks = destinations(recordings(sources), output_folder)
+    if any(source.resolve() == out.resolve() for source, out in tasks):
+        click.secho("Output folder would overwrite the recordings", err=True)
+        sys.exit(1)
+    if not tasks:
+        click.secho("No recordings found", err=True)
+        sys.exit(1)
+    workers = workers or max(1, (os.cpu_count() or 1) // jobs)
+    print(f"Undistorting {len(tasks)} recordings into {output_folder}")
+    for source, out in tasks:
+        if out.stem != source.stem:
+            print(f"{source} -> {out}, another recording is named {source.stem}")
+
+    total = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(
+                undistort_file, source, out, calibration_file, balance, workers, codec
+            ): source
+            for source, out in tasks
+        }
+        for future in as_completed(futures):
+            frames, seconds = future.result()
+            total += frames
+            fps = frames / seconds if seconds else 0.0
+            print(
+                f"{futures[future]}: {frames} frames in {seconds:.1f}s, {fps:.1f} fps"
+            )
+
+    seconds = time.perf_counter() - start
+    print(f"Done, {total} frames in {seconds:.1f}s, {total / seconds:.1f} fps")
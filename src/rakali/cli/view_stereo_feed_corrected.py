@@ -5,7 +5,7 @@ import sys
 
 import click
 import numpy as np
-from rakali import VideoPlayer
+from rakali import VideoPlayer, transforms
 from rakali.annotate import add_frame_labels, colors
 from rakali.camera.fisheye_stereo import (
     CalibratedStereoFisheyeCamera,
@@ -66,12 +66,13 @@ def cli(left_eye, right_eye, calibration_file, balance, scale):
         right_src=right_eye,
     )
 
-    # get calibrated stereo rig
+    # get calibrated stereo rig, rectifying straight to the display scale
     camera = CalibratedStereoFisheyeCamera(
         calibration_file=calibration_file,
         balance=balance,
         dim2=None,
         dim3=None,  # remember we have these
+        scale=scale,
     )
 
     # label the corrected frames to aid in diagnostics
@@ -88,7 +89,7 @@ def cli(left_eye, right_eye, calibration_file, balance, scale):
         print("Error reading from stereo video stream")
         sys.exit()
 
-    player = VideoPlayer(scale=scale)
+    player = VideoPlayer()
 
     with player, stream:
         count = 0
@@ -101,6 +102,7 @@ def cli(left_eye, right_eye, calibration_file, balance, scale):
                 left, right = frames.frames()
                 # unwarp pair images
                 rectified = camera.correct(left, right)
+                left, right = (transforms.scale(f, scale) for f in (left, right))
                 for side, source, frame, corrected_frame in zip(
                     ("left", "right"),
                     (left_eye, right_eye),
@@ -0,0 +1,245 @@
+"""
+Fetch images over HTTP.
+
+Polling snapshot URLs of many cameras spends most of its time opening
+connections and decoding images that did not change. An ImageFetcher keeps
+connections to every host open between requests, fetches many URLs at once
+in a pool of threads, and remembers decoded images with their ETag and
+Last-Modified validators. Asking for a remembered image sends a conditional
+request, and a 304 Not Modified answer is served from memory without
+downloading or decoding anything. Remembered images take no more than
+`max_bytes`, the least recently used ones are dropped first.
+"""
+
+import base64
+import http.client
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import cv2 as cv
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class ConnectionPool:
+    """open connections by host, kept for reuse once a response is read"""
+
+    def __init__(self, timeout=5.0, max_idle=4):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.opened = 0
+        self._idle: Dict[Tuple, List[http.client.HTTPConnection]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def get(self, scheme, netloc) -> http.client.HTTPConnection:
+        """an idle connection to the host, or a new one"""
+
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+            self.opened += 1
+        host = netloc.rpartition("@")[2]
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, timeout=self.timeout)
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def put(self, scheme, netloc, connection):
+        """keep a connection whose response was read in full"""
+
+        with self._lock:
+            idle = self._idle[(scheme, netloc)]
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+    def __len__(self):
+        return sum(len(idle) for idle in self._idle.values())
+
+
+class CachedImage:
+    """a decoded image and the validators it was served with"""
+
+    def __init__(self, mat, etag=None, last_modified=None):
+        self.mat = mat
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def nbytes(self):
+        return self.mat.nbytes
+
+    def conditions(self) -> Dict[str, str]:
+        """headers that ask for the image only if it changed"""
+
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ImageFetcher:
+    """
+    Fetch and decode images by URL, reusing connections and remembering
+    images served with validators. Images are returned read only since
+    remembered ones are shared, copy one before drawing on it.
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20, workers=8, timeout=5.0, retries=2):
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.connections = ConnectionPool(timeout=timeout, max_idle=workers)
+        self.hits = 0
+        self.misses = 0
+        self.downloaded = 0
+        self._images: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Fetch")
+
+    @property
+    def nbytes(self):
+        return sum(image.nbytes for image in self._images.values())
+
+    def _request(self, url, headers) -> Tuple[int, Dict[str, str], bytes]:
+        """status, headers and body of a GET, on a pooled connection"""
+
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Cannot fetch {url}, only http and https are supported")
+        headers = dict(headers)
+        if parts.username:
+            credentials = f"{parts.username}:{parts.password or ''}".encode()
+            headers["Authorization"] = "Basic " + base64.b64encode(credentials).decode()
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        for attempt in range(self.retries + 1):
+            connection = self.connections.get(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # includes a kept connection the server has since closed
+                connection.close()
+                if attempt == self.retries:
+                    raise OSError(f"Cannot fetch {url}: {e}") from e
+                logger.debug(f"Retrying {url} after {e}")
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self.connections.put(parts.scheme, parts.netloc, connection)
+            return (
+                response.status,
+                {k.lower(): v for k, v in response.getheaders()},
+                body,
+            )
+
+    def fetch(self, url) -> np.ndarray:
+        """the image at url, from memory when the server says it is unchanged"""
+
+        with self._lock:
+            cached = self._images.get(url)
+        conditions = cached.conditions() if cached is not None else {}
+        location = url
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers, body = self._request(location, conditions)
+            if status not in REDIRECTS or "location" not in headers:
+                break
+            location = urljoin(location, headers["location"])
+        if status == 304 and cached is not None:
+            with self._lock:
+                self.hits += 1
+                if url in self._images:
+                    self._images.move_to_end(url)
+            return cached.mat
+        if status != 200:
+            raise OSError(f"Cannot fetch {url}: HTTP {status}")
+        mat = cv.imdecode(np.frombuffer(body, dtype=np.uint8), cv.IMREAD_COLOR)
+        if mat is None:
+            raise OSError(f"Cannot decode the image at {url}")
+        mat.flags.writeable = False
+        image = CachedImage(mat, headers.get("etag"), headers.get("last-modified"))
+        with self._lock:
+            self.misses += 1
+            self.downloaded += len(body)
+            if image.etag or image.last_modified:
+                self._put(url, image)
+            else:
+                self._images.pop(url, None)
+        return mat
+
+    def _put(self, url, image):
+        self._images[url] = image
+        self._images.move_to_end(url)
+        while len(self._images) > 1 and self.nbytes > self.max_bytes:
+            self._images.popitem(last=False)
+
+    def fetch_many(self, urls) -> List[Optional[np.ndarray]]:
+        """the images at urls fetched at once, None where one failed"""
+
+        def fetch(url):
+            try:
+                return self.fetch(url)
+            except (OSError, ValueError) as e:
+                logger.warning(str(e))
+                return None
+
+        return list(self._pool.map(fetch, urls))
+
+    def clear(self):
+        """forget all images"""
+        with self._lock:
+            self._images.clear()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.connections.close()
+        self.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._images)
+
+    def __repr__(self):
+        return (
+            f"ImageFetcher(images={len(self)}, MiB={self.nbytes / 2 ** 20:.1f}, "
+            f"hits={self.hits}, misses={self.misses}, "
+            f"connections={self.connections.opened})"
+        )
+
+
+_default: Optional[ImageFetcher] = None
+
+
+def default_fetcher() -> ImageFetcher:
+    """the process wide fetcher"""
+
+    global _default
+    if _default is None:
+        _default = ImageFetcher()
+    return _default
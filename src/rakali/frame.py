@@ -0,0 +1,108 @@
+"""
+Frames that remember what was derived from them.
+
+Stages working on the same frame each tend to make their own grey copy,
+pyramid level or display sized copy of it. A Frame computes these on first
+use and hands the same ones to everyone after. A Frame takes over its array
+and makes it read only, so it cannot change behind the derived copies, which
+are read only as well. Change a frame inside `edit`, or replace its array,
+and the derived copies are dropped.
+"""
+
+from contextlib import contextmanager
+
+import cv2 as cv
+import numpy as np
+
+
+def _read_only(mat):
+    mat.flags.writeable = False
+    return mat
+
+
+class Frame:
+    """
+    A frame and the representations derived from it. A frame that is a view
+    of a larger array can still change through that array, copy it first.
+    """
+
+    def __init__(self, mat: np.ndarray):
+        self._derived = {}
+        self.mat = mat
+
+    @property
+    def mat(self) -> np.ndarray:
+        return self._mat
+
+    @mat.setter
+    def mat(self, mat):
+        self._derived = {}
+        self._mat = _read_only(mat)
+
+    @contextmanager
+    def edit(self):
+        """the frame made writable for the duration, to change in place"""
+
+        self._derived = {}
+        self._mat.flags.writeable = True
+        try:
+            yield self._mat
+        finally:
+            self._mat.flags.writeable = False
+            self._derived = {}
+
+    def derived(self, key, compute):
+        """what compute makes of the frame, computed once and kept by key"""
+
+        if key not in self._derived:
+            self._derived[key] = _read_only(compute())
+        return self._derived[key]
+
+    @property
+    def grey(self) -> np.ndarray:
+        """the frame in grey, or the frame itself when it is grey"""
+
+        if self._mat.ndim == 2:
+            return self._mat
+        return self.derived("grey", lambda: cv.cvtColor(self._mat, cv.COLOR_BGR2GRAY))
+
+    def pyramid(self, level, grey=False) -> np.ndarray:
+        """the frame, or its grey, pyrDown level times"""
+
+        if level == 0:
+            return self.grey if grey else self._mat
+        return self.derived(
+            ("pyramid", level, grey),
+            lambda: cv.pyrDown(self.pyramid(level - 1, grey)),
+        )
+
+    def scaled(self, factor, interpolation=cv.INTER_AREA) -> np.ndarray:
+        """the frame scaled by factor, sized as imutils.resize would"""
+
+        if factor == 1:
+            return self._mat
+        h, w = self._mat.shape[:2]
+        width = int(w * factor)
+        size = (width, int(h * (width / float(w))))
+        return self.derived(
+            ("scaled", factor, interpolation),
+            lambda: cv.resize(self._mat, size, interpolation=interpolation),
+        )
+
+    @property
+    def shape(self):
+        return self._mat.shape
+
+    def __len__(self):
+        return len(self._derived)
+
+    def __repr__(self):
+        return f"Frame(shape={self.shape}, derived={list(self._derived)})"
+
+
+def grey(frame) -> np.ndarray:
+    """grey of a Frame, shared with other users of it, or of an array"""
+
+    if isinstance(frame, Frame):
+        return frame.grey
+    return cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
@@ -1,11 +1,12 @@
 from pathlib import Path
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 import cv2 as cv
-import imutils
 import numpy as np
 
+from . import lut, skeleton
 from .annotate import add_frame_labels
+from .fetch import ImageFetcher, default_fetcher
 
 
 class ImageSize:
@@ -32,16 +33,227 @@ class ImageSize:
         return f"ImageSize(height={self.height}, width={self.width})"
 
 
-class Image:
-    """OpenCV Image wrapper"""
+def _resize_matrix(x_scale, y_scale):
+    """the pixel mapping of cv.resize, which aligns pixel centres"""
+    return np.array(
+        [
+            [x_scale, 0, 0.5 * x_scale - 0.5],
+            [0, y_scale, 0.5 * y_scale - 0.5],
+            [0, 0, 1],
+        ]
+    )
+
+
+def _out(pool, shape, dtype=np.uint8):
+    """an output buffer from the pool, or None to have OpenCV allocate one"""
+    return pool.get(shape, dtype) if pool is not None else None
+
+
+def _warp(mat, matrix, size, interpolation, pool=None):
+    """apply a fused 3x3 affine transform producing an image of size (w, h)"""
+
+    h, w = mat.shape[:2]
+    dst = _out(pool, (size[1], size[0]) + mat.shape[2:], mat.dtype)
+    x_scale, y_scale = matrix[0, 0], matrix[1, 1]
+    if np.allclose(matrix, _resize_matrix(x_scale, y_scale), rtol=0, atol=1e-9):
+        # only scaling, which resize does better, and with area averaging
+        if size == (round(w * x_scale), round(h * y_scale)):
+            return cv.resize(
+                mat, None, dst, fx=x_scale, fy=y_scale, interpolation=interpolation
+            )
+        return cv.resize(mat, size, dst, interpolation=interpolation)
+
+    # warpAffine samples without averaging, shrink by area first when the
+    # transform shrinks a lot so thumbnails do not alias
+    shrunk = None
+    shrink = np.sqrt(abs(np.linalg.det(matrix[:2, :2])))
+    if shrink < 0.5:
+        shrunk_size = (max(1, round(w * shrink)), max(1, round(h * shrink)))
+        shrunk = cv.resize(
+            mat,
+            shrunk_size,
+            _out(pool, shrunk_size[::-1] + mat.shape[2:], mat.dtype),
+            interpolation=cv.INTER_AREA,
+        )
+        matrix = matrix @ np.linalg.inv(
+            _resize_matrix(shrunk_size[0] / w, shrunk_size[1] / h)
+        )
+        mat = shrunk
+    if interpolation == cv.INTER_AREA:
+        interpolation = cv.INTER_LINEAR
+    warped = cv.warpAffine(mat, matrix[:2], size, dst, flags=interpolation)
+    if pool is not None:
+        pool.put(shrunk)
+    return warped
+
+
+def _median(mat):
+    """median of an 8 bit image, as np.median but without sorting a copy"""
+
+    return _histogram_median(_histogram(mat))
+
+
+def _histogram(mat):
+    """counts of the 256 values of an 8 bit image, over all channels"""
 
-    def __init__(self, image: np.array, copy=False):
+    channels = 1 if mat.ndim == 2 else mat.shape[2]
+    return sum(
+        cv.calcHist([mat], [c], None, [256], [0, 256]).ravel().astype(np.int64)
+        for c in range(channels)
+    )
+
+
+def _histogram_median(histogram):
+    """median of the values counted in a histogram"""
+
+    counts = np.cumsum(histogram)
+    n = counts[-1]
+    low = np.searchsorted(counts, (n - 1) // 2 + 1)
+    high = np.searchsorted(counts, n // 2 + 1)
+    return (low + high) / 2
+
+
+class Image:
+    """
+    OpenCV Image wrapper
+
+    In lazy mode geometric operations and colour conversions are only recorded.
+    Colour conversions are moved ahead of the geometric operations, which are
+    fused into a single warp, and all of it runs when `mat` is next used. A
+    fused warp does not clip at the borders of the intermediate images, so
+    content an eager chain would have cut off can come back into view.
+
+    With a BufferPool every operation writes into a recycled buffer and hands
+    the one it replaces back, `release` returns the last one when the image is
+    done with. A loop doing the same work on every frame then reaches a steady
+    state without allocating.
+    """
+
+    def __init__(self, image: np.array, copy=False, lazy=False, pool=None):
         """construct from numpy array"""
+        self._lazy = lazy
+        self.pool = pool
         if copy:
-            self.mat = image.copy()
+            if pool is not None:
+                self.mat = pool.get_like(image)
+                np.copyto(self._mat, image)
+            else:
+                self.mat = image.copy()
         else:
             self.mat = image
 
+    @property
+    def mat(self):
+        """the image, running any recorded operations first"""
+        if self._conversions or self._matrix is not None:
+            self.run()
+        return self._mat
+
+    @mat.setter
+    def mat(self, mat):
+        self._mat = mat
+        self._conversions: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._size = None
+        self._interpolation = cv.INTER_LINEAR
+
+    def _out(self, shape, dtype=np.uint8):
+        return _out(self.pool, shape, dtype)
+
+    def _replace(self, mat):
+        """make mat the image, recycling the one it replaces"""
+        previous = self._mat
+        self.mat = mat
+        if self.pool is not None and previous is not mat:
+            self.pool.put(previous)
+        return self
+
+    def release(self):
+        """hand the image buffer back to the pool"""
+        if self.pool is not None:
+            self.pool.put(self._mat)
+        self.mat = None
+
+    def lazy(self, lazy=True):
+        """record operations from now on, running them fused when mat is used"""
+        if not lazy:
+            self.run()
+        self._lazy = lazy
+        return self
+
+    def run(self):
+        """run the recorded operations"""
+
+        conversions, matrix = self._conversions, self._matrix
+        size, interpolation = self._size, self._interpolation
+        # clear the record, then replay it
+        self.mat = self._mat
+        for code in conversions:
+            self._convert(code)
+        if matrix is not None:
+            self._replace(_warp(self._mat, matrix, size, interpolation, self.pool))
+        return self
+
+    def _current_size(self):
+        """width, height once the recorded operations have run"""
+        if self._matrix is not None:
+            return self._size
+        h, w = self._mat.shape[:2]
+        return w, h
+
+    def _record_warp(self, matrix, size, interpolation=cv.INTER_LINEAR):
+        if matrix.shape[0] == 2:
+            matrix = np.vstack((matrix, (0, 0, 1)))
+        if self._matrix is not None:
+            matrix = matrix @ self._matrix
+        self._matrix = matrix
+        self._size = (int(size[0]), int(size[1]))
+        self._interpolation = interpolation
+        return self
+
+    def _affine(self, matrix, size):
+        """warp by a 2x3 matrix into an image of size (w, h), or record it"""
+
+        if self._lazy:
+            return self._record_warp(matrix, size)
+        src = self.mat
+        dst = self._out((size[1], size[0]) + src.shape[2:], src.dtype)
+        return self._replace(cv.warpAffine(src, matrix, size, dst))
+
+    def _resize(self, size, fx, fy, interpolation):
+        """resize to size (w, h), or by fx, fy when size is None, or record it"""
+
+        if self._lazy:
+            w, h = self._current_size()
+            if size is None:
+                size = (round(w * fx), round(h * fy))
+            else:
+                fx, fy = size[0] / w, size[1] / h
+            return self._record_warp(_resize_matrix(fx, fy), size, interpolation)
+        src = self.mat
+        h, w = src.shape[:2]
+        if size is None:
+            shape = (round(h * fy), round(w * fx))
+        else:
+            shape, fx, fy = size[::-1], 0, 0
+        dst = self._out(tuple(shape) + src.shape[2:], src.dtype)
+        return self._replace(
+            cv.resize(src, size, dst, fx=fx, fy=fy, interpolation=interpolation)
+        )
+
+    def _convert(self, code):
+        """colour conversion, or record it"""
+
+        if self._lazy and self._matrix is not None:
+            # colour conversions commute with warps, doing them first means
+            # warping fewer channels
+            self._conversions.append(code)
+            return self
+        src = self._mat
+        channels = 3 if code == cv.COLOR_BGR2RGB else 1
+        shape = src.shape[:2] + ((channels,) if channels > 1 else ())
+        return self._replace(cv.cvtColor(src, code, self._out(shape, src.dtype)))
+
     @classmethod
     def from_file(cls, path: Path):
         """load image from file"""
@@ -52,10 +264,11 @@ class Image:
         return cls(img)
 
     @classmethod
-    def from_url(cls, url):
-        """load image from url"""
-        img = imutils.url_to_image(url)
-        return cls(img)
+    def from_url(cls, url, fetcher: Optional[ImageFetcher] = None):
+        """load image from url, through the process wide fetcher by default"""
+        img = (fetcher or default_fetcher()).fetch(url)
+        # fetched images may be shared with the fetcher cache
+        return cls(img, copy=True)
 
     def info(self):
         """print some information about the loaded image"""
@@ -74,58 +287,48 @@ class Image:
 
     def translate(self, x: int, y: int):
         """translate image to given offsets"""
-        self.mat = imutils.translate(
-            image=self.mat,
-            x=x,
-            y=y,
-        )
-        return self
+        matrix = np.float32([[1, 0, x], [0, 1, y]])
+        return self._affine(matrix, self._current_size())
 
     def rotate(self, angle, center=None, scale=1.0):
         """rotate image by given angle"""
-        self.mat = imutils.rotate(
-            image=self.mat,
-            angle=angle,
-            center=center,
-            scale=scale,
-        )
-        return self
+        w, h = self._current_size()
+        if center is None:
+            center = (w // 2, h // 2)
+        matrix = cv.getRotationMatrix2D(center, angle, scale)
+        return self._affine(matrix, (w, h))
 
     def rotate_bounded(self, angle):
         """rotate image by given angle keeping withing origin image bounds"""
 
-        self.mat = imutils.rotate_bound(
-            image=self.mat,
-            angle=angle,
-        )
-        return self
+        w, h = self._current_size()
+        # rotating clockwise, then moved to the middle of the larger bounds
+        matrix = cv.getRotationMatrix2D((w / 2, h / 2), -angle, 1.0)
+        cos, sin = np.abs(matrix[0, 0]), np.abs(matrix[0, 1])
+        size = (int(h * sin + w * cos), int(h * cos + w * sin))
+        matrix[0, 2] += size[0] / 2 - w / 2
+        matrix[1, 2] += size[1] / 2 - h / 2
+        return self._affine(matrix, size)
 
     def resize(self, width=None, height=None, interpolation=cv.INTER_AREA):
         """resise image preserving aspect ratio"""
-        self.mat = imutils.resize(
-            self.mat,
-            width=width,
-            height=height,
-            inter=interpolation,
-        )
-        return self
+        if width is None and height is None:
+            return self
+        w, h = self._current_size()
+        # as imutils.resize
+        if width is None:
+            size = (int(w * (height / float(h))), height)
+        else:
+            size = (width, int(h * (width / float(w))))
+        return self._resize(size, None, None, interpolation)
 
     def scale(self, factor=1, interpolation=cv.INTER_AREA):
         """scale image"""
-
-        self.mat = cv.resize(
-            self.mat,
-            None,
-            fx=factor,
-            fy=factor,
-            interpolation=interpolation,
-        )
-        return self
+        return self._resize(None, factor, factor, interpolation)
 
     def grey(self):
         """Grey image"""
-        self.mat = cv.cvtColor(self.mat, cv.COLOR_BGR2GRAY)
-        return self
+        return self._convert(cv.COLOR_BGR2GRAY)
 
     def gray(self):
         """Gray image"""
@@ -136,47 +339,34 @@ class Image:
         self,
         kernel_size: Tuple = (3, 3),
         structuring: int = cv.MORPH_RECT,
+        method: str = "morphological",
     ):
-        """skeletonize image"""
+        """
+        skeletonize image, by morphological skeleton or by Zhang-Suen or
+        Guo-Hall thinning, see rakali.skeleton
+        """
 
         grey = self.grey().mat
-
-        # determine the area (i.e. total number of pixels in the image),
-        # initialize the output skeletonized image, and construct the
-        # morphological structuring element
-        area = grey.shape[0] * grey.shape[1]
-        skeleton = np.zeros(grey.shape, dtype="uint8")
-        elem = cv.getStructuringElement(structuring, kernel_size)
-
-        # erode and dilate the image using the structuring element
-        eroded = cv.erode(grey, elem)
-        temp = cv.dilate(eroded, elem)
-
-        # subtract the temporary image from the original, eroded
-        # image, then take the bitwise 'or' between the skeleton
-        # and the temporary image
-        temp = cv.subtract(grey, temp)
-        skeleton = cv.bitwise_or(skeleton, temp)
-
-        self.mat = skeleton
-
-        return self
+        return self._replace(
+            skeleton.skeletonize(grey, method, kernel_size, structuring)
+        )
 
     def bgr2rgb(self):
         """
         OpenCV represents images in BGR order. Other libraries like Matplotlib
         expects the image in RGB order
         """
-        self.mat = cv.cvtColor(self.mat, cv.COLOR_BGR2RGB)
-        return self
+        return self._convert(cv.COLOR_BGR2RGB)
 
     def auto_canny(self, sigma=0.33):
         """compute the median of the single channel pixel intensities"""
-        self.mat = imutils.auto_canny(
-            image=self.mat,
-            sigma=sigma,
-        )
-        return self
+        src = self.mat
+        # thresholds around the median, as imutils.auto_canny
+        median = _median(src)
+        lower = int(max(0, (1.0 - sigma) * median))
+        upper = int(min(255, (1.0 + sigma) * median))
+        edges = self._out(src.shape[:2])
+        return self._replace(cv.Canny(src, lower, upper, edges))
 
     def adjust_brightness_contrast(
         self, brightness: float = 0.0, contrast: float = 0.0, beta=0
@@ -187,14 +377,38 @@ class Image:
         :param brightness: Float, brightness adjustment with 0 meaning no change
         """
 
-        self.mat = cv.addWeighted(
-            src1=self.mat,
-            alpha=1 + float(contrast) / 100.0,
-            src2=self.mat,
-            beta=beta,
-            gamma=float(brightness),
+        # a single linear step is quicker as SIMD arithmetic than a table
+        # lookup, chain it with other point operations in a lut.PointChain
+        src = self.mat
+        return self._replace(
+            cv.addWeighted(
+                src1=src,
+                alpha=1 + float(contrast) / 100.0,
+                src2=src,
+                beta=beta,
+                gamma=float(brightness),
+                dst=self._out(src.shape, src.dtype),
+            )
         )
-        return self
+
+    def gamma(self, gamma: float = 1.0):
+        """gamma correct the image, gamma above 1 brightens"""
+        return self.point(lut.gamma(gamma))
+
+    def curve(self, points):
+        """map the image through a tone curve of (in, out) points"""
+        return self.point(lut.curve(tuple(tuple(p) for p in points)))
+
+    def point(self, table):
+        """
+        look the 8 bit image up in a 256 entry table, or a lut.PointChain of
+        point operations
+        """
+
+        if isinstance(table, lut.PointChain):
+            table = table.table
+        src = self.mat
+        return self._replace(lut.apply(src, table, self._out(src.shape, src.dtype)))
 
     def show(self, wait=0, key="q", name="Image"):
         """display image"""
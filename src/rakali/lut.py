@@ -0,0 +1,121 @@
+"""
+Point operations through lookup tables.
+
+Brightness, contrast, gamma and tone curves change every pixel by its own
+value alone, so an 8 bit image only has 256 answers to work out. Each
+operation is made into a table of them, once per set of parameters, and
+applied with cv.LUT. Several operations chain into a single table, so any
+number of them cost one pass over the image. A lookup costs more than the
+SIMD arithmetic of a single brightness and contrast step, tables pay off for
+gamma, curves and chains of operations.
+"""
+
+from functools import lru_cache
+from typing import List, Tuple
+
+import cv2 as cv
+import numpy as np
+
+_VALUES = np.arange(256, dtype=np.uint8).reshape(1, 256)
+IDENTITY = _VALUES.ravel().copy()
+IDENTITY.flags.writeable = False
+
+
+def _table(values) -> np.ndarray:
+    """a shared table, made read only"""
+    table = np.clip(np.rint(values), 0, 255).astype(np.uint8).ravel()
+    table.flags.writeable = False
+    return table
+
+
+@lru_cache(maxsize=256)
+def brightness_contrast(brightness=0.0, contrast=0.0, beta=0) -> np.ndarray:
+    """table of Image.adjust_brightness_contrast"""
+    # made by the same addWeighted the image used to go through, so it rounds
+    # the same way
+    return _table(
+        cv.addWeighted(
+            _VALUES, 1 + float(contrast) / 100.0, _VALUES, beta, float(brightness)
+        )
+    )
+
+
+@lru_cache(maxsize=256)
+def gamma(gamma=1.0) -> np.ndarray:
+    """table of gamma correction, gamma above 1 brightens"""
+    return _table(255.0 * (IDENTITY / 255.0) ** (1.0 / gamma))
+
+
+@lru_cache(maxsize=256)
+def curve(points: Tuple[Tuple[float, float], ...]) -> np.ndarray:
+    """table of a tone curve through (in, out) points, straight in between"""
+    xs, ys = zip(*sorted(points))
+    return _table(np.interp(IDENTITY, xs, ys))
+
+
+def compose(*tables) -> np.ndarray:
+    """one table doing what the tables do in turn"""
+    table = IDENTITY
+    for t in tables:
+        table = t[table]
+    return table
+
+
+def apply(mat, table, dst=None):
+    """look every pixel up in table"""
+    return cv.LUT(mat, table, dst)
+
+
+OPERATIONS = {
+    "brightness_contrast": brightness_contrast,
+    "gamma": gamma,
+    "curve": curve,
+}
+
+
+@lru_cache(maxsize=64)
+def _compile(operations) -> np.ndarray:
+    table = compose(*(OPERATIONS[name](*arguments) for name, arguments in operations))
+    table.flags.writeable = False
+    return table
+
+
+class PointChain:
+    """
+    Point operations to run on every frame of a video, looked up in a single
+    table. The table is made again only when the operations change.
+    """
+
+    def __init__(self):
+        self.operations: List[Tuple[str, tuple]] = []
+
+    def brightness_contrast(self, brightness=0.0, contrast=0.0, beta=0):
+        return self._add("brightness_contrast", brightness, contrast, beta)
+
+    def gamma(self, gamma=1.0):
+        return self._add("gamma", gamma)
+
+    def curve(self, points):
+        return self._add("curve", tuple(tuple(point) for point in points))
+
+    def _add(self, name, *arguments):
+        self.operations.append((name, arguments))
+        return self
+
+    def clear(self):
+        self.operations = []
+        return self
+
+    @property
+    def table(self) -> np.ndarray:
+        return _compile(tuple(self.operations))
+
+    def __call__(self, mat, dst=None):
+        """the frame with all operations applied"""
+        return apply(mat, self.table, dst)
+
+    def __len__(self):
+        return len(self.operations)
+
+    def __repr__(self):
+        return f"PointChain({self.operations})"
@@ -0,0 +1,300 @@
+"""
+Skeletons and thinning of images.
+
+The morphological skeleton erodes the image until erosion changes nothing,
+collecting what every opening removes. Zhang-Suen and Guo-Hall thinning peel single
+pixels off the border of binary shapes until only one pixel wide lines
+remain. Both are iterative, and on large images most of the image stops
+changing long before the last iteration. The image is therefore split in
+tiles and each iteration only visits the tiles that can still change, with a
+halo of their neighbours' pixels so the result is the same as processing the
+whole image at once. The image buffers are updated in place.
+
+Thinning decides on each pixel from its 8 neighbours. The neighbours are
+packed into a byte with one filter2D and the decision for every byte value is
+looked up in a 256 entry table, so a sub-iteration is a few OpenCV calls per
+tile.
+"""
+
+import time
+from typing import Dict, Iterable, Set, Tuple
+
+import cv2 as cv
+import numpy as np
+
+TILE_SIZE = 512
+METHODS = ("morphological", "zhang-suen", "guo-hall")
+
+# bit of each neighbour in the packed byte, p2 is above and they go clockwise
+# p2 p3 p4 p5 p6 p7 p8 p9 = N NE E SE S SW W NW
+NEIGHBOURS = np.array(
+    [
+        [128, 1, 2],
+        [64, 0, 4],
+        [32, 16, 8],
+    ],
+    dtype=np.float32,
+)
+
+
+def _neighbours(code):
+    """p2..p9 of a packed byte"""
+    return [(code >> bit) & 1 for bit in range(8)]
+
+
+def _zhang_suen_table(step):
+    table = np.zeros(256, dtype=np.uint8)
+    for code in range(256):
+        p2, p3, p4, p5, p6, p7, p8, p9 = p = _neighbours(code)
+        count = sum(p)
+        ring = p + p[:1]
+        transitions = sum(a == 0 and b == 1 for a, b in zip(ring, ring[1:]))
+        if step == 0:
+            clear = p2 * p4 * p6 == 0 and p4 * p6 * p8 == 0
+        else:
+            clear = p2 * p4 * p8 == 0 and p2 * p6 * p8 == 0
+        table[code] = 2 <= count <= 6 and transitions == 1 and clear
+    return table
+
+
+def _guo_hall_table(step):
+    table = np.zeros(256, dtype=np.uint8)
+    for code in range(256):
+        p2, p3, p4, p5, p6, p7, p8, p9 = _neighbours(code)
+        c = (
+            (not p2 and (p3 or p4))
+            + (not p4 and (p5 or p6))
+            + (not p6 and (p7 or p8))
+            + (not p8 and (p9 or p2))
+        )
+        n1 = (p9 or p2) + (p3 or p4) + (p5 or p6) + (p7 or p8)
+        n2 = (p2 or p3) + (p4 or p5) + (p6 or p7) + (p8 or p9)
+        n = min(n1, n2)
+        if step == 0:
+            m = (p6 or p7 or not p9) and p8
+        else:
+            m = (p2 or p3 or not p5) and p4
+        table[code] = c == 1 and 2 <= n <= 3 and not m
+    return table
+
+
+# which pixels each sub-iteration deletes, by packed neighbours
+TABLES = {
+    "zhang-suen": [_zhang_suen_table(0), _zhang_suen_table(1)],
+    "guo-hall": [_guo_hall_table(0), _guo_hall_table(1)],
+}
+
+
+class Tiles:
+    """the tiles of an image of shape (h, w) and their neighbours"""
+
+    def __init__(self, shape, tile_size=TILE_SIZE):
+        self.h, self.w = shape[:2]
+        self.tile_size = tile_size
+        self.rows = -(-self.h // tile_size)
+        self.columns = -(-self.w // tile_size)
+
+    def __iter__(self):
+        for row in range(self.rows):
+            for column in range(self.columns):
+                yield row, column
+
+    def __len__(self):
+        return self.rows * self.columns
+
+    def bounds(self, tile, halo=0) -> Tuple[int, int, int, int]:
+        """top, bottom, left, right of a tile grown by halo, within the image"""
+
+        row, column = tile
+        size = self.tile_size
+        return (
+            max(row * size - halo, 0),
+            min((row + 1) * size + halo, self.h),
+            max(column * size - halo, 0),
+            min((column + 1) * size + halo, self.w),
+        )
+
+    def neighbourhood(self, tiles: Iterable) -> Set[Tuple[int, int]]:
+        """the tiles and all tiles around them"""
+
+        around = set()
+        for row, column in tiles:
+            for r in range(max(row - 1, 0), min(row + 2, self.rows)):
+                for c in range(max(column - 1, 0), min(column + 2, self.columns)):
+                    around.add((r, c))
+        return around
+
+
+def _slices(tiles, tile):
+    top, bottom, left, right = tiles.bounds(tile)
+    return slice(top, bottom), slice(left, right)
+
+
+def _filtered(img, tiles, tile, halo, operation):
+    """operation on a tile with halo, cut back to the tile"""
+
+    top, bottom, left, right = tiles.bounds(tile, halo)
+    t, b, l, r = tiles.bounds(tile)
+    return operation(img[top:bottom, left:right])[
+        t - top : b - top, l - left : r - left
+    ]
+
+
+def morphological_skeleton(
+    img,
+    kernel_size=(3, 3),
+    structuring=cv.MORPH_RECT,
+    tile_size=TILE_SIZE,
+    max_iterations=None,
+):
+    """
+    Skeleton of an 8 bit image, the union over successive erosions of what an
+    opening removes, stopping once erosion no longer changes the image
+    """
+
+    element = cv.getStructuringElement(structuring, kernel_size)
+    halo = max(kernel_size) // 2 + 1
+    image = img.copy()
+    eroded = np.zeros_like(image)
+    skeleton = np.zeros_like(image)
+    tiles = Tiles(image.shape, tile_size)
+    # a tile whose neighbourhood did not change last time erodes to itself,
+    # so its opening removes nothing and it is left alone
+    pending = set(tiles)
+    iteration = 0
+    while pending and (max_iterations is None or iteration < max_iterations):
+        for tile in pending:
+            eroded[_slices(tiles, tile)] = _filtered(
+                image, tiles, tile, halo, lambda m: cv.erode(m, element)
+            )
+        changed = []
+        for tile in pending:
+            region = _slices(tiles, tile)
+            opened = _filtered(
+                eroded, tiles, tile, halo, lambda m: cv.dilate(m, element)
+            )
+            removed = cv.subtract(image[region], opened)
+            np.bitwise_or(skeleton[region], removed, out=skeleton[region])
+            if cv.countNonZero(cv.absdiff(image[region], eroded[region])):
+                changed.append(tile)
+        # the tiles left alone hold the same in both buffers
+        image, eroded = eroded, image
+        pending = tiles.neighbourhood(changed)
+        iteration += 1
+    return skeleton
+
+
+def thin(binary, method="zhang-suen", tile_size=TILE_SIZE, max_iterations=None):
+    """
+    One pixel wide lines of the shapes in a binary image, any non zero pixel
+    being part of a shape, returned as 0 and 255
+    """
+
+    tables = TABLES[method]
+    image = (binary > 0).astype(np.uint8)
+    tiles = Tiles(image.shape, tile_size)
+    occupied = {t for t in tiles if cv.countNonZero(image[_slices(tiles, t)])}
+    # tiles to visit in each sub-iteration, a tile drops out of a
+    # sub-iteration once that deletes nothing in it, until a neighbour changes
+    pending = [set(occupied), set(occupied)]
+    step = iteration = 0
+    while pending[0] or pending[1]:
+        if max_iterations is not None and iteration >= max_iterations:
+            break
+        deletions: Dict[Tuple[int, int], np.ndarray] = {}
+        for tile in pending[step]:
+            delete = _filtered(
+                image,
+                tiles,
+                tile,
+                1,
+                lambda m: cv.LUT(
+                    cv.filter2D(m, -1, NEIGHBOURS, borderType=cv.BORDER_CONSTANT),
+                    tables[step],
+                ),
+            )
+            region = _slices(tiles, tile)
+            delete = cv.bitwise_and(delete, image[region])
+            if cv.countNonZero(delete):
+                deletions[tile] = delete
+        # all decisions are made on the image before any pixel goes
+        for tile, delete in deletions.items():
+            region = image[_slices(tiles, tile)]
+            np.subtract(region, delete, out=region)
+        pending[step] = set()
+        changed = tiles.neighbourhood(deletions)
+        pending[0] |= changed
+        pending[1] |= changed
+        step = 1 - step
+        iteration += step == 0
+    return cv.multiply(image, 255)
+
+
+def skeletonize(
+    grey,
+    method="morphological",
+    kernel_size=(3, 3),
+    structuring=cv.MORPH_RECT,
+    tile_size=TILE_SIZE,
+):
+    """
+    skeleton of the shapes in a grey image thresholded with Otsu's method,
+    the kernel only matters to the morphological skeleton
+    """
+
+    _, binary = cv.threshold(grey, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+    return skeletonize_binary(binary, method, kernel_size, structuring, tile_size)
+
+
+def skeletonize_binary(
+    binary,
+    method="morphological",
+    kernel_size=(3, 3),
+    structuring=cv.MORPH_RECT,
+    tile_size=TILE_SIZE,
+):
+    """skeleton of the shapes in an image of 0 and 255"""
+
+    if method not in METHODS:
+        raise ValueError(f"Unknown skeleton method {method}, use one of {METHODS}")
+    if method == "morphological":
+        return morphological_skeleton(binary, kernel_size, structuring, tile_size)
+    return thin(binary, method, tile_size)
+
+
+def synthetic_shapes(size=(4000, 4000), shapes=400, seed=0):
+    """binary image of random thick lines and discs, for benchmarks"""
+
+    rng = np.random.default_rng(seed)
+    w, h = size
+    img = np.zeros((h, w), dtype=np.uint8)
+    for _ in range(shapes):
+        x, y = int(rng.integers(w)), int(rng.integers(h))
+        if rng.random() < 0.7:
+            end = (int(rng.integers(w)), int(rng.integers(h)))
+            thickness = int(rng.integers(3, 30))
+            cv.line(img, (x, y), end, 255, thickness)
+        else:
+            cv.circle(img, (x, y), int(rng.integers(5, 60)), 255, -1)
+    return img
+
+
+def benchmark(images: Dict[str, np.ndarray], methods=METHODS, repeat=1, **kwargs):
+    """time per image of every method, and how many skeleton pixels it left"""
+
+    results = []
+    for name, grey in images.items():
+        for method in methods:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                skeleton = skeletonize(grey, method, **kwargs)
+            results.append(
+                dict(
+                    image=name,
+                    size=grey.shape[1::-1],
+                    method=method,
+                    cost=(time.perf_counter() - start) / repeat,
+                    pixels=cv.countNonZero(skeleton),
+                )
+            )
+    return results
@@ -0,0 +1,238 @@
+"""
+System statistics for overlays.
+
+Asking cpuinfo or the GPU driver takes long enough, up to a second, to ruin a
+frame loop. A StatsSampler asks in a background thread every `interval`
+seconds and publishes what it found as a Snapshot, which a frame loop can read
+for free, an empty one until the first is taken. The CPU model does not
+change and is only looked up once, in the background as well.
+
+CPU load and memory come from /proc, they are left out where that does not
+exist.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import cpuinfo
+import GPUtil
+
+logger = logging.getLogger(__name__)
+
+
+_cpu_info: Optional[dict] = None
+_cpu_lock = threading.Lock()
+
+
+def _look_up_cpu() -> dict:
+    global _cpu_info
+    # concurrent first callers wait for the one lookup
+    with _cpu_lock:
+        if _cpu_info is None:
+            _cpu_info = cpuinfo.get_cpu_info()
+    return _cpu_info
+
+
+def cpu_info(wait=True) -> dict:
+    """
+    cpuinfo of this machine, looked up once. Without wait it is empty until
+    the lookup, started in the background if need be, is done.
+    """
+
+    if _cpu_info is not None:
+        return _cpu_info
+    if wait:
+        return _look_up_cpu()
+    if _cpu_lock.acquire(blocking=False):
+        # nobody is looking it up yet
+        _cpu_lock.release()
+        threading.Thread(target=_look_up_cpu, name="CPUInfo", daemon=True).start()
+    return {}
+
+
+def cpu_brand() -> str:
+    """the CPU model, unknown until it has been looked up"""
+    info = cpu_info(wait=False)
+    # called brand before py-cpuinfo 7
+    return info.get("brand_raw", info.get("brand", "unknown"))
+
+
+def _cpu_times() -> Optional[Tuple[int, int]]:
+    """busy and total jiffies of all CPUs"""
+    try:
+        with open("/proc/stat") as f:
+            times = [int(t) for t in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = sum(times[3:5])
+    return sum(times) - idle, sum(times)
+
+
+def _memory() -> Optional[Tuple[int, int]]:
+    """used and total memory in bytes"""
+    try:
+        with open("/proc/meminfo") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        total = int(fields["MemTotal"].split()[0]) * 1024
+        available = int(fields["MemAvailable"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None
+    return total - available, total
+
+
+class GPUStats:
+    """load, temperature and memory of a GPU"""
+
+    def __init__(self, name, load, temperature, memory_used, memory_total):
+        self.name = name
+        self.load = load
+        self.temperature = temperature
+        self.memory_used = memory_used
+        self.memory_total = memory_total
+
+    def __repr__(self):
+        return (
+            f"GPUStats({self.name}, load={self.load:.2f}, "
+            f"temperature={self.temperature})"
+        )
+
+
+class Snapshot:
+    """system statistics at one point in time, None where not known"""
+
+    def __init__(
+        self,
+        time: float = 0.0,
+        cpu_percent: Optional[float] = None,
+        load: Optional[Tuple[float, float, float]] = None,
+        memory: Optional[Tuple[int, int]] = None,
+        gpus: Tuple[GPUStats, ...] = (),
+    ):
+        self.time = time
+        self.cpu_percent = cpu_percent
+        self.load = load
+        self.memory = memory
+        self.gpus = gpus
+
+    def labels(self) -> List[str]:
+        """labels for add_frame_labels"""
+
+        labels = []
+        cpu = f"CPU: {cpu_brand()}"
+        if self.cpu_percent is not None:
+            cpu += f", {self.cpu_percent:.0f}%"
+        if self.load is not None:
+            cpu += ", load {:.2f} {:.2f} {:.2f}".format(*self.load)
+        labels.append(cpu)
+        if self.memory is not None:
+            used, total = self.memory
+            labels.append(f"Memory: {used / 2 ** 30:.1f}/{total / 2 ** 30:.1f} GiB")
+        for i, gpu in enumerate(self.gpus):
+            labels.append(
+                f"GPU{i}: {gpu.name}, Load: {gpu.load:.2f}, Temp: {gpu.temperature}"
+            )
+        return labels
+
+    def __repr__(self):
+        return (
+            f"Snapshot(cpu_percent={self.cpu_percent}, load={self.load}, "
+            f"memory={self.memory}, gpus={len(self.gpus)})"
+        )
+
+
+class StatsSampler:
+    """
+    Samples system statistics every interval seconds in a background thread,
+    `snapshot` is the latest. GPUs are only asked after when gpu is set.
+    """
+
+    def __init__(self, interval=1.0, gpu=True):
+        self.interval = interval
+        self.gpu = gpu
+        self.snapshot = Snapshot()
+        self._cpu_times = _cpu_times()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _gpus(self) -> Tuple[GPUStats, ...]:
+        try:
+            gpus = GPUtil.getGPUs()
+        except Exception as e:
+            # GPUtil raises whatever nvidia-smi gives it, do not ask again
+            logger.debug(f"Cannot sample GPUs: {e}")
+            self.gpu = False
+            return ()
+        return tuple(
+            GPUStats(g.name, g.load, g.temperature, g.memoryUsed, g.memoryTotal)
+            for g in gpus
+        )
+
+    def sample(self) -> Snapshot:
+        """take and publish a snapshot now"""
+
+        cpu_percent = None
+        times = _cpu_times()
+        if times is not None and self._cpu_times is not None:
+            busy = times[0] - self._cpu_times[0]
+            total = times[1] - self._cpu_times[1]
+            if total > 0:
+                cpu_percent = 100.0 * busy / total
+        self._cpu_times = times
+        load = os.getloadavg() if hasattr(os, "getloadavg") else None
+        # replaced whole, so readers always see a complete one
+        self.snapshot = Snapshot(
+            time=time.time(),
+            cpu_percent=cpu_percent,
+            load=load,
+            memory=_memory(),
+            gpus=self._gpus() if self.gpu else (),
+        )
+        return self.snapshot
+
+    def _run(self):
+        self.sample()
+        # look the CPU model up here rather than in the first overlay
+        cpu_info()
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        """start sampling in the background, snapshot is empty until then"""
+
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="StatsSampler", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def __repr__(self):
+        return f"StatsSampler(interval={self.interval}, {self.snapshot})"
+
+
+_default: Optional[StatsSampler] = None
+
+
+def default_sampler() -> StatsSampler:
+    """the process wide sampler, started on first use"""
+
+    global _default
+    if _default is None:
+        _default = StatsSampler().start()
+    return _default
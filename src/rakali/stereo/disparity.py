@@ -0,0 +1,69 @@
+"""
+Disparity of rectified stereo pairs
+"""
+
+import threading
+
+import cv2 as cv
+import numpy as np
+
+
+class DisparityMapper:
+    """
+    Semi global block matching of rectified pairs, with the defaults of the
+    disparity tuner of rakali-disparity-fisheye-pair. Safe to use from several
+    threads, each gets its own matcher.
+    """
+
+    def __init__(
+        self,
+        min_disparity=16,
+        num_disparities=96,
+        block_size=16,
+        window_size=8,
+        disp12_max_diff=1,
+        uniqueness=10,
+        speckle_size=100,
+        speckle_range=32,
+    ):
+        self.min_disparity = min_disparity
+        self.num_disparities = num_disparities
+        self.parameters = dict(
+            minDisparity=min_disparity,
+            numDisparities=num_disparities,
+            blockSize=block_size,
+            P1=8 * 3 * window_size ** 2,
+            P2=32 * 3 * window_size ** 2,
+            disp12MaxDiff=disp12_max_diff,
+            uniquenessRatio=uniqueness,
+            speckleWindowSize=speckle_size,
+            speckleRange=speckle_range,
+        )
+        self._local = threading.local()
+
+    @property
+    def matcher(self):
+        if not hasattr(self._local, "matcher"):
+            self._local.matcher = cv.StereoSGBM_create(**self.parameters)
+        return self._local.matcher
+
+    def compute(self, left, right):
+        """disparity in pixels of a rectified pair"""
+
+        if left.ndim == 3:
+            left = cv.cvtColor(left, cv.COLOR_BGR2GRAY)
+            right = cv.cvtColor(right, cv.COLOR_BGR2GRAY)
+        return self.matcher.compute(left, right).astype(np.float32) / 16.0
+
+    def image(self, left, right):
+        """disparity of a rectified pair scaled to 0..255 for display or video"""
+
+        disparity = self.compute(left, right)
+        scaled = (disparity - self.min_disparity) * (255 / self.num_disparities)
+        return np.clip(scaled, 0, 255).astype(np.uint8)
+
+    def __repr__(self):
+        return (
+            f"DisparityMapper(min_disparity={self.min_disparity}, "
+            f"num_disparities={self.num_disparities})"
+        )
@@ -1,8 +1,11 @@
 import logging
+import queue
 import sys
 import time
+from threading import Thread
 from typing import Tuple
 
+import cv2 as cv
 from rakali.video.reader import VideoStream
 
 logger = logging.getLogger(__name__)
@@ -96,3 +99,107 @@ class StereoCamera:
         )
 
         return frame.is_good(), frame
+
+
+class StereoFile:
+    """
+    A recorded stereo pair, read in lock step so frame n of the left eye always
+    comes with frame n of the right eye, as fast as they can be decoded. The
+    two files are decoded concurrently. Without a right source the left one is
+    taken to be a side by side recording, as written by
+    VideoWriter.stereo_write, and split down the middle.
+
+    StereoCamera reads each eye at its own pace, which is what live feeds need
+    but lets recordings drift apart.
+    """
+
+    def __init__(self, left_src: str, right_src: str = None, prefetch=8):
+        self.side_by_side = right_src is None
+        sources = (left_src,) if self.side_by_side else (left_src, right_src)
+        self.streams = [cv.VideoCapture(str(source)) for source in sources]
+        for stream, source in zip(self.streams, sources):
+            if not stream.isOpened():
+                logger.error(f"Cannot open {source}")
+        self.fps = self.streams[0].get(cv.CAP_PROP_FPS)
+        self.width = int(self.streams[0].get(cv.CAP_PROP_FRAME_WIDTH))
+        if self.side_by_side:
+            self.width //= 2
+        self.height = int(self.streams[0].get(cv.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = 0
+        self.stopped = False
+        self._queues = [queue.Queue(maxsize=prefetch) for _ in self.streams]
+        self._decoders = [
+            Thread(target=self._decode, args=(stream, q), daemon=True)
+            for stream, q in zip(self.streams, self._queues)
+        ]
+
+    def size(self):
+        """width, height of one eye"""
+        return self.width, self.height
+
+    def _decode(self, stream, q):
+        while not self.stopped:
+            ok, frame = stream.read()
+            frame = frame if ok else None
+            while not self.stopped:
+                try:
+                    q.put(frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if frame is None:
+                break
+        stream.release()
+
+    def start(self):
+        for decoder in self._decoders:
+            if not decoder.is_alive():
+                decoder.start()
+
+    def read(self) -> Tuple[bool, StereoFrame]:
+        """the next pair of frames, not ok once either eye runs out"""
+
+        if self.stopped:
+            return False, None
+        if self.frame_count == 0:
+            self.start()
+        frames = [q.get() for q in self._queues]
+        if any(frame is None for frame in frames):
+            if any(frame is not None for frame in frames):
+                logger.warning(f"One eye ended after {self.frame_count} frames")
+            self.stop()
+            return False, None
+        if self.side_by_side:
+            frame = frames[0]
+            left, right = frame[:, : self.width], frame[:, self.width : 2 * self.width]
+        else:
+            left, right = frames
+        self.frame_count += 1
+        # recording time of the pair
+        timestamp = (self.frame_count - 1) / self.fps if self.fps else None
+        return True, StereoFrame(left=left, right=right, timestamp=timestamp)
+
+    def frames(self):
+        """the remaining pairs of frames"""
+        while True:
+            ok, frame = self.read()
+            if not ok:
+                return
+            yield frame
+
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        """stop decoding and wait for the files to be released"""
+        self.stop()
+        for decoder in self._decoders:
+            if decoder.is_alive():
+                decoder.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -0,0 +1,272 @@
+"""
+Images larger than memory.
+
+A TiledImage lives in a memory-mapped .npy file and operations run over it a
+tile at a time, each writing a new tiled image, so only the tiles being worked
+on are held in memory however large the image is. Operations that look at
+neighbouring pixels read each tile with a halo of the pixels around it and
+keep the middle. Operations that depend on the whole image, like the median
+behind the Canny thresholds, gather a histogram over all tiles first.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Tuple
+
+import cv2 as cv
+import numpy as np
+
+from . import skeleton
+from .img import Image, _histogram, _histogram_median
+from .skeleton import Tiles
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 1024
+STRIP_ROWS = 256
+
+
+def _otsu(histogram) -> int:
+    """Otsu's threshold of a histogram, as cv.threshold with THRESH_OTSU"""
+
+    n = histogram.sum()
+    p = histogram / n
+    mu = float(np.dot(np.arange(256), p))
+    epsilon = np.finfo(np.float32).eps
+    q1 = mu1 = best = 0.0
+    threshold = 0
+    for i in range(256):
+        mu1 *= q1
+        q1 += p[i]
+        q2 = 1.0 - q1
+        if min(q1, q2) < epsilon or max(q1, q2) > 1.0 - epsilon:
+            continue
+        mu1 = (mu1 + i * p[i]) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) ** 2
+        if sigma > best:
+            best = sigma
+            threshold = i
+    return threshold
+
+
+class TiledImage:
+    """
+    An image in a memory-mapped .npy file, worked on in tiles of tile_size,
+    by as many threads as workers
+    """
+
+    def __init__(self, path, mode="r", tile_size=TILE_SIZE, workers=1):
+        self.path = Path(path)
+        self.mat = np.load(self.path, mmap_mode=mode)
+        self.tile_size = tile_size
+        self.workers = workers
+        self.tiles = Tiles(self.mat.shape, tile_size)
+
+    @classmethod
+    def create(cls, path, shape, dtype=np.uint8, tile_size=TILE_SIZE, workers=1):
+        """a new tiled image of shape, filled with zeros"""
+        np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape).flush()
+        return cls(path, mode="r+", tile_size=tile_size, workers=workers)
+
+    @classmethod
+    def from_file(cls, image_path, path, tile_size=TILE_SIZE, workers=1):
+        """
+        a tiled image at path of an image file, which has to be decoded in
+        memory once, large rasters are better converted to .npy elsewhere
+        """
+
+        mat = cv.imread(str(image_path), cv.IMREAD_UNCHANGED)
+        if mat is None:
+            raise OSError(f"Cannot read {image_path}")
+        tiled = cls.create(path, mat.shape, mat.dtype, tile_size, workers)
+        for top in range(0, mat.shape[0], STRIP_ROWS):
+            tiled.mat[top : top + STRIP_ROWS] = mat[top : top + STRIP_ROWS]
+        tiled.flush()
+        return tiled
+
+    @property
+    def shape(self):
+        return self.mat.shape
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """width, height"""
+        return self.mat.shape[1], self.mat.shape[0]
+
+    def region(self, left, top, width, height) -> Image:
+        """part of the image, in memory"""
+        return Image(self.mat[top : top + height, left : left + width], copy=True)
+
+    def _run(self, work, tiles):
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                return list(pool.map(work, tiles))
+        return [work(tile) for tile in tiles]
+
+    def map(self, operation, path, halo=0, channels=None) -> "TiledImage":
+        """
+        a new tiled image at path of operation applied to every tile, grown by
+        halo, returning 8 bit images of the given number of channels, or as
+        many as this image has
+        """
+
+        if channels is None:
+            channels = 1 if self.mat.ndim == 2 else self.mat.shape[2]
+        shape = self.mat.shape[:2] + ((channels,) if channels > 1 else ())
+        out = TiledImage.create(path, shape, np.uint8, self.tile_size, self.workers)
+        tiles = self.tiles
+
+        def work(tile):
+            top, bottom, left, right = tiles.bounds(tile, halo)
+            t, b, l, r = tiles.bounds(tile)
+            window = np.ascontiguousarray(self.mat[top:bottom, left:right])
+            result = operation(window)
+            out.mat[t:b, l:r] = result[t - top : b - top, l - left : r - left]
+
+        self._run(work, list(tiles))
+        out.flush()
+        return out
+
+    def histogram(self, operation=None):
+        """counts of the 256 values over all tiles, after operation if given"""
+
+        def work(tile):
+            top, bottom, left, right = self.tiles.bounds(tile)
+            window = np.ascontiguousarray(self.mat[top:bottom, left:right])
+            return _histogram(operation(window) if operation else window)
+
+        return sum(self._run(work, list(self.tiles)))
+
+    def grey(self, path) -> "TiledImage":
+        if self.mat.ndim == 2:
+            return self.map(lambda m: m, path)
+        return self.map(lambda m: cv.cvtColor(m, cv.COLOR_BGR2GRAY), path, channels=1)
+
+    def adjust_brightness_contrast(
+        self, path, brightness: float = 0.0, contrast: float = 0.0, beta=0
+    ) -> "TiledImage":
+        return self.map(
+            lambda m: cv.addWeighted(
+                m, 1 + float(contrast) / 100.0, m, beta, float(brightness)
+            ),
+            path,
+        )
+
+    def auto_canny(self, path, sigma=0.33, halo=16) -> "TiledImage":
+        """
+        Canny edges with thresholds around the median of the whole image,
+        edges are followed across tile borders only as far as the halo
+        """
+
+        median = _histogram_median(self.histogram())
+        lower = int(max(0, (1.0 - sigma) * median))
+        upper = int(min(255, (1.0 + sigma) * median))
+        return self.map(lambda m: cv.Canny(m, lower, upper), path, halo, channels=1)
+
+    def skeletonize(
+        self,
+        path,
+        method="morphological",
+        kernel_size=(3, 3),
+        structuring=cv.MORPH_RECT,
+        halo=64,
+    ) -> "TiledImage":
+        """
+        skeleton of the image thresholded at Otsu's threshold of the whole
+        image, shapes much thicker than the halo can differ at tile borders
+        """
+
+        def grey(m):
+            return m if m.ndim == 2 else cv.cvtColor(m, cv.COLOR_BGR2GRAY)
+
+        threshold = _otsu(self.histogram(grey))
+
+        def operation(m):
+            _, binary = cv.threshold(grey(m), threshold, 255, cv.THRESH_BINARY)
+            return skeleton.skeletonize_binary(binary, method, kernel_size, structuring)
+
+        return self.map(operation, path, halo, channels=1)
+
+    def resize(self, path, width=None, height=None) -> "TiledImage":
+        """
+        Resize preserving aspect ratio. Every output tile averages blocks of
+        its source window by a whole factor, then interpolates linearly.
+        """
+
+        w, h = self.size
+        if width is None and height is None:
+            width = w
+        if width is None:
+            size = (int(w * (height / float(h))), height)
+        else:
+            size = (width, int(h * (width / float(w))))
+        # averaged blocks of factor x factor pixels, the rest is interpolated
+        factor = max(1, int(min(w / size[0], h / size[1])))
+        shrunk = (w // factor, h // factor)
+        x_scale, y_scale = size[0] / shrunk[0], size[1] / shrunk[1]
+        # output tiles reading source windows of about tile_size
+        tile_size = max(16, int(self.tile_size * min(x_scale / factor, 1.0)))
+        tiles = Tiles(size[::-1], tile_size)
+        shape = size[::-1] + self.mat.shape[2:]
+        out = TiledImage.create(
+            path, shape, self.mat.dtype, self.tile_size, self.workers
+        )
+
+        def work(tile):
+            t, b, l, r = tiles.bounds(tile)
+            # shrunk pixels the output tile samples, with one to spare
+            left = max(int(np.floor((l + 0.5) / x_scale - 0.5)) - 1, 0)
+            right = min(int(np.ceil((r - 0.5) / x_scale - 0.5)) + 2, shrunk[0])
+            top = max(int(np.floor((t + 0.5) / y_scale - 0.5)) - 1, 0)
+            bottom = min(int(np.ceil((b - 0.5) / y_scale - 0.5)) + 2, shrunk[1])
+            window = np.ascontiguousarray(
+                self.mat[top * factor : bottom * factor, left * factor : right * factor]
+            )
+            if factor > 1:
+                window = cv.resize(
+                    window, (right - left, bottom - top), interpolation=cv.INTER_AREA
+                )
+            matrix = np.array(
+                [
+                    [1 / x_scale, 0, (l + 0.5) / x_scale - 0.5 - left],
+                    [0, 1 / y_scale, (t + 0.5) / y_scale - 0.5 - top],
+                ]
+            )
+            out.mat[t:b, l:r] = cv.warpAffine(
+                window,
+                matrix,
+                (r - l, b - t),
+                flags=cv.INTER_LINEAR + cv.WARP_INVERSE_MAP,
+                borderMode=cv.BORDER_REPLICATE,
+            )
+
+        self._run(work, list(tiles))
+        out.flush()
+        return out
+
+    def write(self, image_path):
+        """write to an image file, which the encoder holds in memory"""
+        if not cv.imwrite(str(image_path), self.mat):
+            raise OSError(f"Could not write {image_path}")
+
+    def flush(self):
+        if isinstance(self.mat, np.memmap) and self.mat.mode != "r":
+            self.mat.flush()
+
+    def close(self):
+        self.flush()
+        self.mat = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return (
+            f"TiledImage({self.path}, shape={self.shape}, "
+            f"tile_size={self.tile_size}, workers={self.workers})"
+        )
@@ -1,13 +1,16 @@
 import cv2 as cv
 
 
-def scale(img, scale):
+def scale(img, scale, out=None):
     """scale preserving aspect ratio"""
-    return resize(img, x_scale=scale, y_scale=scale)
+    return resize(img, x_scale=scale, y_scale=scale, out=out)
 
 
-def resize(img, x_scale, y_scale, optimize=True):
-    """resize image by scaling using provided factors"""
+def resize(img, x_scale, y_scale, optimize=True, out=None):
+    """
+    resize image by scaling using provided factors, into `out` when it is given
+    and of the resulting size, so a buffer can be reused from frame to frame
+    """
     interpolation = cv.INTER_LINEAR
 
     # pick an optimized scaler if asked to
@@ -20,6 +23,7 @@ def resize(img, x_scale, y_scale, optimize=True):
     return cv.resize(
         img,
         None,
+        out,
         fx=x_scale,
         fy=y_scale,
         interpolation=interpolation,
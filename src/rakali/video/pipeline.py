@@ -0,0 +1,113 @@
+"""
+Pipelined frame processing for recorded video.
+
+Frames are decoded in one thread, processed on a pool of worker threads and
+handed to the sink, usually a VideoWriter, in their original order. OpenCV
+lets go of the GIL while decoding, remapping and encoding, so the stages
+overlap and a recording is processed about as fast as its slowest stage.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# marks the end of the decoded frames
+_END = object()
+
+
+class _Failed:
+    """an exception raised while decoding, passed on to the consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class FramePipeline:
+    """
+    Runs `process` over frames on `workers` threads. At most `depth` frames are
+    decoded ahead or waiting to be written, finished frames are held in a
+    reorder buffer until every frame before them has been written.
+    """
+
+    def __init__(self, process, workers=None, depth=None):
+        self.process = process
+        self.workers = workers or os.cpu_count() or 1
+        self.depth = depth or 2 * self.workers
+        self.frames = 0
+        self.seconds = 0.0
+
+    @property
+    def fps(self):
+        return self.frames / self.seconds if self.seconds else 0.0
+
+    def _decode(self, frames, decoded, stop):
+        try:
+            for frame in frames:
+                while not stop.is_set():
+                    try:
+                        decoded.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+        except Exception as e:
+            decoded.put(_Failed(e))
+            return
+        decoded.put(_END)
+
+    def run(self, frames, sink):
+        """process all frames, calling sink with each result in order"""
+
+        decoded = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        decoder = threading.Thread(
+            target=self._decode,
+            args=(iter(frames), decoded, stop),
+            name="FrameDecoder",
+            daemon=True,
+        )
+        # futures in frame order, the oldest is written first however the
+        # others finish
+        pending = deque()
+        start = time.perf_counter()
+        decoder.start()
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="FrameWorker"
+            ) as pool:
+                while True:
+                    frame = decoded.get()
+                    if frame is _END:
+                        break
+                    if isinstance(frame, _Failed):
+                        raise frame.error
+                    pending.append(pool.submit(self.process, frame))
+                    while pending and (len(pending) >= self.depth or pending[0].done()):
+                        self._write(pending.popleft(), sink)
+                while pending:
+                    self._write(pending.popleft(), sink)
+        finally:
+            stop.set()
+            for future in pending:
+                future.cancel()
+            self.seconds += time.perf_counter() - start
+        decoder.join()
+        logger.debug(f"Processed {self.frames} frames at {self.fps:.1f} fps")
+        return self.frames
+
+    def _write(self, future, sink):
+        sink(future.result())
+        self.frames += 1
+
+    def __repr__(self):
+        return (
+            f"FramePipeline(workers={self.workers}, depth={self.depth}, "
+            f"frames={self.frames}, fps={self.fps:.1f})"
+        )
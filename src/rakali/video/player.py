@@ -5,6 +5,7 @@ import sys
 import cv2 as cv
 import imutils
 
+from ..frame import Frame
 from .reader import VideoStream
 
 
@@ -35,8 +36,13 @@ class VideoPlayer:
         cv.destroyAllWindows()
 
     def rescale(self, img):
-        """Scale the resulting video display to better fit"""
+        """
+        Scale the resulting video display to better fit, a Frame keeps its
+        scaled copy for others to use
+        """
 
+        if isinstance(img, Frame):
+            return img.scaled(self.scale)
         if self.scale != 1:
             return imutils.resize(img, width=int(img.shape[1] * self.scale))
         else:
@@ -67,5 +73,8 @@ class VideoPlayer:
 
         img = self.rescale(frame)
         if self.callback:
+            # the scaled copy of a Frame is shared and read only
+            if isinstance(frame, Frame):
+                img = img.copy()
             img = self.callback(img)
         cv.imshow(self.window_name, img)
@@ -35,6 +35,14 @@ class VideoFile:
         """Return the latest frame"""
         return self.stream.read()
 
+    def frames(self):
+        """the remaining frames, until the file runs out"""
+        while True:
+            ok, frame = self.stream.read()
+            if not ok:
+                return
+            yield frame
+
     def __enter__(self):
         return self
 